@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Буферизованная запись журнала действий (таблица logs).
+
+Database.log_action не пишет в БД сразу: запись попадает в буфер, который
+сбрасывается одной транзакцией (executemany) – как только в нём
+AUDIT_BATCH_SIZE записей или через AUDIT_FLUSH_MS после первой. Так
+/start и активация, которые сами ничего не пишут, не платят за коммит.
+Если обновление и так пишет (единица работы с изменениями), запись идёт
+тем же коммитом, что и действие, минуя буфер.
+
+Буфер ограничен AUDIT_MAX_PENDING записями, сверх этого записи
+отбрасываются и считаются. Неудачная запись повторяется с растущей
+задержкой (до RETRY_MAX_DELAY), а не ждёт следующего действия. При остановке бота (и при выходе
+интерпретатора, atexit) буфер сбрасывается.
+"""
+
+import asyncio
+import atexit
+import logging
+import time
+import weakref
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Задержка (сек) повторной записи после ошибки: первая и предельная
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+INSERT_LOG = "INSERT INTO logs (user_id, user_role, action, details, created_at) VALUES (?, ?, ?, ?, ?)"
+
+# Все буферы – для сброса при выходе
+_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all():
+    for writer in list(_writers):
+        writer.flush()
+
+
+class AuditWriter:
+    """Буфер записей журнала с пакетной записью"""
+
+    def __init__(self, database, batch_size=None, flush_ms=None, max_pending=None):
+        self.database = database
+        self.batch_size = batch_size or config.AUDIT_BATCH_SIZE
+        self.flush_delay = (config.AUDIT_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+        self.max_pending = max_pending or config.AUDIT_MAX_PENDING
+        self._pending = []
+        self._flush_handle = None
+        self._failures = 0          # ошибок записи подряд
+        # Статистика
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        _writers.add(self)
+
+    def enqueue(self, user_id, user_role, action, details=None):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Буфер журнала переполнен, отброшено записей: {self.dropped}")
+            return
+        # Время действия, а не записи в БД (UTC, как CURRENT_TIMESTAMP)
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        self._pending.append((user_id, user_role, action, details, created_at))
+        self.enqueued += 1
+        self._schedule(0 if len(self._pending) >= self.batch_size else self.flush_delay)
+
+    def _schedule(self, delay):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне цикла событий (скрипты, восстановление) – сразу
+            self.flush()
+            return
+        if self._flush_handle is not None:
+            if delay:
+                return
+            self._flush_handle.cancel()
+        # Не из обработчика: его единица работы держит свою транзакцию
+        self._flush_handle = loop.call_later(delay, self.flush)
+
+    def flush(self):
+        """Записывает накопленное одной транзакцией"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+
+        started = time.perf_counter()
+        try:
+            with self.database.get_connection() as conn:
+                conn.executemany(INSERT_LOG, pending)
+        except Exception as e:
+            # Возвращаем несохранённое в начало буфера; не поместившееся отбрасываем
+            self.errors += 1
+            logger.error(f"Ошибка записи журнала действий ({len(pending)} записей): {e}")
+            room = max(0, self.max_pending - len(self._pending))
+            self.dropped += max(0, len(pending) - room)
+            self._pending[:0] = pending[:room]
+            self._failures += 1
+            self._retry()
+            return
+
+        self._failures = 0
+        self.flushes += 1
+        self.flushed += len(pending)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def _retry(self):
+        """Планирует повтор записи после ошибки"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне цикла событий повторит следующий flush (в т.ч. atexit)
+            return
+        if not self._pending or self._flush_handle is not None:
+            return
+        delay = min(RETRY_BASE_DELAY * 2 ** (self._failures - 1), RETRY_MAX_DELAY)
+        self._flush_handle = loop.call_later(delay, self.flush)
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'errors': self.errors,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+        }
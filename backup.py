@@ -8,21 +8,29 @@
 import sqlite3
 import json
 import io
+import time
 from datetime import datetime
 
-from config import config
+from database import db
+import metrics
+import tracing
+
+# Системная таблица и служебные данные сессий не попадают в бэкап
+# и не затираются при восстановлении
+SKIP_TABLES = {'sqlite_sequence', 'persistence', 'callback_tokens', 'outbox'}
 
 class SimpleBackup:
     """Класс для создания простых бэкапов"""
     
-    def __init__(self, db_path):
-        self.db_path = db_path
+    def __init__(self, database):
+        self.database = database
     
     def create_backup_json(self):
         """
         Создает JSON-дамп базы данных и возвращает как строку
         """
-        conn = sqlite3.connect(self.db_path)
+        started = time.perf_counter()
+        conn = self.database.connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -32,7 +40,7 @@ class SimpleBackup:
         
         data = {}
         for table in tables:
-            if table != 'sqlite_sequence':  # Пропускаем системную таблицу
+            if table not in SKIP_TABLES:
                 cursor.execute(f"SELECT * FROM {table}")
                 rows = cursor.fetchall()
                 data[table] = [dict(row) for row in rows]
@@ -40,13 +48,16 @@ class SimpleBackup:
         conn.close()
         
         # Преобразуем в JSON
-        return json.dumps(data, ensure_ascii=False, indent=2, default=str)
+        result = json.dumps(data, ensure_ascii=False, indent=2, default=str)
+        metrics.record_backup(time.perf_counter() - started, len(result.encode('utf-8')))
+        tracing.record_span('backup', 'create_backup_json', started, time.perf_counter() - started)
+        return result
     
     def create_backup_sql(self):
         """
         Создает SQL-дамп базы данных
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self.database.connect()
         
         # Получаем дамп в памяти
         with io.StringIO() as f:
@@ -57,6 +68,45 @@ class SimpleBackup:
         conn.close()
         return sql_dump
     
+    def restore_json(self, data):
+        """
+        Заменяет данные таблиц содержимым JSON-бэкапа; возвращает число
+        восстановленных записей. Таблицы SKIP_TABLES не трогаются: в т.ч.
+        outbox – уведомления, зафиксированные до восстановления, должны дойти,
+        а строки outbox из старых бэкапов второй раз не отправляются.
+        """
+        conn = self.database.connect()
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        
+        # Очищаем таблицы
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        tables = cursor.fetchall()
+        for table in tables:
+            table_name = table[0]
+            if table_name not in SKIP_TABLES:
+                cursor.execute(f"DELETE FROM {table_name}")
+        
+        # Вставляем данные из бэкапа
+        restored = 0
+        for table_name, rows in data.items():
+            if table_name not in SKIP_TABLES and rows:
+                columns = list(rows[0].keys())
+                placeholders = ','.join(['?'] * len(columns))
+                column_names = ','.join(columns)
+                for row in rows:
+                    values = [row[col] for col in columns]
+                    cursor.execute(
+                        f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})",
+                        values
+                    )
+                    restored += 1
+        
+        cursor.execute("PRAGMA foreign_keys = ON")
+        conn.commit()
+        conn.close()
+        return restored
+    
     def get_backup_filename(self, action):
         """
         Генерирует имя файла для бэкапа
@@ -65,4 +115,4 @@ class SimpleBackup:
         return f"backup_{timestamp}_{action}.json"
 
 # Глобальный экземпляр
-backup = SimpleBackup(config.DATABASE_PATH)
+backup = SimpleBackup(db)
@@ -5,6 +5,7 @@
 Декоратор для автоматической отправки бэкапов при действиях
 """
 
+from contextvars import ContextVar
 from functools import wraps
 import io
 from datetime import datetime
@@ -14,6 +15,15 @@ from telegram import Update
 from backup import backup
 from database import db
 from config import config
+from outbound import BULK_ARGS
+import tracing
+
+# Действие не выполнено (опередили, нечего менять) – ни журнала, ни бэкапа
+_skipped = ContextVar('backup_skipped', default=False)
+
+def skip_backup():
+    """Вызывается обработчиком под send_backup_to_admin, если ничего не изменилось"""
+    _skipped.set(True)
 
 def send_backup_to_admin(action_description):
     """
@@ -23,51 +33,62 @@ def send_backup_to_admin(action_description):
         @wraps(func)
         async def wrapper(update, context, *args, **kwargs):
             # Выполняем основную функцию
-            result = await func(update, context, *args, **kwargs)
-            
+            token = _skipped.set(False)
             try:
-                # Получаем информацию о пользователе
-                if update.effective_user:
-                    user = update.effective_user
-                    user_id = user.id
-                    user_name = user.full_name or user.username or str(user_id)
+                result = await func(update, context, *args, **kwargs)
+                skipped = _skipped.get()
+            finally:
+                _skipped.reset(token)
+            if skipped:
+                return result
+            
+            # Отрезок трассы: сборка JSON и отправка админам
+            with tracing.span('backup', action_description):
+                try:
+                    # Получаем информацию о пользователе
+                    if update.effective_user:
+                        user = update.effective_user
+                        user_id = user.id
+                        user_name = user.full_name or user.username or str(user_id)
                     
-                    # Определяем роль
-                    if user_id in config.ADMIN_IDS:
-                        role = "администратор"
-                    else:
-                        role = "продавец"
+                        # Определяем роль
+                        if user_id in config.ADMIN_IDS:
+                            role = "администратор"
+                        else:
+                            role = "продавец"
                     
-                    # Создаем JSON-бэкап
-                    json_data = backup.create_backup_json()
-                    filename = backup.get_backup_filename(action_description)
+                        # Логируем действие – тем же коммитом, что и само действие
+                        db.log_action(
+                            user_id=user_id,
+                            user_role=role,
+                            action=action_description,
+                            details=f"Бэкап отправлен админу"
+                        )
+                        db.commit_unit_of_work()
                     
-                    # Отправляем каждому админу
-                    for admin_id in config.ADMIN_IDS:
-                        try:
-                            # Создаем файл в памяти и отправляем
-                            await context.bot.send_document(
-                                chat_id=admin_id,
-                                document=io.BytesIO(json_data.encode('utf-8')),
-                                filename=filename,
-                                caption=f"🔄 Бэкап после действия: {action_description}\n"
-                                       f"👤 Пользователь: {user_name} (ID: {user_id})\n"
-                                       f"👑 Роль: {role}\n"
-                                       f"📅 Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
-                            )
-                        except Exception as e:
-                            print(f"Не удалось отправить бэкап админу {admin_id}: {e}")
+                        # Создаем JSON-бэкап
+                        json_data = backup.create_backup_json()
+                        filename = backup.get_backup_filename(action_description)
                     
-                    # Логируем действие
-                    db.log_action(
-                        user_id=user_id,
-                        user_role=role,
-                        action=action_description,
-                        details=f"Бэкап отправлен админу"
-                    )
+                        # Отправляем каждому админу
+                        for admin_id in config.ADMIN_IDS:
+                            try:
+                                # Создаем файл в памяти и отправляем
+                                await context.bot.send_document(
+                                    chat_id=admin_id,
+                                    document=io.BytesIO(json_data.encode('utf-8')),
+                                    filename=filename,
+                                    caption=f"🔄 Бэкап после действия: {action_description}\n"
+                                           f"👤 Пользователь: {user_name} (ID: {user_id})\n"
+                                           f"👑 Роль: {role}\n"
+                                           f"📅 Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}",
+                                    rate_limit_args=BULK_ARGS
+                                )
+                            except Exception as e:
+                                print(f"Не удалось отправить бэкап админу {admin_id}: {e}")
                     
-            except Exception as e:
-                print(f"Ошибка при создании бэкапа: {e}")
+                except Exception as e:
+                    print(f"Ошибка при создании бэкапа: {e}")
             
             return result
         return wrapper
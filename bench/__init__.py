@@ -0,0 +1,3 @@
+"""
+Локальные бенчмарки бота. Запуск: python -m bench.<модуль>
+"""
@@ -0,0 +1,628 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Локальный сервер Bot API для нагрузочных тестов без сети.
+
+Реализует методы, которыми пользуется бот: getMe, sendMessage,
+editMessageText, sendDocument, answerCallbackQuery, getFile (и скачивание
+файла), getUpdates, setWebhook, deleteWebhook, getWebhookInfo. Бот
+запускается без изменений, достаточно направить его сюда:
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot TELEGRAM_FILE_URL=http://127.0.0.1:8081/file/bot python main.py
+
+(с RENDER=1 и RENDER_EXTERNAL_URL=http://127.0.0.1:10000 – в режиме
+вебхуков: сервер сам отправляет обновления на адрес из setWebhook).
+
+Настраиваются задержка ответа, доля ошибок 502, доля ответов 429 с
+retry_after и флуд-контроль как у Telegram (сообщений в секунду на чат и
+на бота) – так проверяются ограничитель исходящих запросов, повторы и
+отправка бэкапов.
+
+Обновления подаются через управляющие запросы:
+    POST /control/message   {"user_id": 5, "text": "/start"}
+    POST /control/callback  {"user_id": 5, "data": "confirm_sale"}  – кнопка из последних сообщений чата
+    POST /control/updates   обновление или список обновлений как есть
+    POST /control/load      {"users": 100, "rate": 20, "seconds": 30, "texts": ["📊 Остатки"]}
+    GET  /control/chats/5   последние сообщения чата с клавиатурами
+    GET  /control/stats     вызовы, ошибки, 429, пик сообщений в секунду, байты файлов
+    POST /control/settings  {"latency_ms": 100, "retry_after_rate": 0.05, ...}
+
+    python -m bench.fake_bot_api [--port 8081] [--latency-ms 50] [--error-rate 0.01] [--retry-after-rate 0.01] [--flood]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import secrets
+import sys
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qsl
+
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from outbound import CHAT_BURST, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 10, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot',
+            'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+
+# Поля, которые приходят строкой и не разбираются как JSON
+STRING_FIELDS = {'text', 'caption', 'callback_query_id', 'url', 'file_id', 'parse_mode', 'secret_token'}
+
+# Методы, на которые распространяется флуд-контроль
+FLOOD_METHODS = {'sendMessage', 'sendDocument', 'editMessageText'}
+
+# Методы без результата, которые просто подтверждаются
+TRUE_METHODS = {'deleteMessage', 'sendChatAction', 'setMyCommands', 'close', 'logOut'}
+
+# Хранилище файлов из sendDocument (для getFile и скачивания)
+MAX_FILES_BYTES = 200 * 1024 * 1024
+
+CHAT_HISTORY = 50
+WEBHOOK_RETRY = 1.0
+
+
+class Settings:
+    """Поведение сервера; меняется на ходу через /control/settings"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, retry_after_rate=0.0,
+                 retry_after=3, flood=False, chat_rate=1.0, global_rate=30.0, webhook_connections=40):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.flood = flood
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.webhook_connections = webhook_connections
+
+    def update(self, values):
+        for key, value in values.items():
+            if not hasattr(self, key):
+                raise ValueError(f"неизвестная настройка {key}")
+            setattr(self, key, type(getattr(self, key))(value))
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class ApiError(Exception):
+    def __init__(self, code, description, retry_after=None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+    def payload(self):
+        data = {'ok': False, 'error_code': self.code, 'description': self.description}
+        if self.retry_after is not None:
+            data['parameters'] = {'retry_after': self.retry_after}
+        return data
+
+
+def _chat(chat_id):
+    return {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group', 'first_name': f'user{chat_id}'}
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+
+
+def _public(message):
+    """Сообщение как его вернёт Telegram: в Message бывает только inline-клавиатура"""
+    markup = message.get('reply_markup')
+    if markup is None or 'inline_keyboard' in markup:
+        return message
+    return {key: value for key, value in message.items() if key != 'reply_markup'}
+
+
+def _take(bucket):
+    """0, если токен есть; иначе сколько ждать (токен не расходуется)"""
+    wait = bucket.reserve()
+    if wait:
+        bucket.tokens += 1
+    return wait
+
+
+class FakeBotAPI:
+    """Состояние сервера: сообщения, файлы, очередь обновлений, вебхук и статистика"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.chats = defaultdict(OrderedDict)   # chat_id -> message_id -> сообщение
+        self.message_ids = defaultdict(int)
+        self.files = OrderedDict()              # file_id -> (file_path, имя, bytes)
+        self.files_bytes = 0
+        self.updates = deque()
+        self.update_ids = itertools.count(1)
+        self.updates_changed = asyncio.Event()
+        self.webhook = None                     # {'url', 'secret_token', 'max_connections'}
+        self.webhook_workers = []
+        self.load_tasks = []
+        self.reset_stats()
+        self._chat_buckets = {}
+        self._global_bucket = None
+
+    def reset_stats(self):
+        self.calls = Counter()
+        self.injected = Counter()               # error, retry_after
+        self.flood_limited = Counter()          # chat, global
+        self.upload_bytes = 0
+        self.download_bytes = 0
+        self.sent_times = deque()
+        self.peak_per_second = 0
+        self.webhook_stats = Counter()
+        self.started = time.time()
+
+    # ---- Флуд-контроль ----
+    def _check_flood(self, method, params):
+        if method in FLOOD_METHODS:
+            now = time.monotonic()
+            self.sent_times.append(now)
+            while self.sent_times and self.sent_times[0] < now - 1:
+                self.sent_times.popleft()
+            self.peak_per_second = max(self.peak_per_second, len(self.sent_times))
+        if not self.settings.flood or method not in FLOOD_METHODS:
+            return
+        if self._global_bucket is None or self._global_bucket.rate != self.settings.global_rate:
+            self._global_bucket = TokenBucket(self.settings.global_rate, self.settings.global_rate)
+        chat_id = params.get('chat_id')
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None or bucket.rate != self.settings.chat_rate:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.settings.chat_rate, CHAT_BURST)
+        wait = _take(bucket)
+        kind = 'chat'
+        if not wait:
+            wait = _take(self._global_bucket)
+            kind = 'global'
+            if wait:
+                bucket.tokens += 1
+        if wait:
+            self.flood_limited[kind] += 1
+            retry_after = max(1, round(wait + 0.5))
+            raise ApiError(429, f"Too Many Requests: retry after {retry_after}", retry_after)
+
+    def _inject(self, method):
+        if method in ('getUpdates', 'getMe'):
+            return
+        roll = random.random()
+        if roll < self.settings.retry_after_rate:
+            self.injected['retry_after'] += 1
+            raise ApiError(429, f"Too Many Requests: retry after {self.settings.retry_after}",
+                           self.settings.retry_after)
+        if roll < self.settings.retry_after_rate + self.settings.error_rate:
+            self.injected['error'] += 1
+            raise ApiError(502, "Bad Gateway")
+
+    # ---- Сообщения и файлы ----
+    def _store(self, chat_id, message):
+        chat = self.chats[chat_id]
+        chat[message['message_id']] = message
+        chat.move_to_end(message['message_id'])
+        while len(chat) > CHAT_HISTORY:
+            chat.popitem(last=False)
+
+    def _new_message(self, chat_id, **fields):
+        self.message_ids[chat_id] += 1
+        message = {'message_id': self.message_ids[chat_id], 'date': int(time.time()),
+                   'chat': _chat(chat_id), 'from': BOT_USER, **fields}
+        self._store(chat_id, message)
+        return _public(message)
+
+    def _save_file(self, filename, content):
+        file_id = secrets.token_hex(12)
+        path = f"documents/{file_id}_{filename}"
+        self.files[file_id] = (path, filename, content)
+        self.files_bytes += len(content)
+        while self.files_bytes > MAX_FILES_BYTES and len(self.files) > 1:
+            _, (_, _, old) = self.files.popitem(last=False)
+            self.files_bytes -= len(old)
+        return file_id, path
+
+    def file_by_path(self, path):
+        for stored_path, _, content in self.files.values():
+            if stored_path == path:
+                return content
+        return None
+
+    # ---- Методы Bot API ----
+    async def call(self, method, params, files):
+        self.calls[method] += 1
+        delay = self.settings.latency_ms + random.uniform(0, self.settings.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        self._inject(method)
+        self._check_flood(method, params)
+        handler = getattr(self, f"m_{method}", None)
+        if handler is not None:
+            return await handler(params, files)
+        if method in TRUE_METHODS:
+            return True
+        raise ApiError(404, "Not Found")
+
+    async def m_getMe(self, params, files):
+        return BOT_USER
+
+    async def m_sendMessage(self, params, files):
+        fields = {'text': params['text']}
+        if params.get('reply_markup'):
+            fields['reply_markup'] = params['reply_markup']
+        return self._new_message(int(params['chat_id']), **fields)
+
+    async def m_editMessageText(self, params, files):
+        chat_id = int(params['chat_id'])
+        message_id = int(params['message_id'])
+        message = self.chats[chat_id].get(message_id)
+        markup = params.get('reply_markup')
+        if message is not None and message.get('text') == params['text'] and message.get('reply_markup') == markup:
+            raise ApiError(400, "Bad Request: message is not modified: specified new message content "
+                                "and reply markup are exactly the same as a current content and reply markup of the message")
+        message = dict(message or {'message_id': message_id, 'date': int(time.time()),
+                                   'chat': _chat(chat_id), 'from': BOT_USER},
+                       text=params['text'], edit_date=int(time.time()))
+        message.pop('reply_markup', None)
+        if markup:
+            message['reply_markup'] = markup
+        self._store(chat_id, message)
+        return _public(message)
+
+    async def m_sendDocument(self, params, files):
+        if 'document' in files:
+            filename, content = files['document']
+            file_id, _ = self._save_file(filename, content)
+            self.upload_bytes += len(content)
+        else:
+            # Повторная отправка по file_id
+            file_id = params['document']
+            if file_id not in self.files:
+                raise ApiError(400, "Bad Request: wrong file identifier/HTTP URL specified")
+            _, filename, content = self.files[file_id]
+        document = {'file_id': file_id, 'file_unique_id': file_id[:16],
+                    'file_name': filename, 'file_size': len(content)}
+        fields = {'document': document}
+        if params.get('caption'):
+            fields['caption'] = params['caption']
+        return self._new_message(int(params['chat_id']), **fields)
+
+    async def m_answerCallbackQuery(self, params, files):
+        return True
+
+    async def m_getFile(self, params, files):
+        stored = self.files.get(params['file_id'])
+        if stored is None:
+            raise ApiError(400, "Bad Request: invalid file_id")
+        path, _, content = stored
+        return {'file_id': params['file_id'], 'file_unique_id': params['file_id'][:16],
+                'file_size': len(content), 'file_path': path}
+
+    async def m_getUpdates(self, params, files):
+        if self.webhook is not None:
+            raise ApiError(409, "Conflict: can't use getUpdates method while webhook is active; "
+                                "use deleteWebhook to delete the webhook first")
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        deadline = time.monotonic() + timeout
+        while not self.updates and time.monotonic() < deadline:
+            self.updates_changed.clear()
+            try:
+                await asyncio.wait_for(self.updates_changed.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+        return list(itertools.islice(self.updates, limit))
+
+    async def m_setWebhook(self, params, files):
+        await self.stop_webhook()
+        if params.get('drop_pending_updates'):
+            self.updates.clear()
+        if not params.get('url'):
+            return True
+        self.webhook = {
+            'url': params['url'],
+            'secret_token': params.get('secret_token'),
+            'max_connections': min(int(params.get('max_connections') or 40), self.settings.webhook_connections),
+        }
+        self.webhook_workers = [
+            asyncio.create_task(self._webhook_worker()) for _ in range(self.webhook['max_connections'])
+        ]
+        logger.info(f"Вебхук: {self.webhook['url']} ({self.webhook['max_connections']} соединений)")
+        return True
+
+    async def m_deleteWebhook(self, params, files):
+        await self.stop_webhook()
+        if params.get('drop_pending_updates'):
+            self.updates.clear()
+        return True
+
+    async def m_getWebhookInfo(self, params, files):
+        info = {'url': self.webhook['url'] if self.webhook else '', 'has_custom_certificate': False,
+                'pending_update_count': len(self.updates)}
+        if self.webhook:
+            info['max_connections'] = self.webhook['max_connections']
+        return info
+
+    # ---- Обновления ----
+    def add_update(self, update):
+        update = dict(update)
+        update.setdefault('update_id', next(self.update_ids))
+        self.updates.append(update)
+        self.updates_changed.set()
+        return update['update_id']
+
+    def message_update(self, user_id, text, chat_id=None):
+        chat_id = chat_id or user_id
+        self.message_ids[chat_id] += 1
+        message = {'message_id': self.message_ids[chat_id], 'date': int(time.time()),
+                   'chat': _chat(chat_id), 'from': _user(user_id), 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'message': message}
+
+    def callback_update(self, user_id, data, message_id=None, chat_id=None):
+        """Нажатие кнопки: data – начало callback_data кнопки из последних сообщений чата"""
+        chat_id = chat_id or user_id
+        candidates = reversed(self.chats[chat_id].values())
+        if message_id is not None:
+            candidates = [self.chats[chat_id][message_id]] if message_id in self.chats[chat_id] else []
+        for message in candidates:
+            for row in (message.get('reply_markup') or {}).get('inline_keyboard', []):
+                for button in row:
+                    if button.get('callback_data', '').startswith(data):
+                        return {'callback_query': {
+                            'id': secrets.token_hex(8),
+                            'from': _user(user_id),
+                            'chat_instance': str(chat_id),
+                            'data': button['callback_data'],
+                            'message': _public(message),
+                        }}
+        raise ValueError(f"в чате {chat_id} нет кнопки {data}")
+
+    async def _webhook_worker(self):
+        async with httpx.AsyncClient(timeout=60) as client:
+            while True:
+                while not self.updates:
+                    self.updates_changed.clear()
+                    await self.updates_changed.wait()
+                update = self.updates.popleft()
+                headers = {}
+                if self.webhook.get('secret_token'):
+                    headers['X-Telegram-Bot-Api-Secret-Token'] = self.webhook['secret_token']
+                started = time.perf_counter()
+                try:
+                    response = await client.post(self.webhook['url'], json=update, headers=headers)
+                    ok = response.status_code < 300
+                    error = None if ok else f"HTTP {response.status_code}"
+                except httpx.HTTPError as e:
+                    ok, error = False, type(e).__name__
+                if ok:
+                    self.webhook_stats['delivered'] += 1
+                    self.webhook_stats['delivery_ms'] += round((time.perf_counter() - started) * 1000)
+                    continue
+                # Как Telegram: обновление остаётся в очереди и доставляется позже
+                self.webhook_stats['failed'] += 1
+                self.webhook_stats[f"failed {error}"] += 1
+                self.updates.appendleft(update)
+                await asyncio.sleep(WEBHOOK_RETRY)
+
+    async def stop_webhook(self):
+        for task in self.webhook_workers:
+            task.cancel()
+        await asyncio.gather(*self.webhook_workers, return_exceptions=True)
+        self.webhook_workers = []
+        self.webhook = None
+
+    async def run_load(self, users, rate, seconds, texts, first_user_id):
+        """Сообщения от users пользователей по кругу с частотой rate в секунду"""
+        interval = 1 / rate
+        deadline = time.monotonic() + seconds
+        for number in itertools.cycle(range(users)):
+            if time.monotonic() >= deadline:
+                break
+            self.add_update(self.message_update(first_user_id + number, random.choice(texts)))
+            self.injected['load_updates'] += 1
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        delivered = self.webhook_stats.get('delivered', 0)
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'settings': self.settings.to_dict(),
+            'calls': dict(self.calls),
+            'injected': dict(self.injected),
+            'flood_limited': dict(self.flood_limited),
+            'peak_messages_per_second': self.peak_per_second,
+            'upload_bytes': self.upload_bytes,
+            'download_bytes': self.download_bytes,
+            'pending_updates': len(self.updates),
+            'webhook': dict(
+                self.webhook_stats,
+                url=self.webhook['url'] if self.webhook else None,
+                avg_delivery_ms=round(self.webhook_stats.get('delivery_ms', 0) / delivered, 1) if delivered else None,
+            ),
+        }
+
+
+# ---- HTTP ----
+
+def _decode_fields(fields):
+    params = {}
+    for key, value in fields.items():
+        if key in STRING_FIELDS:
+            params[key] = value
+            continue
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def parse_multipart(body, content_type):
+    """multipart/form-data без python-multipart: поля и файлы {имя: (filename, bytes)}"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body
+    )
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        payload = part.get_payload(decode=True) or b''
+        filename = part.get_filename()
+        if filename is not None:
+            files[name] = (filename, payload)
+        else:
+            fields[name] = payload.decode('utf-8')
+    return fields, files
+
+
+async def read_params(request):
+    fields = dict(request.query_params)
+    files = {}
+    content_type = request.headers.get('content-type', '')
+    body = await request.body()
+    if content_type.startswith('application/json') and body:
+        return {**fields, **json.loads(body)}, files
+    if content_type.startswith('multipart/form-data'):
+        form, files = parse_multipart(body, content_type)
+        fields.update(form)
+    elif body:
+        fields.update(parse_qsl(body.decode('utf-8'), keep_blank_values=True))
+    return _decode_fields(fields), files
+
+
+def create_app(api):
+    async def bot_method(request):
+        method = request.path_params['method']
+        try:
+            params, files = await read_params(request)
+            result = await api.call(method, params, files)
+        except ApiError as e:
+            return JSONResponse(e.payload(), status_code=e.code)
+        except (KeyError, ValueError) as e:
+            return JSONResponse({'ok': False, 'error_code': 400, 'description': f"Bad Request: {e}"},
+                                status_code=400)
+        return JSONResponse({'ok': True, 'result': result})
+
+    async def file_download(request):
+        content = api.file_by_path(request.path_params['path'])
+        if content is None:
+            return Response(status_code=404)
+        api.download_bytes += len(content)
+        return Response(content, media_type='application/octet-stream')
+
+    async def control_updates(request):
+        body = await request.json()
+        ids = [api.add_update(update) for update in (body if isinstance(body, list) else [body])]
+        return JSONResponse({'update_ids': ids})
+
+    async def control_message(request):
+        body = await request.json()
+        update = api.message_update(int(body['user_id']), body['text'], body.get('chat_id'))
+        return JSONResponse({'update_id': api.add_update(update)})
+
+    async def control_callback(request):
+        body = await request.json()
+        try:
+            update = api.callback_update(int(body['user_id']), body['data'],
+                                         body.get('message_id'), body.get('chat_id'))
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=404)
+        return JSONResponse({'update_id': api.add_update(update),
+                             'data': update['callback_query']['data']})
+
+    async def control_load(request):
+        body = await request.json()
+        task = asyncio.create_task(api.run_load(
+            users=int(body.get('users', 100)),
+            rate=float(body.get('rate', 10)),
+            seconds=float(body.get('seconds', 30)),
+            texts=body.get('texts') or ['/start'],
+            first_user_id=int(body.get('first_user_id', 700_000_000)),
+        ))
+        api.load_tasks = [t for t in api.load_tasks if not t.done()] + [task]
+        return JSONResponse({'started': True})
+
+    async def control_chat(request):
+        chat_id = int(request.path_params['chat_id'])
+        return JSONResponse(list(api.chats[chat_id].values()))
+
+    async def control_stats(request):
+        return JSONResponse(api.stats())
+
+    async def control_settings(request):
+        try:
+            api.settings.update(await request.json())
+        except (ValueError, TypeError) as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        return JSONResponse(api.settings.to_dict())
+
+    async def control_reset(request):
+        api.reset_stats()
+        return JSONResponse({'reset': True})
+
+    async def shutdown():
+        for task in api.load_tasks:
+            task.cancel()
+        await api.stop_webhook()
+
+    return Starlette(
+        routes=[
+            Route('/bot{token}/{method}', bot_method, methods=['GET', 'POST']),
+            Route('/file/bot{token}/{path:path}', file_download, methods=['GET']),
+            Route('/control/updates', control_updates, methods=['POST']),
+            Route('/control/message', control_message, methods=['POST']),
+            Route('/control/callback', control_callback, methods=['POST']),
+            Route('/control/load', control_load, methods=['POST']),
+            Route('/control/chats/{chat_id}', control_chat, methods=['GET']),
+            Route('/control/stats', control_stats, methods=['GET']),
+            Route('/control/settings', control_settings, methods=['POST']),
+            Route('/control/reset', control_reset, methods=['POST']),
+        ],
+        on_shutdown=[shutdown],
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Локальный сервер Bot API для нагрузочных тестов")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="задержка каждого ответа")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="случайная добавка к задержке (до)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 502 Bad Gateway")
+    parser.add_argument('--retry-after-rate', type=float, default=0.0, help="доля ответов 429 с retry_after")
+    parser.add_argument('--retry-after', type=int, default=3, help="retry_after в этих ответах, сек")
+    parser.add_argument('--flood', action='store_true', help="флуд-контроль как у Telegram")
+    parser.add_argument('--chat-rate', type=float, default=1.0, help="сообщений в секунду на чат при --flood")
+    parser.add_argument('--global-rate', type=float, default=30.0, help="сообщений в секунду на бота при --flood")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    settings = Settings(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        retry_after_rate=args.retry_after_rate, retry_after=args.retry_after, flood=args.flood,
+        chat_rate=args.chat_rate, global_rate=args.global_rate,
+    )
+    api = FakeBotAPI(settings)
+    uvicorn.run(create_app(api), host=args.host, port=args.port, log_level='warning')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,591 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Генератор синтетических данных для схемы database.py.
+
+Создаёт новую базу (схема – Database.init_db) и заполняет её продавцами,
+товарами, заявками на поставку с позициями, продажами, запросами на
+выплату, заявками на пополнение склада Р и логами:
+- продавцы и товары неравномерны (распределение Ципфа): несколько
+  крупных продавцов дают большую часть оборота;
+- дни неравномерны: выходные, летний сезон и рост со временем;
+- остатки (seller_products), долг (seller_debt) и сумма к переводу
+  (seller_pending) считаются по тем же правилам, что в обработчиках:
+  поставка увеличивает остаток и долг, продажа уменьшает остаток и долг
+  и увеличивает сумму к переводу, подтверждённая выплата уменьшает долг
+  и сумму к переводу, пополнение склада Р – остаток и долг склада Р,
+  поставка продавцу списывается с остатка склада Р.
+
+Всё пишется через executemany пачками в одной транзакции, генератор
+случайных чисел с фиксированным seed, а период данных заканчивается
+фиксированной датой (--end-date) – результат воспроизводим.
+
+    python -m bench.generate_dataset out.db [--scale N] [--seed S] [--end-date ГГГГ-ММ-ДД] [--check]
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from math import pi, sin
+
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+# Глобальный db из database.py не должен трогать рабочую базу
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.gettempdir(), 'bench_global.db'))
+
+from database import Database
+
+# Размеры при --scale 1 (~0.4 млн строк); --scale 25 – около 10 млн
+BASE_SIZES = {
+    'sellers': 100,
+    'products': 30,
+    'orders': 20_000,
+    'sales': 200_000,
+    'payments': 4_000,
+    'restocks': 1_000,
+    'logs': 100_000,
+}
+
+# Последний день данных по умолчанию – фиксированный, не сегодняшний:
+# одна и та же команда в разные дни даёт одну и ту же базу
+DEFAULT_END_DATE = date(2025, 12, 31)
+
+CENTRAL_CODE = 'Р'
+ADMIN_TELEGRAM_ID = 1
+
+# Строк в одной пачке executemany
+CHUNK = 50_000
+
+# Перекос продавцов и товаров (показатель степени в распределении Ципфа)
+SELLER_SKEW = 1.1
+PRODUCT_SKEW = 0.8
+
+ORDER_STATUSES = ('completed', 'shipped', 'new', 'cancelled')
+ORDER_STATUS_WEIGHTS = (85, 5, 7, 3)
+RESTOCK_STATUSES = ('completed', 'pending', 'cancelled')
+RESTOCK_STATUS_WEIGHTS = (80, 15, 5)
+
+# Количество в одной продаже (упаковок)
+SALE_QUANTITIES = (1, 1, 1, 2, 2, 2, 3, 3, 4, 5, 6, 8)
+AVG_SALE_QUANTITY = sum(SALE_QUANTITIES) / len(SALE_QUANTITIES)
+# Поставки с запасом относительно ожидаемых продаж
+SUPPLY_MARGIN = 1.3
+
+LOG_ACTIONS = (
+    ('seller', 'start', None),
+    ('seller', 'продажа товара', 'Бэкап отправлен админу'),
+    ('seller', 'создание заявки на поставку', 'Бэкап отправлен админу'),
+    ('seller', 'подтверждение получения поставки', 'Бэкап отправлен админу'),
+    ('seller', 'запрос выплаты', 'Бэкап отправлен админу'),
+    ('admin', 'подтверждение отгрузки', 'Бэкап отправлен админу'),
+    ('admin', 'подтверждение выплаты', 'Бэкап отправлен админу'),
+    ('admin', 'manual_backup', None),
+)
+LOG_ACTION_WEIGHTS = (10, 50, 10, 8, 4, 8, 4, 1)
+
+
+def zipf_weights(count, skew, rng):
+    weights = [1 / (rank + 1) ** skew for rank in range(count)]
+    rng.shuffle(weights)
+    return weights
+
+
+def day_weights(days, end):
+    """Вес каждого дня: день недели, сезон (пик летом) и рост со временем"""
+    weekday_factor = (0.8, 0.9, 0.95, 1.0, 1.3, 1.4, 1.2)
+    weights = []
+    for index in range(days):
+        day = end - timedelta(days=days - 1 - index)
+        season = 1 + 0.35 * sin(2 * pi * (day.timetuple().tm_yday - 100) / 365)
+        trend = 0.7 + 0.6 * index / max(1, days - 1)
+        weights.append(weekday_factor[day.weekday()] * season * trend)
+    return weights
+
+
+class DatasetGenerator:
+    def __init__(self, conn, sizes, days, seed, end_date=DEFAULT_END_DATE):
+        self.conn = conn
+        self.sizes = sizes
+        self.rng = random.Random(seed)
+        self.counts = defaultdict(int)
+
+        end = end_date
+        self.dates = [end - timedelta(days=days - 1 - index) for index in range(days)]
+        self.day_strings = [day.isoformat() for day in self.dates]
+        self.day_codes = [day.strftime('%d%m') for day in self.dates]
+        self.day_cum = list(itertools.accumulate(day_weights(days, end)))
+        self.day_range = range(days)
+        # Время суток строками, чтобы не форматировать на каждую строку
+        self.times = [f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}" for second in range(86400)]
+        self.random = self.rng.random
+        # Фиксированные отметки для справочников и балансов: без CURRENT_TIMESTAMP
+        # база зависит только от seed и end_date
+        self.first_stamp = f"{self.day_strings[0]} 09:00:00"
+        self.last_stamp = f"{self.day_strings[-1]} 22:00:00"
+
+        # Номера документов: счётчик на (префикс, продавец, ддмм), как в обработчиках
+        self.numbers = defaultdict(int)
+
+        # Итоги для остатков и балансов
+        self.received = defaultdict(int)        # (продавец, товар) -> получено
+        self.sold = defaultdict(int)            # (продавец, товар) -> продано
+        self.receipts_value = defaultdict(int)  # продавец -> стоимость полученного
+        self.sales_value = defaultdict(int)     # продавец -> сумма продаж
+        self.paid = defaultdict(int)            # продавец -> подтверждённые выплаты
+
+    # === ВСПОМОГАТЕЛЬНОЕ ===
+    def insert(self, sql, rows):
+        if rows:
+            self.conn.executemany(sql, rows)
+            self.counts[sql.split()[2]] += len(rows)
+            rows.clear()
+
+    def stamp(self, day, hour_from=9, hour_to=22):
+        second = hour_from * 3600 + int(self.random() * (hour_to - hour_from) * 3600)
+        return f"{self.day_strings[day]} {self.times[second]}"
+
+    def later(self, day, max_days):
+        return min(len(self.dates) - 1, day + self.rng.randint(0, max_days))
+
+    def document_number(self, prefix, seller_code, day):
+        key = (prefix, seller_code, self.day_codes[day])
+        self.numbers[key] += 1
+        return f"{prefix}{seller_code}-{self.day_codes[day]}-{self.numbers[key]:03d}"
+
+    def sample_days(self, count):
+        return self.rng.choices(self.day_range, cum_weights=self.day_cum, k=count)
+
+    # === СПРАВОЧНИКИ ===
+    def generate_products(self):
+        rows = []
+        existing = self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        for number in range(existing + 1, self.sizes['products'] + 1):
+            is_active = 0 if self.rng.random() < 0.05 else 1
+            rows.append((f"Товар {number}", self.rng.randrange(100, 600, 10), is_active, self.first_stamp))
+        # Начальные товары, созданные init_db
+        self.conn.execute("UPDATE products SET created_at = ?", (self.first_stamp,))
+        self.insert("INSERT INTO products (product_name, price, is_active, created_at) VALUES (?, ?, ?, ?)", rows)
+        products = self.conn.execute("SELECT id, price FROM products ORDER BY id").fetchall()
+        self.product_ids = [row[0] for row in products]
+        self.prices = {row[0]: row[1] for row in products}
+        self.product_cum = list(itertools.accumulate(zipf_weights(len(products), PRODUCT_SKEW, self.rng)))
+
+    def generate_sellers(self):
+        rows = [(1, CENTRAL_CODE, 'Склад Р', None, 1, self.stamp(0), self.stamp(0))]
+        for number in range(1, self.sizes['sellers'] + 1):
+            day = self.rng.randrange(0, max(1, len(self.dates) // 3))
+            is_active = 0 if self.rng.random() < 0.05 else 1
+            rows.append((
+                number + 1, f"S{number:04d}", f"Продавец {number}", 100_000_000 + number,
+                is_active, self.stamp(day), self.stamp(day)
+            ))
+        self.codes = {row[0]: row[1] for row in rows}
+        self.telegram_ids = {row[0]: row[3] for row in rows}
+        self.central_id = 1
+        self.seller_ids = [row[0] for row in rows[1:]]
+        weights = zipf_weights(len(self.seller_ids), SELLER_SKEW, self.rng)
+        self.seller_share = {seller_id: weight / sum(weights) for seller_id, weight in zip(self.seller_ids, weights)}
+        self.seller_cum = list(itertools.accumulate(weights))
+        self.insert("""
+            INSERT INTO sellers (id, seller_code, full_name, telegram_id, is_active, created_at, activated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    def sample_sellers(self, count):
+        return self.rng.choices(self.seller_ids, cum_weights=self.seller_cum, k=count)
+
+    def sample_products(self, count):
+        return self.rng.choices(self.product_ids, cum_weights=self.product_cum, k=count)
+
+    # === ЗАЯВКИ НА ПОСТАВКУ ===
+    def generate_orders(self):
+        total_orders = self.sizes['orders']
+        orders_by_seller = defaultdict(int)
+        order_sellers = self.sample_sellers(total_orders)
+        for seller_id in order_sellers:
+            orders_by_seller[seller_id] += 1
+        # У каждого продавца с продажами должна быть хотя бы одна поставка
+        for seller_id in self.seller_ids:
+            if not orders_by_seller[seller_id]:
+                order_sellers.append(seller_id)
+                orders_by_seller[seller_id] = 1
+
+        # Средний объём позиции подбирается под ожидаемые продажи продавца
+        items_per_order = 2.5 * ORDER_STATUS_WEIGHTS[0] / sum(ORDER_STATUS_WEIGHTS)
+        mean_quantity = {
+            seller_id: max(5.0, SUPPLY_MARGIN * AVG_SALE_QUANTITY * self.sizes['sales'] * share
+                           / (orders_by_seller[seller_id] * items_per_order))
+            for seller_id, share in self.seller_share.items()
+        }
+
+        orders, items = [], []
+        statuses = self.rng.choices(ORDER_STATUSES, weights=ORDER_STATUS_WEIGHTS, k=len(order_sellers))
+        days = self.sample_days(len(order_sellers))
+        # Самые ранние поставки – в начале периода, чтобы было что продавать
+        first_day = {}
+        for order_id, (seller_id, status, day) in enumerate(zip(order_sellers, statuses, days), 1):
+            if seller_id not in first_day:
+                first_day[seller_id] = day = self.rng.randrange(0, max(1, len(self.dates) // 10))
+                status = 'completed'
+            code = self.codes[seller_id]
+            shipped_at = completed_at = None
+            if status in ('shipped', 'completed'):
+                shipped_at = self.stamp(self.later(day, 2))
+            if status == 'completed':
+                completed_at = self.stamp(self.later(day, 5))
+            orders.append((
+                order_id, self.document_number('', code, day), seller_id, code, status,
+                self.stamp(day), shipped_at, completed_at
+            ))
+            for product_id in set(self.sample_products(self.rng.randint(1, 4))):
+                ordered = max(1, int(mean_quantity[seller_id] * self.rng.uniform(0.5, 1.5)))
+                received = None
+                if status == 'completed':
+                    received = ordered if self.rng.random() < 0.9 else self.rng.randint(ordered // 2, ordered)
+                    self.received[(seller_id, product_id)] += received
+                    self.receipts_value[seller_id] += received * self.prices[product_id]
+                items.append((order_id, product_id, ordered, received, self.prices[product_id]))
+            if len(items) >= CHUNK:
+                self.flush_orders(orders, items)
+        self.flush_orders(orders, items)
+
+    def flush_orders(self, orders, items):
+        self.insert("""
+            INSERT INTO orders (id, order_number, seller_id, seller_code, status, created_at, shipped_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, orders)
+        self.insert("""
+            INSERT INTO order_items (order_id, product_id, quantity_ordered, quantity_received, price_at_order)
+            VALUES (?, ?, ?, ?, ?)
+        """, items)
+
+    # === ПРОДАЖИ ===
+    def generate_sales(self):
+        # Товары с остатком у каждого продавца (список + остаток)
+        stock = defaultdict(dict)
+        for (seller_id, product_id), quantity in self.received.items():
+            stock[seller_id][product_id] = quantity
+        in_stock = {seller_id: list(products) for seller_id, products in stock.items()}
+
+        rows = []
+        skipped = 0
+        rand = self.random
+        quantities = SALE_QUANTITIES
+        remaining = self.sizes['sales']
+        while remaining > 0:
+            size = min(CHUNK, remaining)
+            remaining -= size
+            for seller_id, day in zip(self.sample_sellers(size), self.sample_days(size)):
+                available = in_stock.get(seller_id)
+                if not available:
+                    skipped += 1
+                    continue
+                index = int(rand() * len(available))
+                product_id = available[index]
+                left = stock[seller_id][product_id]
+                quantity = min(quantities[int(rand() * len(quantities))], left)
+                if quantity == left:
+                    # Товар закончился – убираем из списка (замена последним)
+                    available[index] = available[-1]
+                    available.pop()
+                stock[seller_id][product_id] = left - quantity
+                amount = quantity * self.prices[product_id]
+                self.sold[(seller_id, product_id)] += quantity
+                self.sales_value[seller_id] += amount
+                rows.append((
+                    self.document_number('П-', self.codes[seller_id], day), seller_id, product_id,
+                    quantity, amount, self.stamp(day)
+                ))
+            self.insert("""
+                INSERT INTO sales (sale_number, seller_id, product_id, quantity, amount, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+        self.counts['sales_skipped'] = skipped
+
+    # === ВЫПЛАТЫ ===
+    def generate_payments(self):
+        requests_by_seller = defaultdict(int)
+        for seller_id in self.sample_sellers(self.sizes['payments']):
+            requests_by_seller[seller_id] += 1
+
+        rows = []
+        for seller_id, count in requests_by_seller.items():
+            pending = self.sales_value[seller_id]
+            if pending <= 0:
+                continue
+            code = self.codes[seller_id]
+            # Большая часть заработанного уже выплачена, последний запрос может ждать
+            to_pay = int(pending * self.rng.uniform(0.6, 0.9))
+            parts = sorted(self.rng.sample(range(1, to_pay), min(count - 1, to_pay - 1))) if to_pay > 1 else []
+            amounts = [b - a for a, b in zip([0] + parts, parts + [to_pay])]
+            days = sorted(self.sample_days(len(amounts)))
+            for position, (amount, day) in enumerate(zip(amounts, days)):
+                if amount <= 0:
+                    continue
+                if position == len(amounts) - 1 and self.rng.random() < 0.3:
+                    status, approved_at = 'pending', None
+                elif self.rng.random() < 0.03:
+                    status, approved_at = 'rejected', None
+                else:
+                    status, approved_at = 'approved', self.stamp(self.later(day, 2))
+                    self.paid[seller_id] += amount
+                rows.append((self.document_number('В-', code, day), seller_id, amount, status, self.stamp(day), approved_at))
+            if len(rows) >= CHUNK:
+                self.flush_payments(rows)
+        self.flush_payments(rows)
+
+    def flush_payments(self, rows):
+        self.insert("""
+            INSERT INTO payment_requests (request_number, seller_id, amount, status, created_at, approved_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    # === ПОПОЛНЕНИЕ СКЛАДА Р ===
+    def generate_restocks(self):
+        """Заявки на пополнение: выполненные покрывают всё, что склад Р отгрузил продавцам"""
+        shipped = defaultdict(int)
+        for (seller_id, product_id), quantity in self.received.items():
+            shipped[product_id] += quantity
+
+        requests = []
+        slots = defaultdict(list)      # товар -> выполненные позиции [request_id, ...]
+        completed_ids = []
+        for request_id, seller_id in enumerate(self.sample_sellers(self.sizes['restocks']), 1):
+            day = self.sample_days(1)[0]
+            status = self.rng.choices(RESTOCK_STATUSES, weights=RESTOCK_STATUS_WEIGHTS)[0]
+            products = set(self.sample_products(self.rng.randint(1, 4)))
+            requests.append([request_id, seller_id, day, status, products])
+            if status == 'completed':
+                completed_ids.append(request_id)
+                for product_id in products:
+                    slots[product_id].append(request_id)
+        if not completed_ids:
+            requests.append([len(requests) + 1, self.seller_ids[0], 0, 'completed', set()])
+            completed_ids.append(len(requests))
+
+        self.restocked = {}
+        received = {}
+        for product_id in self.product_ids:
+            need = shipped[product_id] + self.rng.randint(0, 100)
+            self.restocked[product_id] = need
+            if need <= 0:
+                continue
+            if not slots[product_id]:
+                request_id = self.rng.choice(completed_ids)
+                requests[request_id - 1][4].add(product_id)
+                slots[product_id].append(request_id)
+            weights = [self.rng.random() + 0.1 for _ in slots[product_id]]
+            total = sum(weights)
+            left = need
+            for position, (request_id, weight) in enumerate(zip(slots[product_id], weights)):
+                quantity = left if position == len(weights) - 1 else min(left, int(need * weight / total))
+                received[(request_id, product_id)] = quantity
+                left -= quantity
+
+        request_rows, item_rows, history_rows = [], [], []
+        for request_id, seller_id, day, status, products in requests:
+            code = self.codes[seller_id]
+            completed_at = self.stamp(self.later(day, 3)) if status == 'completed' else None
+            request_rows.append((
+                request_id, self.document_number('З-', code, day), seller_id, code, status,
+                self.stamp(day), completed_at
+            ))
+            for product_id in products:
+                quantity = received.get((request_id, product_id))
+                if status == 'completed':
+                    quantity = quantity or 0
+                    requested = quantity + self.rng.randint(0, 5)
+                    history_rows.append((product_id, quantity, completed_at))
+                else:
+                    requested = self.rng.randint(5, 100)
+                item_rows.append((request_id, product_id, requested, quantity))
+        self.insert("""
+            INSERT INTO restock_requests (id, request_number, seller_id, seller_code, status, created_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, request_rows)
+        self.insert("""
+            INSERT INTO restock_items (request_id, product_id, quantity_requested, quantity_received)
+            VALUES (?, ?, ?, ?)
+        """, item_rows)
+        self.insert("INSERT INTO restock_history (product_id, quantity, created_at) VALUES (?, ?, ?)", history_rows)
+        self.shipped = shipped
+
+    # === ЛОГИ ===
+    def generate_logs(self):
+        rows = []
+        remaining = self.sizes['logs']
+        while remaining > 0:
+            size = min(CHUNK, remaining)
+            remaining -= size
+            actions = self.rng.choices(LOG_ACTIONS, weights=LOG_ACTION_WEIGHTS, k=size)
+            for (role, action, details), seller_id, day in zip(actions, self.sample_sellers(size), self.sample_days(size)):
+                if role == 'admin':
+                    user_id = ADMIN_TELEGRAM_ID
+                    role = 'администратор'
+                else:
+                    user_id = self.telegram_ids[seller_id]
+                    role = 'продавец' if details else 'seller'
+                    if not details:
+                        details = self.codes[seller_id]
+                rows.append((user_id, role, action, details, self.stamp(day, 0, 24)))
+            self.insert("INSERT INTO logs (user_id, user_role, action, details, created_at) VALUES (?, ?, ?, ?, ?)", rows)
+
+    # === ОСТАТКИ И БАЛАНСЫ ===
+    def generate_balances(self):
+        products, debts, pendings = [], [], []
+        for seller_id in [self.central_id] + self.seller_ids:
+            for product_id in self.product_ids:
+                if seller_id == self.central_id:
+                    quantity = self.restocked[product_id] - self.shipped[product_id]
+                else:
+                    quantity = self.received[(seller_id, product_id)] - self.sold[(seller_id, product_id)]
+                products.append((seller_id, product_id, quantity))
+            if len(products) >= CHUNK:
+                self.insert("INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)", products)
+            if seller_id == self.central_id:
+                debt = sum(self.prices[product_id] * quantity for product_id, quantity in self.restocked.items())
+                pending = 0
+            else:
+                debt = self.receipts_value[seller_id] - self.sales_value[seller_id] - self.paid[seller_id]
+                pending = self.sales_value[seller_id] - self.paid[seller_id]
+            debts.append((seller_id, debt, self.last_stamp))
+            pendings.append((seller_id, pending, self.last_stamp))
+        self.insert("INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)", products)
+        self.insert("INSERT INTO seller_debt (seller_id, total_debt, updated_at) VALUES (?, ?, ?)", debts)
+        self.insert("INSERT INTO seller_pending (seller_id, pending_amount, updated_at) VALUES (?, ?, ?)", pendings)
+
+    def generate(self):
+        steps = (
+            self.generate_products, self.generate_sellers, self.generate_orders, self.generate_sales,
+            self.generate_payments, self.generate_restocks, self.generate_logs, self.generate_balances,
+        )
+        for step in steps:
+            step()
+        return dict(self.counts)
+
+
+def check_consistency(conn):
+    """Пересчитывает остатки и балансы продавцов из документов; возвращает список расхождений"""
+    problems = []
+    mismatched = conn.execute("""
+        WITH received AS (
+            SELECT o.seller_id, oi.product_id, SUM(oi.quantity_received) AS quantity
+            FROM order_items oi JOIN orders o ON o.id = oi.order_id
+            WHERE o.status = 'completed'
+            GROUP BY o.seller_id, oi.product_id
+        ), sold AS (
+            SELECT seller_id, product_id, SUM(quantity) AS quantity
+            FROM sales GROUP BY seller_id, product_id
+        )
+        SELECT COUNT(*) FROM seller_products sp
+        JOIN sellers s ON s.id = sp.seller_id AND s.seller_code != ?
+        LEFT JOIN received r ON r.seller_id = sp.seller_id AND r.product_id = sp.product_id
+        LEFT JOIN sold so ON so.seller_id = sp.seller_id AND so.product_id = sp.product_id
+        WHERE sp.quantity != COALESCE(r.quantity, 0) - COALESCE(so.quantity, 0)
+    """, (CENTRAL_CODE,)).fetchone()[0]
+    if mismatched:
+        problems.append(f"seller_products: {mismatched} строк не сходятся с поставками и продажами")
+
+    mismatched = conn.execute("""
+        WITH sold AS (SELECT seller_id, SUM(amount) AS amount FROM sales GROUP BY seller_id),
+             paid AS (SELECT seller_id, SUM(amount) AS amount FROM payment_requests
+                      WHERE status = 'approved' GROUP BY seller_id),
+             received AS (
+                SELECT o.seller_id, SUM(oi.quantity_received * oi.price_at_order) AS amount
+                FROM order_items oi JOIN orders o ON o.id = oi.order_id
+                WHERE o.status = 'completed' GROUP BY o.seller_id
+             )
+        SELECT COUNT(*) FROM sellers s
+        JOIN seller_debt sd ON sd.seller_id = s.id
+        JOIN seller_pending sp ON sp.seller_id = s.id
+        LEFT JOIN sold ON sold.seller_id = s.id
+        LEFT JOIN paid ON paid.seller_id = s.id
+        LEFT JOIN received ON received.seller_id = s.id
+        WHERE s.seller_code != ? AND (
+            sp.pending_amount != COALESCE(sold.amount, 0) - COALESCE(paid.amount, 0)
+            OR sd.total_debt != COALESCE(received.amount, 0) - COALESCE(sold.amount, 0) - COALESCE(paid.amount, 0)
+        )
+    """, (CENTRAL_CODE,)).fetchone()[0]
+    if mismatched:
+        problems.append(f"seller_debt/seller_pending: {mismatched} продавцов не сходятся с документами")
+
+    negative = conn.execute("SELECT COUNT(*) FROM seller_products WHERE quantity < 0").fetchone()[0]
+    if negative:
+        problems.append(f"seller_products: {negative} отрицательных остатков")
+    return problems
+
+
+def generate_dataset(path, scale=1.0, seed=1, days=365, sizes=None, end_date=DEFAULT_END_DATE):
+    """Создаёт базу path с синтетическими данными; возвращает число строк по таблицам"""
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} уже существует")
+    table_sizes = {name: max(1, int(value * scale)) for name, value in BASE_SIZES.items()}
+    table_sizes.update(sizes or {})
+
+    # Схема – ровно та, что создаёт бот
+    Database(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -200000")
+        with conn:
+            counts = DatasetGenerator(conn, table_sizes, days, seed, end_date).generate()
+    finally:
+        conn.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетические данные для схемы бота")
+    parser.add_argument('path', help="файл новой базы")
+    parser.add_argument('--scale', type=float, default=1.0, help="множитель размеров (1 ≈ 0.4 млн строк)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--days', type=int, default=365, help="период данных в днях")
+    parser.add_argument('--end-date', type=date.fromisoformat, default=DEFAULT_END_DATE,
+                        help=f"последний день данных, ГГГГ-ММ-ДД (по умолчанию {DEFAULT_END_DATE})")
+    parser.add_argument('--force', action='store_true', help="перезаписать существующий файл")
+    parser.add_argument('--check', action='store_true', help="проверить остатки и балансы после генерации")
+    for name in BASE_SIZES:
+        parser.add_argument(f'--{name}', type=int, help=f"число строк {name} (вместо --scale)")
+    args = parser.parse_args(argv)
+
+    if args.force and os.path.exists(args.path):
+        os.remove(args.path)
+    sizes = {name: getattr(args, name) for name in BASE_SIZES if getattr(args, name) is not None}
+
+    started = time.perf_counter()
+    counts = generate_dataset(args.path, args.scale, args.seed, args.days, sizes, args.end_date)
+    elapsed = time.perf_counter() - started
+    skipped = counts.pop('sales_skipped', 0)
+    total = sum(counts.values())
+    for table, rows in sorted(counts.items()):
+        print(f"{table:<20} {rows:>12,}")
+    print(f"{'всего':<20} {total:>12,} строк за {elapsed:.1f} с ({total / elapsed:,.0f} строк/с)")
+    if skipped:
+        print(f"продаж пропущено (нет остатка): {skipped:,}")
+    print(f"файл {os.path.getsize(args.path) / 1024 / 1024:.1f} МБ")
+
+    if args.check:
+        conn = sqlite3.connect(args.path)
+        try:
+            problems = check_consistency(conn)
+        finally:
+            conn.close()
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            return 1
+        print("✅ Остатки и балансы сходятся с документами")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
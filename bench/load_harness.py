@@ -0,0 +1,706 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сквозная нагрузка на бота без Telegram.
+
+Собирается настоящий Application: ReplyBot, SQLitePersistence,
+OutboundRateLimiter и все обработчики из main.register_handlers.
+Вместо HTTP-клиента – FakeTelegram: запоминает вызовы API, выдаёт
+номера сообщений и хранит последние сообщения каждого чата с кнопками.
+Симулированные продавцы проходят полные сценарии, читая ответы бота
+как пользователь: жмут кнопки из присланных клавиатур и вводят числа
+из подсказок.
+
+Сценарии продавца по порядку: активация по коду, заявка-корзина из двух
+товаров, отгрузка админом, подтверждение получения, продажа, запрос
+выплаты, подтверждение выплаты админом. Шаги админа выполняются по
+очереди (у админа одна переписка), обновления обрабатываются строго по
+одному – как в боте без concurrent_updates.
+
+Для каждого сценария – задержка обработки (p50/p99), число обновлений и
+на одно обновление: вызовы API, SQL-запросы, соединения и коммиты.
+Всего – обновлений в секунду и фоновые вызовы API (outbox).
+
+Бюджеты SQL проверяются на каждом обновлении (счётчик Database, см.
+sql_budget.py): больше --max-statements запросов или один запрос
+--max-repeats раз и больше (N+1) – нарушение; при нарушениях код
+возврата 1, так что прогон годится как проверка в CI.
+
+    python -m bench.load_harness [--sellers N] [--concurrency C] [--scale S] [--memory] [--api-latency-ms L] [--max-statements N] [--max-repeats N] [--json F]
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+# Своя база: файл пересоздаётся при каждом запуске
+LOAD_DB = os.path.join(tempfile.gettempdir(), 'bench_load.db')
+os.environ['DATABASE_PATH'] = LOAD_DB
+os.environ['ADMIN_IDS'] = '1'
+# Медленные трассы не пишем: под нагрузкой ими будет каждое обновление
+os.environ.setdefault('TRACE_SLOW_MS', '0')
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+from config import config
+from database import MEMORY, Database, db, use_database
+from middleware import BotApplication
+from outbound import OutboundRateLimiter
+from persistence import SQLitePersistence
+import replies
+import sql_budget
+
+logger = logging.getLogger(__name__)
+
+ADMIN_ID = 1
+BOT_USER = {'id': 10, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+# telegram_id симулированных продавцов: FIRST_USER_ID + номер
+FIRST_USER_ID = 500_000_000
+CODE_PREFIX = 'L'
+
+# Запас склада Р, чтобы заявки никогда не упирались в остаток
+CENTRAL_STOCK = 10_000_000
+
+# Сколько последних сообщений чата помнить (кнопки ищутся среди них)
+CHAT_HISTORY = 20
+
+FLOWS = ('activation', 'order', 'ship', 'receipt', 'sale', 'payment', 'approve')
+
+
+class FlowError(Exception):
+    """Бот ответил не так, как ожидает сценарий"""
+
+
+class Step:
+    """Счётчики одного обновления"""
+    __slots__ = ('task', 'open', 'api', 'statements', 'db_seconds', 'connections', 'commits', 'upload_bytes',
+                 'counter', 'error')
+
+    def __init__(self):
+        self.task = asyncio.current_task()
+        self.open = True
+        self.api = Counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.connections = 0
+        self.commits = 0
+        self.upload_bytes = 0
+        self.counter = None     # StatementCounter из sql_budget
+        self.error = None       # первое исключение обработчика
+
+
+_current_step = contextvars.ContextVar('load_step', default=None)
+
+
+def _step():
+    # Задачи JobQueue, созданные обработчиком, наследуют его контекст – их не считаем
+    step = _current_step.get()
+    if step is None or not step.open or step.task is not asyncio.current_task():
+        return None
+    return step
+
+
+def _record_statement(sql, parameters, seconds):
+    step = _step()
+    if step is not None:
+        step.statements += 1
+        step.db_seconds += seconds
+
+
+def _record_connection(seconds_open, commits, failed):
+    step = _step()
+    if step is not None:
+        step.connections += 1
+        step.commits += commits
+
+
+def _record_counter(info, counter):
+    step = _step()
+    if step is not None:
+        step.counter = counter
+
+
+class FakeTelegram(BaseRequest):
+    """Bot API в памяти: записывает вызовы и помнит сообщения с клавиатурами"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.background = Counter()
+        self.upload_bytes = 0
+        self.chats = defaultdict(OrderedDict)     # chat_id -> message_id -> {'text', 'markup'}
+        self.sent = defaultdict(list)             # chat_id -> тексты, отправленные в текущем шаге
+        self._message_ids = defaultdict(lambda: 1000)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _remember(self, chat_id, message_id, text, markup):
+        chat = self.chats[chat_id]
+        chat[message_id] = {'text': text or '', 'markup': markup}
+        chat.move_to_end(message_id)
+        while len(chat) > CHAT_HISTORY:
+            chat.popitem(last=False)
+        if text:
+            self.sent[chat_id].append(text)
+
+    def _message(self, chat_id, message_id, text=None):
+        data = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if text is not None:
+            data['text'] = text
+        return data
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        step = _step()
+        (step.api if step is not None else self.background)[endpoint] += 1
+        self.calls[endpoint] += 1
+        if request_data and request_data.contains_files:
+            size = sum(len(value[1]) for value in request_data.multipart_data.values())
+            self.upload_bytes += size
+            if step is not None:
+                step.upload_bytes += size
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = params.get('chat_id')
+        if endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint == 'sendMessage':
+            self._message_ids[chat_id] += 1
+            message_id = self._message_ids[chat_id]
+            self._remember(chat_id, message_id, params.get('text'), params.get('reply_markup'))
+            result = self._message(chat_id, message_id, params.get('text'))
+        elif endpoint == 'editMessageText':
+            message_id = params.get('message_id')
+            self._remember(chat_id, message_id, params.get('text'), params.get('reply_markup'))
+            result = self._message(chat_id, message_id, params.get('text'))
+        elif endpoint == 'sendDocument':
+            self._message_ids[chat_id] += 1
+            result = dict(
+                self._message(chat_id, self._message_ids[chat_id]),
+                document={'file_id': 'bench', 'file_unique_id': 'bench'}
+            )
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+class Recorder:
+    """Результаты сценариев и ошибки обработчиков"""
+
+    def __init__(self):
+        self.flows = defaultdict(list)      # имя -> [dict]
+        self.failures = defaultdict(Counter)
+        self.errors = Counter()
+        self.updates = 0
+        self.busy = 0.0
+        # Нарушения бюджетов: (сценарий, запрос или None) -> [обновлений, максимум]
+        self.violations = {}
+
+    async def on_error(self, update, context):
+        error = context.error
+        name = type(error).__name__
+        if not self.errors[name]:
+            # Полный traceback – один раз на тип исключения
+            logger.error(f"Исключение в обработчике: {name}: {error}", exc_info=error)
+        self.errors[name] += 1
+        # Обработчики ошибок выполняются в задаче обновления – сценарий узнает о сбое
+        step = _step()
+        if step is not None and step.error is None:
+            step.error = error
+
+
+class Harness:
+    def __init__(self, application, telegram, recorder, think=0.0, max_statements=0, max_repeats=0):
+        self.application = application
+        self.telegram = telegram
+        self.recorder = recorder
+        self.think = think
+        self.max_statements = max_statements
+        self.max_repeats = max_repeats
+        self._update_id = 0
+        # id колбэков уникальны, как в Telegram (у каждого сценария свой SimUser админа)
+        self._callback_id = 0
+        # Обновления обрабатываются по одному, как в боте
+        self._processing = asyncio.Lock()
+        # У админа одна переписка: его сценарии не перемежаются
+        self.admin_lock = asyncio.Lock()
+
+    async def process(self, user, data, flow):
+        """Обрабатывает одно обновление от user; возвращает тексты, присланные ему в ответ"""
+        self._update_id += 1
+        data['update_id'] = self._update_id
+        update = Update.de_json(data, self.application.bot)
+        async with self._processing:
+            step = Step()
+            token = _current_step.set(step)
+            self.telegram.sent.pop(user.user_id, None)
+            started = time.perf_counter()
+            try:
+                await self.application.process_update(update)
+            finally:
+                elapsed = time.perf_counter() - started
+                step.open = False
+                _current_step.reset(token)
+            self.recorder.updates += 1
+            self.recorder.busy += elapsed
+            texts = self.telegram.sent.pop(user.user_id, [])
+        flow.add(step, elapsed)
+        self.check_budget(flow.name, step)
+        if step.error is not None:
+            raise FlowError(f"исключение {type(step.error).__name__}: {str(step.error)[:60]}")
+        if self.think:
+            await asyncio.sleep(random.uniform(0, self.think))
+        return texts
+
+
+    def _violation(self, flow, statement, value):
+        entry = self.recorder.violations.setdefault((flow, statement), [0, 0])
+        entry[0] += 1
+        entry[1] = max(entry[1], value)
+
+    def check_budget(self, flow, step):
+        if self.max_statements and step.statements > self.max_statements:
+            self._violation(flow, None, step.statements)
+        if self.max_repeats and step.counter is not None:
+            for shape, count in step.counter.repeated(self.max_repeats):
+                self._violation(flow, shape, count)
+
+
+class Flow:
+    """Сумма шагов одного сценария"""
+
+    def __init__(self, name):
+        self.name = name
+        self.updates = 0
+        self.seconds = 0.0
+        self.max_update = 0.0
+        self.api = 0
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.connections = 0
+        self.commits = 0
+        self.upload_bytes = 0
+        self.started = time.perf_counter()
+
+    def add(self, step, seconds):
+        self.updates += 1
+        self.seconds += seconds
+        self.max_update = max(self.max_update, seconds)
+        self.api += sum(step.api.values())
+        self.statements += step.statements
+        self.db_seconds += step.db_seconds
+        self.connections += step.connections
+        self.commits += step.commits
+        self.upload_bytes += step.upload_bytes
+
+    def result(self, ok):
+        return {
+            'ok': ok,
+            'updates': self.updates,
+            'seconds': self.seconds,
+            'wall': time.perf_counter() - self.started,
+            'max_update': self.max_update,
+            'api': self.api,
+            'statements': self.statements,
+            'db_seconds': self.db_seconds,
+            'connections': self.connections,
+            'commits': self.commits,
+            'upload_bytes': self.upload_bytes,
+        }
+
+
+class SimUser:
+    """Пользователь Telegram: пишет текст и жмёт кнопки из последних сообщений бота"""
+
+    def __init__(self, harness, user_id, name):
+        self.harness = harness
+        self.user_id = user_id
+        self.name = name
+        self._message_id = 0
+
+    def _from(self):
+        return {'id': self.user_id, 'is_bot': False, 'first_name': self.name}
+
+    def _chat(self):
+        return {'id': self.user_id, 'type': 'private'}
+
+    async def say(self, text, flow):
+        self._message_id += 1
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': self._chat(),
+            'from': self._from(),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return await self.harness.process(self, {'message': message}, flow)
+
+    def find_button(self, prefix, contains=None, rng=None):
+        """(message_id, текст, callback_data) кнопки из самого свежего подходящего сообщения"""
+        for message_id, message in reversed(self.harness.telegram.chats[self.user_id].items()):
+            markup = message['markup'] or {}
+            buttons = [
+                button for row in markup.get('inline_keyboard', []) for button in row
+                if button.get('callback_data', '').startswith(prefix)
+                and (contains is None or contains in button.get('text', ''))
+            ]
+            if buttons:
+                button = rng.choice(buttons) if rng else buttons[0]
+                return message_id, message['text'], button['callback_data']
+        raise FlowError(f"нет кнопки {prefix}" + (f" «{contains}»" if contains else ''))
+
+    async def press(self, prefix, flow, contains=None, rng=None):
+        message_id, text, data = self.find_button(prefix, contains, rng)
+        self.harness._callback_id += 1
+        query = {
+            'id': f"{self.user_id}-{self.harness._callback_id}",
+            'from': self._from(),
+            'chat_instance': str(self.user_id),
+            'data': data,
+            'message': dict(
+                self.harness.telegram._message(self.user_id, message_id, text),
+                chat=self._chat()
+            ),
+        }
+        return await self.harness.process(self, {'callback_query': query}, flow)
+
+
+def expect(texts, pattern):
+    """Первая группа совпадения pattern в ответах бота"""
+    for text in texts:
+        match = re.search(pattern, text)
+        if match:
+            return match.group(1) if match.groups() else match.group(0)
+    raise FlowError(f"нет ответа «{pattern}»: {(texts[-1] if texts else '—')[:60]!r}")
+
+
+class SimSeller:
+    """Один продавец, проходящий все сценарии по порядку"""
+
+    def __init__(self, harness, number, seed):
+        self.harness = harness
+        self.code = f"{CODE_PREFIX}{number:05d}"
+        self.user = SimUser(harness, FIRST_USER_ID + number, f"Продавец {self.code}")
+        self.admin = SimUser(harness, ADMIN_ID, 'Админ')
+        self.rng = random.Random(seed * 1_000_003 + number)
+        self.order_number = None
+        self.request_number = None
+
+    async def run(self):
+        for name in FLOWS:
+            flow = Flow(name)
+            try:
+                if name in ('ship', 'approve'):
+                    async with self.harness.admin_lock:
+                        await getattr(self, f"flow_{name}")(flow)
+                else:
+                    await getattr(self, f"flow_{name}")(flow)
+            except FlowError as e:
+                self.harness.recorder.flows[name].append(flow.result(False))
+                self.harness.recorder.failures[name][str(e)] += 1
+                # Следующие сценарии зависят от этого
+                return
+            self.harness.recorder.flows[name].append(flow.result(True))
+
+    async def flow_activation(self, flow):
+        await self.user.say('/start', flow)
+        await self.user.say('Ввести код активации', flow)
+        expect(await self.user.say(self.code, flow), 'Активация успешна')
+
+    async def flow_order(self, flow):
+        await self.user.say('📦 Заявка на поставку', flow)
+        for _ in range(2):
+            await self.user.press('prod_', flow, rng=self.rng)
+            await self.user.say(str(self.rng.randint(5, 20)), flow)
+        await self.user.press('finish_cart', flow)
+        self.order_number = expect(
+            await self.user.press('confirm_order', flow),
+            r'Заявка № (\S+) успешно создана'
+        )
+
+    async def flow_ship(self, flow):
+        await self.admin.say('📦 Управление поставками', flow)
+        await self.admin.press('admin_orders_new', flow)
+        await self.admin.press('admin_order_view_', flow, contains=self.order_number)
+        expect(await self.admin.press('admin_order_ship_', flow), 'Отгрузка подтверждена')
+
+    async def flow_receipt(self, flow):
+        await self.user.say('📤 Отгруженные поставки', flow)
+        await self.user.press('shipment_', flow, contains=self.order_number)
+        texts = await self.user.press('confirm_receipt', flow)
+        for _ in range(10):
+            ordered = expect(texts, r'Заказано: (\d+)')
+            texts = await self.user.say(ordered, flow)
+            if any('Фактическое получение' in text for text in texts):
+                break
+        expect(await self.user.press('final_confirm', flow), 'Получение подтверждено')
+
+    async def flow_sale(self, flow):
+        await self.user.say('💰 Реализовано', flow)
+        available = int(expect(await self.user.press('sell_', flow, rng=self.rng), r'Доступно: (\d+)'))
+        await self.user.say(str(self.rng.randint(1, max(1, min(3, available)))), flow)
+        expect(await self.user.press('confirm_sale', flow), 'Продажа оформлена')
+
+    async def flow_payment(self, flow):
+        await self.user.say('📊 Остатки', flow)
+        amount = expect(await self.user.press('request_payment', flow), r'не больше (\d+)')
+        await self.user.say(amount, flow)
+        self.request_number = expect(
+            await self.user.press('confirm_payment', flow),
+            r'Номер запроса: (\S+)'
+        )
+
+    async def flow_approve(self, flow):
+        await self.admin.say('💰 Управление платежами', flow)
+        await self.admin.press('payments_pending', flow)
+        await self.admin.press('payment_view_', flow, contains=self.request_number)
+        await self.admin.press('payment_confirm', flow)
+
+
+# ---- Подготовка базы ----
+
+def prepare_database(sellers, scale, seed):
+    """Пересоздаёт LOAD_DB: история generate_dataset (если scale > 0) и продавцы для активации"""
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(LOAD_DB + suffix):
+            os.remove(LOAD_DB + suffix)
+    if scale > 0:
+        from bench.generate_dataset import generate_dataset
+        generate_dataset(LOAD_DB, scale=scale, seed=seed)
+    else:
+        db.init_db()
+
+    with db.get_connection() as conn:
+        central = conn.execute("SELECT id FROM sellers WHERE seller_code = 'Р'").fetchone()
+        if central is None:
+            conn.execute("INSERT INTO sellers (seller_code, full_name, is_active) VALUES ('Р', 'Склад Р', 1)")
+            central = conn.execute("SELECT id FROM sellers WHERE seller_code = 'Р'").fetchone()
+        products = [row[0] for row in conn.execute("SELECT id FROM products WHERE is_active = 1")]
+        conn.executemany("""
+            INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)
+            ON CONFLICT(seller_id, product_id) DO UPDATE SET quantity = excluded.quantity
+        """, [(central[0], product_id, CENTRAL_STOCK) for product_id in products])
+        for number in range(1, sellers + 1):
+            # Как /add_seller, но без telegram_id – его привяжет активация
+            cursor = conn.execute(
+                "INSERT INTO sellers (seller_code, full_name, is_active) VALUES (?, ?, 1)",
+                (f"{CODE_PREFIX}{number:05d}", f"Продавец {CODE_PREFIX}{number:05d}")
+            )
+            seller_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, 0)",
+                [(seller_id, product_id) for product_id in products]
+            )
+            conn.execute("INSERT INTO seller_debt (seller_id, total_debt) VALUES (?, 0)", (seller_id,))
+            conn.execute("INSERT INTO seller_pending (seller_id, pending_amount) VALUES (?, 0)", (seller_id,))
+
+
+def build_application(telegram):
+    """Тот же Application, что в main(), но с FakeTelegram вместо HTTP"""
+    import main
+
+    bot = replies.ReplyBot(
+        token=config.BOT_TOKEN,
+        request=telegram,
+        get_updates_request=telegram,
+        # Ограничитель участвует, но не тормозит: лимиты Telegram здесь не моделируются
+        rate_limiter=OutboundRateLimiter(global_rate=1e9, chat_rate=1e9),
+    )
+    application = (
+        Application.builder().application_class(BotApplication)
+        .bot(bot).persistence(SQLitePersistence()).build()
+    )
+    main.register_handlers(application)
+    return application
+
+
+# ---- Отчёт ----
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(recorder, telegram, wall, max_statements=0, max_repeats=0):
+    result = {
+        'updates': recorder.updates,
+        'wall_seconds': round(wall, 3),
+        'busy_seconds': round(recorder.busy, 3),
+        'updates_per_second': round(recorder.updates / recorder.busy, 1) if recorder.busy else 0.0,
+        'api_calls': dict(telegram.calls),
+        'background_api_calls': dict(telegram.background),
+        'upload_bytes': telegram.upload_bytes,
+        'handler_errors': dict(recorder.errors),
+        'budget': {
+            'max_statements': max_statements,
+            'max_repeats': max_repeats,
+            'violations': [
+                {'flow': flow, 'statement': statement, 'updates': updates, 'max': peak}
+                for (flow, statement), (updates, peak) in sorted(
+                    recorder.violations.items(), key=lambda item: (FLOWS.index(item[0][0]), item[0][1] or ''))
+            ],
+        },
+        'flows': {},
+    }
+    for name in FLOWS:
+        runs = recorder.flows.get(name, [])
+        if not runs:
+            continue
+        updates = sum(run['updates'] for run in runs) or 1
+        latencies = [run['seconds'] * 1000 for run in runs if run['ok']] or [0.0]
+        result['flows'][name] = {
+            'runs': len(runs),
+            'failed': sum(not run['ok'] for run in runs),
+            'failures': dict(recorder.failures.get(name, {})),
+            'updates_per_flow': round(updates / len(runs), 2),
+            'p50_ms': round(percentile(latencies, 0.5), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'max_update_ms': round(max(run['max_update'] for run in runs) * 1000, 3),
+            'api_per_update': round(sum(run['api'] for run in runs) / updates, 2),
+            'statements_per_update': round(sum(run['statements'] for run in runs) / updates, 2),
+            'db_ms_per_update': round(sum(run['db_seconds'] for run in runs) / updates * 1000, 3),
+            'connections_per_update': round(sum(run['connections'] for run in runs) / updates, 2),
+            'commits_per_update': round(sum(run['commits'] for run in runs) / updates, 2),
+            'upload_kb_per_flow': round(sum(run['upload_bytes'] for run in runs) / len(runs) / 1024, 1),
+        }
+    return result
+
+
+def print_summary(result):
+    print(f"Обновлений: {result['updates']:,} за {result['wall_seconds']:.1f} с "
+          f"(обработка {result['busy_seconds']:.1f} с, {result['updates_per_second']:,.1f} обновл./с)")
+    print(f"{'сценарий':<11} {'запусков':>8} {'ошибок':>6} {'обн.':>5} {'p50 мс':>9} {'p99 мс':>9} "
+          f"{'API/об':>7} {'SQL/об':>7} {'соед/об':>8} {'ком/об':>7} {'бэкап КБ':>9}")
+    for name, flow in result['flows'].items():
+        print(f"{name:<11} {flow['runs']:>8} {flow['failed']:>6} {flow['updates_per_flow']:>5.1f} "
+              f"{flow['p50_ms']:>9.2f} {flow['p99_ms']:>9.2f} {flow['api_per_update']:>7.2f} "
+              f"{flow['statements_per_update']:>7.2f} {flow['connections_per_update']:>8.2f} "
+              f"{flow['commits_per_update']:>7.2f} {flow['upload_kb_per_flow']:>9.1f}")
+        for reason, count in flow['failures'].items():
+            print(f"    ✗ {count} × {reason}")
+    print(f"Вызовы API: {result['api_calls']}")
+    print(f"Из них фоновые (outbox и задачи): {result['background_api_calls']}")
+    if result['handler_errors']:
+        print(f"Исключения в обработчиках: {result['handler_errors']}")
+    budget = result['budget']
+    if not budget['violations']:
+        print(f"Бюджеты SQL соблюдены (запросов ≤ {budget['max_statements'] or '∞'}, "
+              f"повторов < {budget['max_repeats'] or '∞'})")
+        return
+    print(f"✗ Нарушены бюджеты SQL (запросов ≤ {budget['max_statements'] or '∞'}, "
+          f"повторов < {budget['max_repeats'] or '∞'}):")
+    for violation in budget['violations']:
+        if violation['statement'] is None:
+            print(f"  {violation['flow']:<11} {violation['updates']} обновл. сверх бюджета, "
+                  f"до {violation['max']} запросов")
+        else:
+            print(f"  {violation['flow']:<11} N+1: до {violation['max']} раз за обновление "
+                  f"({violation['updates']} обновл.): {violation['statement'][:100]}")
+
+
+async def run(args):
+    prepare_database(args.sellers, args.scale, args.seed)
+    if not args.memory:
+        return await simulate(args)
+    # Подготовленная база целиком копируется в память: без fsync и файловых блокировок
+    with use_database(Database(MEMORY, source=db)) as memory:
+        try:
+            return await simulate(args)
+        finally:
+            memory.close()
+
+
+async def simulate(args):
+    db.statement_listeners.append(_record_statement)
+    db.connection_listeners.append(_record_connection)
+    sql_budget.update_listeners.append(_record_counter)
+
+    telegram = FakeTelegram(latency=args.api_latency_ms / 1000)
+    recorder = Recorder()
+    application = build_application(telegram)
+    application.add_error_handler(recorder.on_error)
+    harness = Harness(application, telegram, recorder, think=args.think_ms / 1000,
+                      max_statements=args.max_statements, max_repeats=args.max_repeats)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def seller(number):
+        async with semaphore:
+            await SimSeller(harness, number, args.seed).run()
+
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(seller(number) for number in range(1, args.sellers + 1)))
+        wall = time.perf_counter() - started
+        # Даём outbox дослать уведомления
+        await asyncio.sleep(args.drain)
+        await application.stop()
+    return summarize(recorder, telegram, wall, args.max_statements, args.max_repeats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сквозная нагрузка на обработчики бота")
+    parser.add_argument('--sellers', type=int, default=200, help="число симулированных продавцов")
+    parser.add_argument('--concurrency', type=int, default=50, help="сколько продавцов действуют одновременно")
+    parser.add_argument('--scale', type=float, default=0.0,
+                        help="история generate_dataset до начала (0 – пустая база)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help="задержка каждого вызова API")
+    parser.add_argument('--think-ms', type=float, default=0.0, help="пауза пользователя между шагами (до)")
+    parser.add_argument('--drain', type=float, default=1.0, help="секунд на досылку outbox в конце")
+    parser.add_argument('--memory', action='store_true', help="база в памяти (копия подготовленной)")
+    parser.add_argument('--max-statements', type=int, default=config.SQL_BUDGET,
+                        help="бюджет SQL-запросов на обновление (0 – не проверять)")
+    parser.add_argument('--max-repeats', type=int, default=config.SQL_REPEAT_LIMIT,
+                        help="столько повторов одного запроса за обновление – N+1 (0 – не проверять)")
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--json', help="записать результат в JSON")
+    args = parser.parse_args(argv)
+
+    # main.py включает INFO для всего; под нагрузкой это в основном шум
+    import main as bot_main
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger(bot_main.__name__).setLevel(args.log_level)
+    # Бюджеты проверяются здесь же – предупреждения бота о них дублировали бы отчёт
+    logging.getLogger(sql_budget.__name__).setLevel(logging.ERROR)
+
+    result = asyncio.run(run(args))
+    print_summary(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Результат записан в {args.json}")
+    return 1 if result['budget']['violations'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
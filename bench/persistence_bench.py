@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сравнение SQLitePersistence с PicklePersistence.
+
+Моделируется USERS продавцов с корзинами и открытыми диалогами; в каждом
+раунде меняется DIRTY_SHARE из них, после чего сохранение сбрасывается.
+PicklePersistence при каждом сбросе перезаписывает файл целиком,
+SQLitePersistence пишет только изменённые строки.
+
+    python -m bench.persistence_bench [users] [rounds]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+# Глобальный db из database.py не должен трогать рабочую базу
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.gettempdir(), 'bench_global.db'))
+
+from telegram.ext import PicklePersistence, PersistenceInput
+
+from database import Database
+from persistence import SQLitePersistence
+
+DIRTY_SHARE = 0.1
+CONVERSATIONS = ('orders_conv', 'sales_conv', 'payment_conv')
+
+
+def make_user_data(rng):
+    return {
+        'seller_id': rng.randint(1, 10_000),
+        'cart': {pid: rng.randint(1, 20) for pid in rng.sample(range(1, 8), rng.randint(1, 4))},
+        'products': [
+            {'id': pid, 'product_name': f'Товар {pid}', 'price': 150 + pid * 10, 'quantity': rng.randint(0, 50)}
+            for pid in range(1, 8)
+        ],
+    }
+
+
+async def run_rounds(persistence, users, rounds, rng):
+    """Возвращает список длительностей flush() в мс"""
+    timings = []
+    for round_no in range(rounds):
+        touched = users if round_no == 0 else rng.sample(users, max(1, int(len(users) * DIRTY_SHARE)))
+        for user_id in touched:
+            await persistence.update_user_data(user_id, make_user_data(rng))
+            await persistence.update_conversation(rng.choice(CONVERSATIONS), (user_id, user_id), rng.randint(0, 3))
+        started = time.perf_counter()
+        await persistence.flush()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summary(name, timings, size, rows):
+    steady = timings[1:] or timings
+    print(f"{name:<20} первый сброс {timings[0]:8.2f} мс | "
+          f"p50 {statistics.median(steady):7.2f} мс | max {max(steady):7.2f} мс | "
+          f"строк {rows:>7} | файл {size / 1024:8.1f} КБ")
+
+
+async def main(user_count=2000, rounds=20):
+    users = list(range(1, user_count + 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        sqlite_persistence = SQLitePersistence(database=Database(db_path))
+        sqlite_timings = await run_rounds(sqlite_persistence, users, rounds, random.Random(1))
+        summary('SQLitePersistence', sqlite_timings, os.path.getsize(db_path), sqlite_persistence.rows_written)
+
+        pickle_path = os.path.join(tmp, 'bench.pickle')
+        pickle_persistence = PicklePersistence(
+            pickle_path,
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            on_flush=True
+        )
+        # PicklePersistence загружает файл лениво при первом обращении
+        await pickle_persistence.get_user_data()
+        for name in CONVERSATIONS:
+            await pickle_persistence.get_conversations(name)
+        pickle_timings = await run_rounds(pickle_persistence, users, rounds, random.Random(1))
+        # Каждый сброс пишет файл целиком – все user_data и все состояния диалогов
+        entries = len(pickle_persistence.user_data) + sum(
+            len(pickle_persistence.conversations[name]) for name in CONVERSATIONS
+        )
+        pickle_rows = rounds * entries
+        summary('PicklePersistence', pickle_timings, os.path.getsize(pickle_path), pickle_rows)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(main(*args))
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Воспроизведение записанного трафика (RECORD_DIR, см. recorder.py).
+
+Снимок БД из заголовка записи копируется в рабочую базу, собирается тот
+же Application, что в bench.load_harness (FakeTelegram вместо HTTP), и
+обновления подаются по одному в исходном порядке – в исходном темпе
+(--speed 1), ускоренно (--speed 10) или без пауз (по умолчанию).
+Одноразовые токены кнопок подтверждения в записи – те, что выдал
+рабочий бот; при воспроизведении они заменяются токенами из кнопок,
+которые бот прислал на этот раз.
+
+Для каждого вида обновления (команда, кнопка, текст) – p50/p99/max
+обработки и на одно обновление: SQL-запросы, соединения, коммиты и
+вызовы API. Число запросов детерминировано, поэтому его рост виден
+сразу; время сравнивается с порогом, как в bench.sql_bench:
+
+    python -m bench.replay records/updates_20260101_120000.ndjson.gz [--speed 1] [--limit N] [--save F] [--compare F]
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+os.environ.setdefault('TRACE_SLOW_MS', '0')
+# Воспроизведение само не записывается
+os.environ['RECORD_DIR'] = ''
+
+from telegram import Update
+
+from bench.load_harness import (
+    LOAD_DB, FakeTelegram, Recorder, Step, _current_step, _record_connection, _record_statement,
+    build_application, percentile,
+)
+from config import config
+from database import db
+from idempotency import TOKEN_SEPARATOR, split_callback_data
+
+# Отклонение от базовой линии, которое считается изменением
+REGRESSION_RATIO = 1.2
+# Меньше стольких обновлений вида – время не сравнивается (слишком шумно)
+MIN_COMPARE = 5
+
+
+def read_recording(path):
+    """(заголовок, [(смещение, обновление)]); оборванный хвост записи пропускается"""
+    header, entries = None, []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                data = json.loads(line)
+                if data.get('type') == 'header':
+                    header = header or data
+                else:
+                    entries.append((data['t'], data['update']))
+        except (EOFError, json.JSONDecodeError) as e:
+            print(f"⚠️ Запись оборвана после {len(entries)} обновлений: {e}")
+    if header is None:
+        raise ValueError(f"{path}: нет заголовка записи")
+    return header, entries
+
+
+def restore_snapshot(path, header):
+    """Снимок из записи становится рабочей базой; админы – как в записи"""
+    snapshot = os.path.join(os.path.dirname(os.path.abspath(path)), header['snapshot'])
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(LOAD_DB + suffix):
+            os.remove(LOAD_DB + suffix)
+    shutil.copyfile(snapshot, LOAD_DB)
+    # Таблицы, появившиеся после записи
+    db.init_db()
+    config.ADMIN_IDS[:] = header['admin_ids']
+
+
+def update_kind(data):
+    """Вид обновления для группировки: команда, кнопка без номеров и токена, текст"""
+    if 'callback_query' in data:
+        base, _ = split_callback_data(data['callback_query'].get('data') or '')
+        return 'cb ' + re.sub(r'\d+', '#', base)
+    message = data.get('message') or data.get('edited_message') or {}
+    text = message.get('text') or ''
+    if text.startswith('/'):
+        return text.split()[0]
+    if message.get('document'):
+        return 'document'
+    return 'text' if text else next(iter(key for key in data if key != 'update_id'), 'other')
+
+
+def refresh_token(telegram, data):
+    """Подставляет в нажатие токен из кнопки, которую бот прислал при воспроизведении"""
+    query = data.get('callback_query')
+    if not query or TOKEN_SEPARATOR not in (query.get('data') or ''):
+        return
+    base, _ = split_callback_data(query['data'])
+    chat_id = (query.get('message') or {}).get('chat', {}).get('id', query['from']['id'])
+    for message in reversed(telegram.chats[chat_id].values()):
+        for row in (message['markup'] or {}).get('inline_keyboard', []):
+            for button in row:
+                if split_callback_data(button.get('callback_data', ''))[0] == base:
+                    query['data'] = button['callback_data']
+                    return
+
+
+async def replay(entries, speed, api_latency):
+    db.statement_listeners.append(_record_statement)
+    db.connection_listeners.append(_record_connection)
+    telegram = FakeTelegram(latency=api_latency)
+    recorder = Recorder()
+    application = build_application(telegram)
+    application.add_error_handler(recorder.on_error)
+
+    kinds = defaultdict(list)
+    max_lag = 0.0
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        for offset, data in entries:
+            if speed:
+                delay = offset / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+            refresh_token(telegram, data)
+            update = Update.de_json(data, application.bot)
+            step = Step()
+            token = _current_step.set(step)
+            update_started = time.perf_counter()
+            try:
+                await application.process_update(update)
+            finally:
+                elapsed = time.perf_counter() - update_started
+                step.open = False
+                _current_step.reset(token)
+            recorder.updates += 1
+            recorder.busy += elapsed
+            kinds[update_kind(data)].append((elapsed, step))
+        wall = time.perf_counter() - started
+        await application.stop()
+    return summarize(kinds, recorder, telegram, wall, max_lag)
+
+
+def summarize(kinds, recorder, telegram, wall, max_lag):
+    result = {
+        'updates': recorder.updates,
+        'wall_seconds': round(wall, 3),
+        'busy_seconds': round(recorder.busy, 3),
+        'updates_per_second': round(recorder.updates / recorder.busy, 1) if recorder.busy else 0.0,
+        'max_lag_ms': round(max_lag * 1000, 1),
+        'api_calls': dict(telegram.calls),
+        'handler_errors': dict(recorder.errors),
+        'kinds': {},
+    }
+    for kind, runs in sorted(kinds.items(), key=lambda item: -sum(run[0] for run in item[1])):
+        latencies = [run[0] * 1000 for run in runs]
+        steps = [run[1] for run in runs]
+        result['kinds'][kind] = {
+            'count': len(runs),
+            'p50_ms': round(percentile(latencies, 0.5), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'max_ms': round(max(latencies), 3),
+            'statements_per_update': round(sum(step.statements for step in steps) / len(runs), 2),
+            'connections_per_update': round(sum(step.connections for step in steps) / len(runs), 2),
+            'commits_per_update': round(sum(step.commits for step in steps) / len(runs), 2),
+            'api_per_update': round(sum(sum(step.api.values()) for step in steps) / len(runs), 2),
+        }
+    return result
+
+
+def print_summary(result):
+    print(f"Обновлений: {result['updates']:,} за {result['wall_seconds']:.1f} с "
+          f"(обработка {result['busy_seconds']:.1f} с, {result['updates_per_second']:,.1f} обновл./с, "
+          f"макс. отставание от записи {result['max_lag_ms']:.0f} мс)")
+    print(f"{'вид':<32} {'кол-во':>7} {'p50 мс':>9} {'p99 мс':>9} {'макс мс':>9} "
+          f"{'SQL/об':>7} {'соед/об':>8} {'ком/об':>7} {'API/об':>7}")
+    for kind, stats in result['kinds'].items():
+        print(f"{kind[:32]:<32} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+              f"{stats['max_ms']:>9.2f} {stats['statements_per_update']:>7.2f} "
+              f"{stats['connections_per_update']:>8.2f} {stats['commits_per_update']:>7.2f} "
+              f"{stats['api_per_update']:>7.2f}")
+    print(f"Вызовы API: {result['api_calls']}")
+    if result['handler_errors']:
+        print(f"Исключения в обработчиках: {result['handler_errors']}")
+
+
+def compare(baseline, current):
+    """Строки отчёта о разнице с базовой линией"""
+    lines = []
+    for kind, stats in current['kinds'].items():
+        old = baseline.get('kinds', {}).get(kind)
+        if old is None:
+            lines.append(f"  {kind:<32} новый")
+            continue
+        marks = []
+        if stats['statements_per_update'] > old['statements_per_update']:
+            marks.append(f"⚠️ SQL {old['statements_per_update']} -> {stats['statements_per_update']}")
+        elif stats['statements_per_update'] < old['statements_per_update']:
+            marks.append(f"✅ SQL {old['statements_per_update']} -> {stats['statements_per_update']}")
+        ratio = stats['p50_ms'] / old['p50_ms'] if old['p50_ms'] else float('inf')
+        if min(stats['count'], old['count']) >= MIN_COMPARE:
+            if ratio >= REGRESSION_RATIO:
+                marks.append('⚠️ медленнее')
+            elif ratio <= 1 / REGRESSION_RATIO:
+                marks.append('✅ быстрее')
+        lines.append(f"  {kind[:32]:<32} p50 {old['p50_ms']:>8.2f} -> {stats['p50_ms']:>8.2f} мс "
+                     f"(x{ratio:.2f})  {'  '.join(marks)}")
+    if current['handler_errors'] != baseline.get('handler_errors', {}):
+        lines.append(f"  исключения: {baseline.get('handler_errors', {})} -> {current['handler_errors']}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений")
+    parser.add_argument('recording', help="файл updates_*.ndjson.gz (снимок БД рядом)")
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help="1 – в исходном темпе, 10 – в 10 раз быстрее, 0 – без пауз")
+    parser.add_argument('--limit', type=int, help="только первые N обновлений")
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help="задержка каждого вызова API")
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--save', help="записать результат в JSON")
+    parser.add_argument('--compare', help="сравнить с сохранённым JSON")
+    args = parser.parse_args(argv)
+
+    import main as bot_main
+    logging.getLogger().setLevel(args.log_level)
+    logging.getLogger(bot_main.__name__).setLevel(args.log_level)
+
+    header, entries = read_recording(args.recording)
+    if args.limit:
+        entries = entries[:args.limit]
+    restore_snapshot(args.recording, header)
+    print(f"{args.recording}: {len(entries)} обновлений от {header['started_at']}, "
+          f"снимок {header['snapshot']}")
+
+    result = asyncio.run(replay(entries, args.speed, args.api_latency_ms / 1000))
+    result.update({
+        'recording': os.path.basename(args.recording),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'sqlite': sqlite3.sqlite_version,
+        'python': platform.python_version(),
+    })
+    print_summary(result)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('recording') != result['recording']:
+            print(f"⚠️ Базовая линия снята на другой записи: {baseline.get('recording')}")
+        print(f"\nСравнение с {args.compare} ({baseline.get('created_at')}):")
+        print('\n'.join(compare(baseline, result)))
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультат записан в {args.save}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
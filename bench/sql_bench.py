@@ -0,0 +1,568 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк SQL-запросов горячих обработчиков.
+
+Запросы взяты дословно из обработчиков (источник указан у каждого) и
+выполняются на синтетических базах bench.generate_dataset трёх размеров:
+10k, 1m и 10m строк. Для каждого обработчика – p50/p99/max времени всех
+его запросов вместе и план EXPLAIN QUERY PLAN каждого запроса. Продавцы
+для параметров берутся случайно (seed фиксирован) и всегда включают
+самого крупного – на нём видны худшие случаи.
+
+Результат сохраняется в JSON (--save) и сравнивается с прошлым (--compare):
+так изменение схемы или индексов оценивается цифрами, а не на глаз.
+Запрос, изменивший план, отмечается отдельно.
+
+Базы кэшируются в --data-dir и переиспользуются; генерация 10m занимает
+около полутора минут и ~0.9 ГБ, поэтому по умолчанию 10k и 1m.
+
+    python -m bench.sql_bench [--datasets 10k,1m,10m] [--iterations N] [--save F] [--compare F]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+# Глобальный db из database.py не должен трогать рабочую базу
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.gettempdir(), 'bench_global.db'))
+
+from bench.generate_dataset import BASE_SIZES, CENTRAL_CODE, generate_dataset
+from slow_queries import format_plan
+
+# Множитель generate_dataset для каждого размера (scale 1 ≈ 370 тыс. строк).
+# Каталог товаров от объёма истории не растёт – всегда 30 позиций
+DATASETS = {
+    '10k': 0.027,
+    '1m': 2.7,
+    '10m': 27,
+}
+DEFAULT_DATASETS = ('10k', '1m')
+
+SEED = 1
+WARMUP = 3
+# Сколько продавцов перебирать в параметрах
+SELLER_SAMPLE = 50
+
+# Отклонение от базовой линии, которое считается изменением
+REGRESSION_RATIO = 1.2
+
+
+# ---- Запросы обработчиков ----
+
+SELLER_BY_TELEGRAM = "SELECT id FROM sellers WHERE telegram_id = ?"
+
+STOCK_PRODUCTS = """
+            SELECT
+                p.product_name,
+                COALESCE(sp.quantity, 0) as stock_quantity,
+                p.price,
+                COALESCE(SUM(s.quantity), 0) as sold_quantity
+            FROM products p
+            LEFT JOIN seller_products sp ON sp.product_id = p.id AND sp.seller_id = ?
+            LEFT JOIN sales s ON s.product_id = p.id AND s.seller_id = ?
+            WHERE p.is_active = 1
+            GROUP BY p.id
+            ORDER BY p.product_name
+        """
+
+STOCK_PENDING = "SELECT pending_amount FROM seller_pending WHERE seller_id = ?"
+
+SALES_TOTALS = """
+            SELECT
+                COUNT(*) as total_sales,
+                COALESCE(SUM(quantity), 0) as total_quantity,
+                COALESCE(SUM(amount), 0) as total_amount
+            FROM sales
+            WHERE date(created_at) >= ? AND date(created_at) < ?
+        """
+
+SALES_BY_SELLER = """
+            SELECT
+                s.seller_code,
+                s.full_name,
+                COUNT(*) as sales_count,
+                COALESCE(SUM(sa.quantity), 0) as total_quantity,
+                COALESCE(SUM(sa.amount), 0) as total_amount
+            FROM sales sa
+            JOIN sellers s ON sa.seller_id = s.id
+            WHERE date(sa.created_at) >= ? AND date(sa.created_at) < ?
+            GROUP BY s.id
+            ORDER BY total_amount DESC
+        """
+
+SALES_BY_PRODUCT = """
+            SELECT
+                p.product_name,
+                COUNT(*) as sales_count,
+                COALESCE(SUM(sa.quantity), 0) as total_quantity,
+                COALESCE(SUM(sa.amount), 0) as total_amount
+            FROM sales sa
+            JOIN products p ON sa.product_id = p.id
+            WHERE date(sa.created_at) >= ? AND date(sa.created_at) < ?
+            GROUP BY p.id
+            ORDER BY total_amount DESC
+        """
+
+ALL_SELLERS = """
+            SELECT
+                s.id,
+                s.seller_code,
+                s.full_name,
+                s.is_active,
+                COALESCE(sd.total_debt, 0) as total_debt,
+                COALESCE(sp.pending_amount, 0) as pending_amount,
+                (SELECT COUNT(*) FROM orders WHERE seller_id = s.id AND status = 'new') as new_orders,
+                (SELECT COUNT(*) FROM orders WHERE seller_id = s.id AND status = 'shipped') as shipped_orders,
+                (SELECT COUNT(*) FROM orders WHERE seller_id = s.id AND status = 'completed') as completed_orders
+            FROM sellers s
+            LEFT JOIN seller_debt sd ON s.id = sd.seller_id
+            LEFT JOIN seller_pending sp ON s.id = sp.seller_id
+            ORDER BY s.seller_code
+        """
+
+ALL_SELLERS_TOTALS = """
+            SELECT
+                COUNT(*) as total_sellers,
+                SUM(CASE WHEN is_active = 1 THEN 1 ELSE 0 END) as active_sellers,
+                SUM(COALESCE(sd.total_debt, 0)) as total_debt_sum,
+                SUM(COALESCE(sp.pending_amount, 0)) as total_pending_sum
+            FROM sellers s
+            LEFT JOIN seller_debt sd ON s.id = sd.seller_id
+            LEFT JOIN seller_pending sp ON s.id = sp.seller_id
+        """
+
+PAYMENTS_STATS = """
+            SELECT
+                COUNT(*) as total_requests,
+                SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending_count,
+                SUM(CASE WHEN status = 'approved' THEN 1 ELSE 0 END) as approved_count,
+                SUM(CASE WHEN status = 'rejected' THEN 1 ELSE 0 END) as rejected_count,
+                COALESCE(SUM(CASE WHEN status = 'approved' THEN amount ELSE 0 END), 0) as total_approved_amount
+            FROM payment_requests
+        """
+
+PAYMENTS_RECENT = """
+            SELECT
+                pr.request_number,
+                pr.amount,
+                pr.status,
+                pr.created_at,
+                pr.approved_at,
+                s.seller_code,
+                s.full_name
+            FROM payment_requests pr
+            JOIN sellers s ON pr.seller_id = s.id
+            ORDER BY pr.created_at DESC
+            LIMIT 10
+        """
+
+PAYMENTS_BY_SELLER = """
+            SELECT
+                s.seller_code,
+                s.full_name,
+                COUNT(pr.id) as requests_count,
+                COALESCE(SUM(pr.amount), 0) as total_amount
+            FROM sellers s
+            LEFT JOIN payment_requests pr ON s.id = pr.seller_id AND pr.status = 'approved'
+            GROUP BY s.id
+            HAVING requests_count > 0
+            ORDER BY total_amount DESC
+        """
+
+TOTAL_STOCK = """
+            SELECT p.product_name, COALESCE(SUM(sp.quantity), 0) as total_quantity
+            FROM products p
+            LEFT JOIN seller_products sp ON p.id = sp.product_id
+            WHERE p.is_active = 1
+            GROUP BY p.id
+            ORDER BY p.product_name
+        """
+
+ORDERS_NEW = """
+            SELECT o.id, o.order_number, o.seller_code, o.created_at,
+                   GROUP_CONCAT(p.product_name || ' ' || oi.quantity_ordered || ' упак') as items,
+                   SUM(oi.quantity_ordered * oi.price_at_order) as total
+            FROM orders o
+            JOIN order_items oi ON o.id = oi.order_id
+            JOIN products p ON oi.product_id = p.id
+            WHERE o.status = 'new'
+            GROUP BY o.id
+            ORDER BY o.created_at ASC
+        """
+
+PAYMENTS_PENDING = """
+            SELECT pr.id, pr.request_number, pr.amount, pr.created_at,
+                   s.seller_code, s.full_name
+            FROM payment_requests pr
+            JOIN sellers s ON pr.seller_id = s.id
+            WHERE pr.status = 'pending'
+            ORDER BY pr.created_at ASC
+        """
+
+MY_ORDERS = """
+            SELECT o.order_number, o.status, o.created_at,
+                   GROUP_CONCAT(p.product_name || ' ' || oi.quantity_ordered || ' упак') as items
+            FROM orders o
+            LEFT JOIN order_items oi ON o.id = oi.order_id
+            LEFT JOIN products p ON oi.product_id = p.id
+            WHERE o.seller_id = ?
+            GROUP BY o.id
+            ORDER BY o.created_at DESC
+            LIMIT 10
+        """
+
+CENTRAL_SELLER = "SELECT id FROM sellers WHERE seller_code = 'Р'"
+
+RESTOCK_PRODUCTS = """
+            SELECT
+                p.id,
+                p.product_name,
+                COALESCE(sp.quantity, 0) as current_stock,
+                COALESCE((
+                    SELECT SUM(ri.quantity_requested)
+                    FROM restock_items ri
+                    JOIN restock_requests rr ON ri.request_id = rr.id
+                    WHERE ri.product_id = p.id AND rr.status = 'pending'
+                ), 0) as pending_requests
+            FROM products p
+            LEFT JOIN seller_products sp ON sp.product_id = p.id AND sp.seller_id = ?
+            WHERE p.is_active = 1
+            ORDER BY p.product_name
+        """
+
+SALE_NUMBER = """
+            SELECT COUNT(*) FROM sales
+            WHERE seller_id = ? AND date(created_at) = date('now')
+        """
+
+RESTOCK_NUMBER = """
+            SELECT COUNT(*) FROM restock_requests
+            WHERE seller_code = ? AND date(created_at) = date('now')
+        """
+
+ORDER_NUMBER = """
+            SELECT COUNT(*) FROM orders
+            WHERE seller_code = ? AND date(created_at) = date('now')
+        """
+
+PAYMENT_NUMBER = """
+            SELECT COUNT(*) FROM payment_requests
+            WHERE seller_id = ? AND date(created_at) = date('now')
+        """
+
+
+def _month_bounds(today):
+    start = today.replace(day=1)
+    if today.month == 12:
+        return start, today.replace(year=today.year + 1, month=1, day=1)
+    return start, today.replace(month=today.month + 1, day=1)
+
+
+def _period(name):
+    """Границы периода так же, как в reports.sales_period"""
+    today = datetime.now().date()
+    if name == 'today':
+        start, end = today, today + timedelta(days=1)
+    elif name == 'month':
+        start, end = _month_bounds(today)
+    else:
+        start, end = date(2000, 1, 1), today + timedelta(days=1)
+    return (start.isoformat(), end.isoformat())
+
+
+# Обработчик -> (источник, [(имя запроса, SQL, параметры от продавца)])
+HANDLERS = {
+    'stock_start': ('handlers/seller/stock.py', [
+        ('seller', SELLER_BY_TELEGRAM, lambda s: (s['telegram_id'],)),
+        ('products', STOCK_PRODUCTS, lambda s: (s['id'], s['id'])),
+        ('pending', STOCK_PENDING, lambda s: (s['id'],)),
+    ]),
+    'sales_period[today]': ('handlers/admin/reports.py', [
+        ('totals', SALES_TOTALS, lambda s: _period('today')),
+        ('by_seller', SALES_BY_SELLER, lambda s: _period('today')),
+        ('by_product', SALES_BY_PRODUCT, lambda s: _period('today')),
+    ]),
+    'sales_period[month]': ('handlers/admin/reports.py', [
+        ('totals', SALES_TOTALS, lambda s: _period('month')),
+        ('by_seller', SALES_BY_SELLER, lambda s: _period('month')),
+        ('by_product', SALES_BY_PRODUCT, lambda s: _period('month')),
+    ]),
+    'sales_period[all]': ('handlers/admin/reports.py', [
+        ('totals', SALES_TOTALS, lambda s: _period('all')),
+        ('by_seller', SALES_BY_SELLER, lambda s: _period('all')),
+        ('by_product', SALES_BY_PRODUCT, lambda s: _period('all')),
+    ]),
+    'report_all_sellers': ('handlers/admin/reports.py', [
+        ('sellers', ALL_SELLERS, lambda s: ()),
+        ('totals', ALL_SELLERS_TOTALS, lambda s: ()),
+    ]),
+    'report_payments': ('handlers/admin/reports.py', [
+        ('stats', PAYMENTS_STATS, lambda s: ()),
+        ('recent', PAYMENTS_RECENT, lambda s: ()),
+        ('by_seller', PAYMENTS_BY_SELLER, lambda s: ()),
+    ]),
+    'total_stock': ('handlers/admin/reports.py', [
+        ('totals', TOTAL_STOCK, lambda s: ()),
+    ]),
+    'admin_orders_new': ('handlers/admin/orders.py', [
+        ('orders', ORDERS_NEW, lambda s: ()),
+    ]),
+    'payments_pending': ('handlers/admin/payments.py', [
+        ('requests', PAYMENTS_PENDING, lambda s: ()),
+    ]),
+    'my_orders': ('handlers/seller/orders.py', [
+        ('seller', SELLER_BY_TELEGRAM, lambda s: (s['telegram_id'],)),
+        ('orders', MY_ORDERS, lambda s: (s['id'],)),
+    ]),
+    'restock_admin_start': ('handlers/admin/restock.py', [
+        ('central', CENTRAL_SELLER, lambda s: ()),
+        ('products', RESTOCK_PRODUCTS, lambda s: (s['central_id'],)),
+    ]),
+    'sale_number': ('handlers/seller/sales.py', [
+        ('count', SALE_NUMBER, lambda s: (s['id'],)),
+    ]),
+    'restock_number': ('handlers/seller/restock.py', [
+        ('count', RESTOCK_NUMBER, lambda s: (CENTRAL_CODE,)),
+    ]),
+    'order_number': ('handlers/seller/orders.py, handlers/seller/shipments.py', [
+        ('count', ORDER_NUMBER, lambda s: (s['seller_code'],)),
+    ]),
+    'payment_number': ('handlers/seller/payment.py', [
+        ('count', PAYMENT_NUMBER, lambda s: (s['id'],)),
+    ]),
+}
+
+
+# ---- Базы ----
+
+def dataset_path(data_dir, name):
+    return os.path.join(data_dir, f"bench_{name}_seed{SEED}.db")
+
+
+def ensure_dataset(data_dir, name):
+    """Путь к базе размера name; генерирует её, если ещё нет"""
+    path = dataset_path(data_dir, name)
+    if os.path.exists(path):
+        return path
+    scale = DATASETS[name]
+    sizes = {
+        'products': BASE_SIZES['products'],
+        'sellers': max(20, int(BASE_SIZES['sellers'] * scale)),
+    }
+    print(f"Генерация {name} в {path}...", flush=True)
+    started = time.perf_counter()
+    partial = f"{path}.partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    # Запросы обработчиков считают "сегодня" и "этот месяц" от date('now'),
+    # поэтому данные здесь заканчиваются сегодняшним днём
+    counts = generate_dataset(partial, scale=scale, seed=SEED, sizes=sizes, end_date=date.today())
+    os.replace(partial, path)
+    counts.pop('sales_skipped', None)
+    print(f"  {sum(counts.values()):,} строк за {time.perf_counter() - started:.1f} с", flush=True)
+    return path
+
+
+def pick_sellers(conn, rng):
+    """Случайные продавцы плюс самый крупный по продажам"""
+    rows = conn.execute("""
+        SELECT s.id, s.telegram_id, s.seller_code, COUNT(sa.id) as sales
+        FROM sellers s
+        LEFT JOIN sales sa ON sa.seller_id = s.id
+        WHERE s.seller_code != ?
+        GROUP BY s.id
+    """, (CENTRAL_CODE,)).fetchall()
+    central_id = conn.execute("SELECT id FROM sellers WHERE seller_code = ?", (CENTRAL_CODE,)).fetchone()[0]
+    sellers = [dict(row, central_id=central_id) for row in rows]
+    biggest = max(sellers, key=lambda s: s['sales'])
+    sample = rng.sample(sellers, min(SELLER_SAMPLE - 1, len(sellers)))
+    if biggest not in sample:
+        sample.append(biggest)
+    return sample
+
+
+def table_rows(conn):
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+
+
+# ---- Измерения ----
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def explain(conn, sql, params):
+    return format_plan(conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall())
+
+
+def run_handler(conn, statements, sellers, iterations, max_seconds):
+    """Выполняет запросы обработчика iterations раз (не дольше max_seconds); времена в мс"""
+    timings = []
+    per_statement = {name: [] for name, _, _ in statements}
+    rows = {}
+    for i in range(WARMUP):
+        for _, sql, params in statements:
+            conn.execute(sql, params(sellers[i % len(sellers)])).fetchall()
+
+    deadline = time.perf_counter() + max_seconds
+    for i in range(iterations):
+        seller = sellers[i % len(sellers)]
+        total = 0.0
+        for name, sql, params in statements:
+            started = time.perf_counter()
+            result = conn.execute(sql, params(seller)).fetchall()
+            elapsed = time.perf_counter() - started
+            per_statement[name].append(elapsed * 1000)
+            rows[name] = max(rows.get(name, 0), len(result))
+            total += elapsed
+        timings.append(total * 1000)
+        if time.perf_counter() > deadline:
+            break
+
+    def summary(values):
+        return {
+            'p50_ms': round(percentile(values, 0.5), 3),
+            'p99_ms': round(percentile(values, 0.99), 3),
+            'max_ms': round(max(values), 3),
+        }
+
+    result = summary(timings)
+    result['runs'] = len(timings)
+    result['statements'] = {
+        name: dict(
+            summary(per_statement[name]),
+            rows=rows[name],
+            plan=explain(conn, sql, params(sellers[0]))
+        )
+        for name, sql, params in statements
+    }
+    return result
+
+
+def bench_dataset(path, handlers, iterations, max_seconds):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        rng = random.Random(SEED)
+        sellers = pick_sellers(conn, rng)
+        rng.shuffle(sellers)
+        result = {'tables': table_rows(conn), 'handlers': {}}
+        for name in handlers:
+            source, statements = HANDLERS[name]
+            data = run_handler(conn, statements, sellers, iterations, max_seconds)
+            data['source'] = source
+            result['handlers'][name] = data
+            print(f"  {name:<24} p50 {data['p50_ms']:>9.3f}  p99 {data['p99_ms']:>9.3f}  "
+                  f"max {data['max_ms']:>9.3f} мс  ({data['runs']} прогонов)", flush=True)
+        return result
+    finally:
+        conn.close()
+
+
+# ---- Сравнение ----
+
+def compare(baseline, current):
+    """Строки отчёта о разнице с базовой линией"""
+    lines = []
+    for dataset, data in current['datasets'].items():
+        base = baseline.get('datasets', {}).get(dataset)
+        if base is None:
+            lines.append(f"{dataset}: нет в базовой линии")
+            continue
+        lines.append(f"{dataset}:")
+        for name, handler in data['handlers'].items():
+            old = base['handlers'].get(name)
+            if old is None:
+                lines.append(f"  {name:<24} новый")
+                continue
+            ratio = handler['p50_ms'] / old['p50_ms'] if old['p50_ms'] else float('inf')
+            mark = ''
+            if ratio >= REGRESSION_RATIO:
+                mark = '  ⚠️ медленнее'
+            elif ratio <= 1 / REGRESSION_RATIO:
+                mark = '  ✅ быстрее'
+            lines.append(f"  {name:<24} p50 {old['p50_ms']:>9.3f} -> {handler['p50_ms']:>9.3f} мс "
+                         f"(x{ratio:.2f}), p99 {old['p99_ms']:.3f} -> {handler['p99_ms']:.3f}{mark}")
+            for statement, stats in handler['statements'].items():
+                old_plan = old['statements'].get(statement, {}).get('plan')
+                if old_plan is not None and old_plan != stats['plan']:
+                    lines.append(f"    план {statement} изменился:")
+                    lines.extend(f"      - {line}" for line in old_plan)
+                    lines.extend(f"      + {line}" for line in stats['plan'])
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк SQL-запросов обработчиков")
+    parser.add_argument('--datasets', default=','.join(DEFAULT_DATASETS),
+                        help=f"размеры через запятую: {', '.join(DATASETS)}")
+    parser.add_argument('--handlers', help="только эти обработчики (через запятую)")
+    parser.add_argument('--iterations', type=int, default=200, help="прогонов на обработчик")
+    parser.add_argument('--max-seconds', type=float, default=10.0, help="не дольше стольких секунд на обработчик")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'bot_bench'),
+                        help="каталог для сгенерированных баз")
+    parser.add_argument('--save', help="записать результат в JSON")
+    parser.add_argument('--compare', help="сравнить с сохранённым JSON")
+    parser.add_argument('--plans', action='store_true', help="вывести планы запросов")
+    args = parser.parse_args(argv)
+
+    datasets = [name.strip() for name in args.datasets.split(',') if name.strip()]
+    unknown = [name for name in datasets if name not in DATASETS]
+    handlers = [name.strip() for name in args.handlers.split(',')] if args.handlers else list(HANDLERS)
+    unknown += [name for name in handlers if name not in HANDLERS]
+    if unknown:
+        parser.error(f"неизвестно: {', '.join(unknown)}")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    result = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'sqlite': sqlite3.sqlite_version,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'iterations': args.iterations,
+        'datasets': {},
+    }
+    for name in datasets:
+        path = ensure_dataset(args.data_dir, name)
+        print(f"{name} ({os.path.getsize(path) / 1024 / 1024:.1f} МБ):", flush=True)
+        result['datasets'][name] = bench_dataset(path, handlers, args.iterations, args.max_seconds)
+
+    if args.plans:
+        # Планы от размера почти не зависят – выводим для самого большого
+        last = result['datasets'][datasets[-1]]['handlers']
+        for name, handler in last.items():
+            print(f"\n{name} ({handler['source']}):")
+            for statement, stats in handler['statements'].items():
+                print(f"  {statement}: p50 {stats['p50_ms']:.3f} мс, строк {stats['rows']}")
+                print('\n'.join(f"    {line}" for line in stats['plan']))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nСравнение с {args.compare} ({baseline.get('created_at')}, SQLite {baseline.get('sqlite')}):")
+        print('\n'.join(compare(baseline, result)))
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультат записан в {args.save}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
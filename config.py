@@ -31,4 +31,72 @@ class Config:
     # Режим отладки
     DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 
+    # Максимальная длина очереди входящих обновлений (0 – без ограничения)
+    UPDATE_QUEUE_MAXSIZE = int(os.getenv('UPDATE_QUEUE_MAXSIZE', '500'))
+
+    # Интервал (сек) записи состояний диалогов и user_data в БД
+    PERSISTENCE_INTERVAL = float(os.getenv('PERSISTENCE_INTERVAL', '10'))
+
+    # Через сколько секунд бездействия диалог завершается
+    CONVERSATION_TIMEOUT = int(os.getenv('CONVERSATION_TIMEOUT', '900'))
+
+    # Через сколько секунд бездействия удаляется user_data и как часто это проверяется
+    SESSION_TTL = int(os.getenv('SESSION_TTL', '3600'))
+    SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', '300'))
+
+    # Лимиты исходящих сообщений (в секунду) и число повторов при флуд-контроле
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))
+    OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+
+    # Доставка уведомлений из outbox: период опроса и базовая задержка повтора (сек)
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+    OUTBOX_BACKOFF_BASE = int(os.getenv('OUTBOX_BACKOFF_BASE', '5'))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+
+    # Окно (сек), за которое однотипные уведомления админам собираются в сводку (0 – сразу)
+    ADMIN_DIGEST_WINDOW = int(os.getenv('ADMIN_DIGEST_WINDOW', '60'))
+
+    # Адрес сервера метрик Prometheus в режиме polling (порт 0 – не запускать)
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+
+    # Трассировка: порог медленного обновления (мс, 0 – не писать), доля случайных трасс и файл NDJSON
+    TRACE_SLOW_MS = int(os.getenv('TRACE_SLOW_MS', '1000'))
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+    TRACE_FILE = os.getenv('TRACE_FILE', 'traces.ndjson')
+
+    # SQL-запрос дольше стольких мс логируется с планом EXPLAIN QUERY PLAN (0 – не логировать)
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', '50'))
+
+    # Бюджет SQL-запросов на одно обновление и порог повторов одного запроса (N+1); 0 – не проверять
+    SQL_BUDGET = int(os.getenv('SQL_BUDGET', '40'))
+    SQL_REPEAT_LIMIT = int(os.getenv('SQL_REPEAT_LIMIT', '5'))
+
+    # Одно соединение и одна транзакция на обновление (0 – соединение на каждое обращение к БД)
+    UNIT_OF_WORK = os.getenv('UNIT_OF_WORK', '1') == '1'
+
+    # Журнал действий: записей в пакете, задержка записи (мс) и предел буфера
+    AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '100'))
+    AUDIT_FLUSH_MS = int(os.getenv('AUDIT_FLUSH_MS', '1000'))
+    AUDIT_MAX_PENDING = int(os.getenv('AUDIT_MAX_PENDING', '10000'))
+
+    # Ротация журнала: записи старше N дней (0 – хранить в таблице) уходят в помесячный архив
+    AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', '90'))
+    # По умолчанию рядом с БД – на том же постоянном диске
+    AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR') or os.path.join(os.path.dirname(DATABASE_PATH), 'audit_archive')
+    AUDIT_ARCHIVE_INTERVAL = int(os.getenv('AUDIT_ARCHIVE_INTERVAL', '3600'))
+
+    # Сторож цикла событий: период замера задержки (сек) и порог остановки (мс, 0 – выключен)
+    LOOP_WATCHDOG_INTERVAL = float(os.getenv('LOOP_WATCHDOG_INTERVAL', '0.1'))
+    LOOP_STALL_MS = int(os.getenv('LOOP_STALL_MS', '200'))
+
+    # Адрес Bot API (для локального сервера bench.fake_bot_api или своего telegram-bot-api)
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+    TELEGRAM_FILE_URL = os.getenv('TELEGRAM_FILE_URL', 'https://api.telegram.org/file/bot')
+
+    # Каталог записи обезличенных обновлений для bench.replay (пусто – не записывать)
+    RECORD_DIR = os.getenv('RECORD_DIR', '')
+
 config = Config()
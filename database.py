@@ -3,31 +3,478 @@
 
 """
 Работа с базой данных SQLite
+
+DATABASE_PATH=":memory:" – база в памяти на одном закреплённом соединении:
+все обращения экземпляра Database идут через него по очереди (блок
+get_connection() – точка сохранения в текущей транзакции), поэтому
+блокировок между соединениями не бывает. Изоляции между задачами тоже нет –
+режим для тестов и бенчмарков.
+Каждый Database(":memory:") – отдельная база; Database(":memory:", source=template)
+копирует готовую (в ~10 раз быстрее создания схемы), use_database()
+подменяет глобальный db в текущем контексте (тесты, бенчмарки).
+
+Единица работы (begin_unit_of_work/finish_unit_of_work, см. middleware.py):
+все get_connection() задачи, обрабатывающей обновление, получают одно
+соединение, каждый блок with – точка сохранения в общей транзакции,
+которая фиксируется одним коммитом в конце обновления.
 """
 
+import asyncio
+import contextvars
+import re
 import sqlite3
+import secrets
+import time
+from collections import Counter
 from datetime import datetime
 from contextlib import contextmanager
+from functools import lru_cache
 
 from config import config
+from audit import AuditWriter
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Приводит запрос к виду без литералов и лишних пробелов (для группировки в статистике)"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    # IN (?, ?, ?) с разным числом элементов – один и тот же запрос
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+def _current_task():
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+class StatementCounter:
+    """Запросы одного обновления: всего, по виду (normalize_sql) и соединения"""
+    __slots__ = ('task', 'statements', 'shapes', 'connections')
+    
+    def __init__(self):
+        self.task = _current_task()
+        self.statements = 0
+        self.shapes = Counter()
+        self.connections = 0
+    
+    def repeated(self, threshold):
+        """Виды запросов, выполненные не меньше threshold раз (признак N+1)"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+# Счётчик обрабатываемого обновления (см. Database.start_statement_count)
+_statement_counter = contextvars.ContextVar('statement_counter', default=None)
+
+def _raw_execute(conn, sql):
+    # Служебные команды транзакции – мимо TracedCursor, в статистику запросов не попадают
+    return sqlite3.Cursor(conn).execute(sql)
+
+class UnitOfWork:
+    """
+    Одно соединение и одна транзакция на обновление. Блок get_connection()
+    внутри – точка сохранения: ошибка в блоке откатывает только его, как
+    раньше откатывалось его отдельное соединение.
+    
+    Транзакцию открывает первая запись (неявный BEGIN модуля sqlite3), а
+    курсоры блока закрываются при выходе из него: чтение не держит
+    блокировку, пока обработчик ждёт ответа Telegram, и писатели на том же
+    цикле событий (outbox, persistence, журнал) не упираются в busy timeout.
+    Записанное перед запросом в сеть фиксируется и внутри блока; ошибка
+    блока после этого откатывает только записанное позже.
+    """
+    __slots__ = ('task', 'database', 'conn', 'depth', 'opened_at', 'commits', 'changes', 'failed')
+    
+    def __init__(self, database):
+        self.task = _current_task()
+        self.database = database
+        self.conn = None        # открывается при первом обращении к БД
+        self.depth = 0
+        self.opened_at = None
+        self.commits = 0
+        self.changes = 0        # conn.total_changes на момент последнего коммита
+        self.failed = False     # был откат (блока или всей транзакции)
+    
+    @property
+    def dirty(self):
+        """В транзакции есть изменения, и её коммит всё равно будет"""
+        return self.conn is not None and self.conn.total_changes != self.changes
+    
+    @contextmanager
+    def block(self):
+        if self.conn is None:
+            self.conn = self.database._open()
+            self.opened_at = time.perf_counter()
+        conn = self.conn
+        # Точка сохранения нужна, только если до блока уже что-то записано;
+        # иначе транзакция, если она появится, целиком принадлежит блоку
+        name = None
+        if conn.in_transaction:
+            name = f"uow_{self.depth}"
+            _raw_execute(conn, f"SAVEPOINT {name}")
+        # Коммит или откат внутри блока (перед запросом в сеть) снимает его точку сохранения
+        generation = conn.generation
+        cursors = len(conn.cursors)
+        self.depth += 1
+        try:
+            yield conn
+        except Exception as e:
+            if conn.in_transaction:
+                if name is None or conn.generation != generation:
+                    conn.rollback()
+                    conn.generation += 1
+                else:
+                    _raw_execute(conn, f"ROLLBACK TO {name}")
+                    _raw_execute(conn, f"RELEASE {name}")
+            self.failed = True
+            self.database.pool_stats['rollbacks'] += 1
+            raise e
+        else:
+            if name is not None and conn.generation == generation:
+                _raw_execute(conn, f"RELEASE {name}")
+        finally:
+            self.depth -= 1
+            # Недочитанная выборка держит SHARED-блокировку и вне транзакции
+            for cursor in conn.cursors[cursors:]:
+                cursor.close()
+            del conn.cursors[cursors:]
+    
+    def commit(self):
+        if self.conn is not None and self.conn.in_transaction:
+            self.conn.commit()
+            self.conn.generation += 1
+            self.changes = self.conn.total_changes
+            self.commits += 1
+            self.database.pool_stats['commits'] += 1
+    
+    def rollback(self):
+        if self.conn is not None and self.conn.in_transaction:
+            self.conn.rollback()
+            self.conn.generation += 1
+            self.changes = self.conn.total_changes
+            self.failed = True
+            self.database.pool_stats['rollbacks'] += 1
+    
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.commit()
+        except Exception as e:
+            self.conn.rollback()
+            self.failed = True
+            self.database.pool_stats['rollbacks'] += 1
+            raise e
+        finally:
+            self.conn.close()
+            self.conn = None
+            self.database.pool_stats['open'] -= 1
+            for listener in self.database.connection_listeners:
+                listener(time.perf_counter() - self.opened_at, self.commits, self.failed)
+
+# Единица работы обрабатываемого обновления (см. Database.begin_unit_of_work)
+_unit_of_work = contextvars.ContextVar('unit_of_work', default=None)
+
+MEMORY = ':memory:'
+
+class TracedCursor(sqlite3.Cursor):
+    """Курсор, сообщающий Database о времени каждого запроса"""
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.database._statement_done(sql, parameters, time.perf_counter() - started)
+    
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.database._statement_done(sql, None, time.perf_counter() - started)
+
+class TracedConnection(sqlite3.Connection):
+    """Соединение, все курсоры которого – TracedCursor (в т.ч. conn.execute)"""
+    database = None
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Курсоры открытых блоков единицы работы (закрываются при выходе из блока)
+        self.cursors = []
+        # Число коммитов и откатов единицы работы (см. UnitOfWork.block)
+        self.generation = 0
+    
+    def cursor(self, factory=None):
+        cursor = super().cursor(factory or TracedCursor)
+        self.cursors.append(cursor)
+        return cursor
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class PinnedConnection(TracedConnection):
+    """Единственное соединение базы в памяти: close() его не закрывает"""
+    
+    def close(self):
+        pass
+    
+    def release(self):
+        super().close()
+
+class ServiceConnection:
+    """
+    Database.connect() базы в памяти: то же закреплённое соединение, но
+    курсоры без трассировки и со своим row_factory; close() ничего не делает
+    """
+    
+    def __init__(self, conn):
+        self._conn = conn
+        self.row_factory = None
+    
+    def cursor(self):
+        cursor = sqlite3.Cursor(self._conn)
+        cursor.row_factory = self.row_factory
+        return cursor
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def close(self):
+        pass
+    
+    def __getattr__(self, name):
+        # commit, rollback, backup, iterdump, in_transaction
+        return getattr(self._conn, name)
 
 class Database:
-    def __init__(self, db_path):
+    def __init__(self, db_path, source=None):
         self.db_path = db_path
-        self.init_db()
+        self._pinned = None
+        if db_path == MEMORY:
+            # Общий кэш по URI блокирует таблицы без ожидания (SQLITE_LOCKED),
+            # поэтому у базы в памяти одно соединение на всех
+            self._pinned = sqlite3.connect(MEMORY, factory=PinnedConnection, check_same_thread=False)
+            self._pinned.database = self
+            self._pinned.row_factory = sqlite3.Row
+        # Подписчики на выполненные запросы: listener(sql, parameters, seconds)
+        self.statement_listeners = []
+        # Подписчики на закрытые соединения: listener(seconds_open, commits, failed) –
+        # число коммитов с изменениями (у единицы работы их может быть несколько,
+        # 0 – только чтение) и был ли откат
+        self.connection_listeners = []
+        # Соединения не переиспользуются (кроме единицы работы), поэтому "пул" – это счётчики открытий
+        self.pool_stats = {'opened': 0, 'open': 0, 'commits': 0, 'rollbacks': 0}
+        # Журнал действий пишется пакетами (см. log_action)
+        self.audit = AuditWriter(self)
+        if source is not None:
+            # Схема и данные другой базы целиком (backup API)
+            source_conn, conn = source.connect(), self._connect()
+            try:
+                source_conn.backup(getattr(conn, '_conn', conn))
+            finally:
+                source_conn.close()
+                conn.close()
+        else:
+            self.init_db()
+    
+    def _statement_done(self, sql, parameters, seconds):
+        counter = self._counter()
+        if counter is not None:
+            counter.statements += 1
+            counter.shapes[normalize_sql(sql)] += 1
+        for listener in self.statement_listeners:
+            listener(sql, parameters, seconds)
+    
+    def _counter(self):
+        counter = _statement_counter.get()
+        # Задачи JobQueue, созданные обработчиком, наследуют его контекст – их не считаем
+        if counter is None or counter.task is not _current_task():
+            return None
+        return counter
+    
+    def start_statement_count(self):
+        """Начинает подсчёт запросов текущей задачи (обновления); возвращает счётчик"""
+        counter = StatementCounter()
+        _statement_counter.set(counter)
+        return counter
+    
+    def stop_statement_count(self):
+        """Заканчивает подсчёт; возвращает счётчик или None, если он не начинался"""
+        counter = _statement_counter.get()
+        _statement_counter.set(None)
+        return counter
+    
+    @property
+    def in_memory(self):
+        return self._pinned is not None
+    
+    def connect(self, **kwargs):
+        """
+        Обычное соединение с этой базой (без трассировки и учёта) – для бэкапов
+        и служебных задач. Единица работы текущей задачи сначала фиксируется:
+        иначе её блокировки не дали бы этому соединению писать, а бэкап не
+        увидел бы только что сделанных изменений.
+        """
+        self.commit_unit_of_work()
+        return self._connect(**kwargs)
+    
+    def _connect(self, **kwargs):
+        if self._pinned is not None:
+            return ServiceConnection(self._pinned)
+        return sqlite3.connect(self.db_path, **kwargs)
+    
+    def close(self):
+        """Сбрасывает буфер журнала и освобождает базу в памяти"""
+        self.audit.flush()
+        if self._pinned is not None:
+            self._pinned.release()
+            self._pinned = None
+    
+    # ---- Единица работы ----
+    def _unit(self):
+        unit = _unit_of_work.get()
+        # Задачи JobQueue, созданные обработчиком, наследуют его контекст – у них свои соединения
+        if unit is None or unit.task is not _current_task() or unit.database is not self:
+            return None
+        return unit
+    
+    def begin_unit_of_work(self):
+        """
+        Начинает единицу работы текущей задачи (обновления): дальше все
+        get_connection() этой задачи идут через одно соединение и одну транзакцию
+        """
+        # Предыдущее обновление могло не дойти до finish (ApplicationHandlerStop)
+        self.finish_unit_of_work()
+        unit = UnitOfWork(self)
+        _unit_of_work.set(unit)
+        return unit
+    
+    def commit_unit_of_work(self):
+        """
+        Фиксирует накопленное единицей работы, не закрывая её соединение –
+        перед запросом в сеть блокировки БД держать нельзя, в том числе
+        внутри блока get_connection() (см. UnitOfWork.block).
+        """
+        unit = self._unit()
+        if unit is not None:
+            unit.commit()
+    
+    def rollback_unit_of_work(self):
+        """
+        Откатывает незафиксированное единицей работы (в т.ч. погашение токена
+        в idempotent_callback) – для обработчиков, которые сами ловят ошибку
+        и отвечают пользователю, а не пробрасывают её в Database.atomic()
+        """
+        unit = self._unit()
+        if unit is not None and unit.depth == 0:
+            unit.rollback()
+    
+    def finish_unit_of_work(self):
+        """Фиксирует и закрывает единицу работы; возвращает её или None, если её не было"""
+        unit = self._unit()
+        if unit is None:
+            return None
+        _unit_of_work.set(None)
+        unit.close()
+        return unit
+    
+    @contextmanager
+    def atomic(self):
+        """
+        Всё, что текущая задача пишет в блоке (в т.ч. через get_connection()),
+        фиксируется вместе: исключение откатывает незафиксированное. Внутри
+        единицы работы обновления граница – её коммит на входе; вне её блок
+        получает свою единицу работы. Зафиксированное раньше (перед запросом
+        в сеть) не откатывается.
+        """
+        own = self._unit() is None
+        if own:
+            self.begin_unit_of_work()
+        else:
+            self.commit_unit_of_work()
+        try:
+            yield
+        except Exception as e:
+            self._unit().rollback()
+            raise e
+        finally:
+            if own:
+                self.finish_unit_of_work()
+    
+    def _open(self):
+        if self._pinned is not None:
+            conn = self._pinned
+        else:
+            conn = self._connect(factory=TracedConnection)
+            conn.database = self
+            conn.row_factory = sqlite3.Row
+        self.pool_stats['opened'] += 1
+        counter = self._counter()
+        if counter is not None:
+            counter.connections += 1
+        self.pool_stats['open'] += 1
+        return conn
     
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        unit = self._unit()
+        if unit is not None:
+            with unit.block() as conn:
+                yield conn
+            return
+        if self._pinned is not None:
+            with self._pinned_block() as conn:
+                yield conn
+            return
+        conn = self._open()
+        opened_at = time.perf_counter()
+        commits = 0
+        failed = False
         try:
             yield conn
+            if conn.in_transaction:
+                commits = 1
             conn.commit()
+            self.pool_stats['commits'] += 1
         except Exception as e:
             conn.rollback()
+            commits = 0
+            failed = True
+            self.pool_stats['rollbacks'] += 1
             raise e
         finally:
             conn.close()
+            self.pool_stats['open'] -= 1
+            for listener in self.connection_listeners:
+                listener(time.perf_counter() - opened_at, commits, failed)
+    
+    @contextmanager
+    def _pinned_block(self):
+        """
+        Блок вне единицы работы на закреплённом соединении: точка сохранения.
+        Транзакцию, начатую другой задачей (её единица работы ждёт сети),
+        фиксирует владелец; свою – блок сам.
+        """
+        unit = UnitOfWork(self)
+        owner = not self._pinned.in_transaction
+        try:
+            with unit.block() as conn:
+                yield conn
+            if owner:
+                unit.commit()
+        except Exception as e:
+            if owner:
+                # Точка сохранения уже откачена (и учтена) в block()
+                self._pinned.rollback()
+            raise e
+        finally:
+            self.pool_stats['open'] -= 1
+            # Записанное в чужой транзакции фиксирует её владелец – здесь это не откат
+            for listener in self.connection_listeners:
+                listener(time.perf_counter() - unit.opened_at, unit.commits, unit.failed)
     
     def init_db(self):
         """Инициализация таблиц при первом запуске"""
@@ -160,6 +607,8 @@ class Database:
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            # Ротация журнала (log_archive) выбирает старые записи по времени
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_created ON logs (created_at)")
             
             # Таблица заявок на пополнение центрального склада
             cursor.execute('''
@@ -199,6 +648,50 @@ class Database:
                 )
             ''')
             
+            # Одноразовые токены для кнопок подтверждения (защита от двойного нажатия)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS callback_tokens (
+                    token TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    action TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    consumed_at DATETIME
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_callback_tokens_action ON callback_tokens (user_id, action)")
+
+            # Состояния диалогов и user_data (см. persistence.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS persistence (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (kind, key)
+                )
+            ''')
+
+            # Исходящие уведомления (см. outbox.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    kind TEXT DEFAULT 'message',
+                    text TEXT NOT NULL,
+                    summary TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    last_error TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    sent_at DATETIME,
+                    failed_at DATETIME
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at)
+                WHERE sent_at IS NULL AND failed_at IS NULL
+            ''')
+
             # Добавляем начальные товары, если таблица пуста
             cursor.execute("SELECT COUNT(*) FROM products")
             if cursor.fetchone()[0] == 0:
@@ -218,7 +711,14 @@ class Database:
                     )
     
     def log_action(self, user_id, user_role, action, details=None):
-        """Запись действия в лог"""
+        """
+        Запись действия в лог. Если обновление уже что-то изменило – тем же
+        коммитом, иначе через буфер audit (пакетами, без отдельного коммита)
+        """
+        unit = self._unit()
+        if unit is None or not unit.dirty:
+            self.audit.enqueue(user_id, user_role, action, details)
+            return
         try:
             with self.get_connection() as conn:
                 conn.execute(
@@ -228,5 +728,69 @@ class Database:
         except Exception as e:
             print(f"Ошибка логирования: {e}")
 
+    def issue_callback_token(self, user_id, action):
+        """
+        Одноразовый токен для кнопки подтверждения. Повторная отрисовка той же
+        кнопки (action включает сущность, например admin_order_ship_15)
+        получает ещё не погашенный токен – без записи в БД.
+        """
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT token FROM callback_tokens "
+                "WHERE user_id = ? AND action = ? AND consumed_at IS NULL "
+                "AND created_at >= datetime('now', '-1 day') "
+                "ORDER BY created_at DESC LIMIT 1",
+                (user_id, action)
+            ).fetchone()
+            if row is not None:
+                return row[0]
+            token = secrets.token_hex(6)
+            # Старые токены больше не нужны
+            conn.execute("DELETE FROM callback_tokens WHERE created_at < datetime('now', '-1 day')")
+            conn.execute(
+                "INSERT INTO callback_tokens (token, user_id, action) VALUES (?, ?, ?)",
+                (token, user_id, action)
+            )
+        return token
+
+    def consume_callback_token(self, token):
+        """
+        Атомарно гасит токен. Возвращает True только для первого нажатия;
+        повторное нажатие ничего не изменяет в БД.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "UPDATE callback_tokens SET consumed_at = CURRENT_TIMESTAMP "
+                "WHERE token = ? AND consumed_at IS NULL",
+                (token,)
+            )
+            return cursor.rowcount == 1
+
+class DatabaseProxy:
+    """
+    Глобальный db: база из DATABASE_PATH, а внутри use_database(...) –
+    переданный экземпляр (только в этом контексте, т.е. в этой задаче asyncio).
+    """
+    
+    def __init__(self, default):
+        self.__dict__['_default'] = default
+    
+    def __getattr__(self, name):
+        return getattr(_current_database.get() or self._default, name)
+    
+    def __setattr__(self, name, value):
+        setattr(_current_database.get() or self._default, name, value)
+
+_current_database = contextvars.ContextVar('database', default=None)
+
+@contextmanager
+def use_database(database):
+    """Все обращения к db в блоке (и в задачах, созданных в нём) идут в database"""
+    token = _current_database.set(database)
+    try:
+        yield database
+    finally:
+        _current_database.reset(token)
+
 # Создаем глобальный экземпляр БД
-db = Database(config.DATABASE_PATH)
+db = DatabaseProxy(Database(config.DATABASE_PATH))
@@ -6,3 +6,7 @@ from .settings import admin_settings_conv
 from .backup import manual_backup
 from .restore import restore_conv
 from .add_test_seller import add_seller_handler
+from .slow_queries import slow_queries_command
+from .profile import profile_command
+from .memsnap import memsnap_command
+from .logs import logs_command
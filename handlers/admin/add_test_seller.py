@@ -5,6 +5,7 @@ from telegram import Update
 from telegram.ext import CommandHandler
 from database import db
 from config import config
+from recorder import personal_data
 
 async def add_test_seller(update: Update, context):
     """Команда для добавления тестового продавца /add_seller"""
@@ -31,6 +32,8 @@ async def add_test_seller(update: Update, context):
         seller_tg_id = int(context.args[0])
         seller_code = context.args[1].upper()
         seller_name = ' '.join(context.args[2:])
+        # Имя – как введено (с теми же пробелами), чтобы его нашли в тексте записи
+        personal_data(context.args[0], update.message.text.split(maxsplit=3)[-1])
         
         with db.get_connection() as conn:
             cursor = conn.cursor()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+from telegram import Update
+
+from config import config
+from log_archive import archive
+
+# Ограничение длины сообщения Telegram (с запасом)
+MAX_REPORT_LENGTH = 4000
+
+async def logs_command(update: Update, context):
+    """Поиск по журналу действий, включая архив: /logs [ГГГГ-ММ] [id | текст]"""
+    user_id = update.effective_user.id
+
+    if user_id not in config.ADMIN_IDS:
+        await update.message.reply_text("⛔ Доступ запрещен")
+        return
+
+    args = list(context.args or [])
+    month = None
+    if args and re.fullmatch(r'\d{4}-\d{2}', args[0]):
+        month = args.pop(0)
+    target_id, text = None, None
+    if len(args) == 1 and args[0].lstrip('-').isdigit():
+        target_id = int(args[0])
+    elif args:
+        text = ' '.join(args)
+
+    records = archive.search(text=text, user_id=target_id, month=month)
+    if not records:
+        await update.message.reply_text("📭 Ничего не найдено")
+        return
+
+    months = archive.months()
+    report = f"📜 Журнал действий{f' за {month}' if month else ''}: последние {len(records)}\n"
+    if months:
+        report += f"🗄 В архиве месяцы {months[-1]} – {months[0]}\n"
+    for record in records:
+        line = (f"\n{record['created_at']} · {record['user_id']} ({record['user_role']}) · "
+                f"{record['action']}")
+        if record['details']:
+            line += f" · {str(record['details'])[:80]}"
+        if len(report) + len(line) > MAX_REPORT_LENGTH:
+            report += "\n…"
+            break
+        report += line
+
+    await update.message.reply_text(report)
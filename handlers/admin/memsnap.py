@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+from datetime import datetime
+
+from telegram import Update
+
+from config import config
+from memsnap import snapshots
+
+async def memsnap_command(update: Update, context):
+    """Снимок памяти и разница с предыдущим: /memsnap [stop]"""
+    user_id = update.effective_user.id
+    
+    if user_id not in config.ADMIN_IDS:
+        await update.message.reply_text("⛔ Доступ запрещен")
+        return
+    
+    if context.args and context.args[0].lower() == 'stop':
+        if not snapshots.is_tracing():
+            await update.message.reply_text("ℹ️ tracemalloc не включён")
+            return
+        snapshots.stop()
+        await update.message.reply_text("✅ tracemalloc выключен, снимки удалены")
+        return
+    
+    try:
+        summary, report = snapshots.take()
+        await update.message.reply_document(
+            document=io.BytesIO(report.encode('utf-8')),
+            filename=f"memsnap_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+            caption=f"🧠 {summary}"
+        )
+    except Exception as e:
+        await update.message.reply_text(f"❌ Ошибка: {e}")
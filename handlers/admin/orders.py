@@ -6,7 +6,10 @@ from telegram.ext import ConversationHandler, CommandHandler, MessageHandler, Ca
 from database import db
 from config import config
 from keyboards import get_admin_menu
-from backup_decorator import send_backup_to_admin
+from backup_decorator import send_backup_to_admin, skip_backup
+from idempotency import idempotent_callback, token_callback_data, split_callback_data
+from state_machine import transition
+from outbox import enqueue_message, wake_outbox
 import logging
 
 logger = logging.getLogger(__name__)
@@ -128,7 +131,8 @@ async def admin_order_view(update: Update, context):
 
     keyboard = []
     if order['status'] == 'new':
-        keyboard.append([InlineKeyboardButton("✅ Подтвердить отгрузку", callback_data=f"admin_order_ship_{order_id}")])
+        ship_data = token_callback_data("admin_order_ship", update.effective_user.id, prefix=f"admin_order_ship_{order_id}")
+        keyboard.append([InlineKeyboardButton("✅ Подтвердить отгрузку", callback_data=ship_data)])
         keyboard.append([InlineKeyboardButton("❌ Отменить заявку", callback_data=f"admin_order_cancel_{order_id}")])
     elif order['status'] == 'shipped':
         keyboard.append([InlineKeyboardButton("📦 Отметить как получено", callback_data=f"admin_order_complete_{order_id}")])
@@ -137,39 +141,44 @@ async def admin_order_view(update: Update, context):
     await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     return SELECTING_ORDER
 
+@idempotent_callback("⏳ Отгрузка уже подтверждена")
 @send_backup_to_admin("подтверждение отгрузки")
 async def admin_order_ship(update: Update, context):
     """Подтверждение заявки: меняем статус на 'shipped' и уведомляем продавца. Никаких изменений склада!"""
     query = update.callback_query
     await query.answer()
-    order_id = int(query.data.replace('admin_order_ship_', ''))
+    base, _ = split_callback_data(query.data)
+    order_id = int(base.replace('admin_order_ship_', ''))
 
     with db.get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE orders
-            SET status = 'shipped', shipped_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (order_id,))
-        cursor.execute("SELECT seller_id, order_number FROM orders WHERE id = ?", (order_id,))
-        order = cursor.fetchone()
-        seller_id = order['seller_id']
-        order_number = order['order_number']
-
-    # Уведомляем продавца
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT telegram_id FROM sellers WHERE id = ?", (seller_id,))
-        res = cursor.fetchone()
-        if res and res['telegram_id']:
-            try:
-                await context.bot.send_message(
-                    chat_id=res['telegram_id'],
-                    text=f"🚚 Статус заявки №{order_number} изменён на «В пути».\n"
-                         f"Когда получите товар, не забудьте подтвердить получение."
-                )
-            except Exception as e:
-                logger.error(f"Не удалось уведомить продавца {seller_id}: {e}")
+        shipped = transition(cursor, 'order', order_id, 'shipped')
+        if shipped:
+            cursor.execute("""
+                SELECT o.order_number, s.telegram_id
+                FROM orders o
+                JOIN sellers s ON o.seller_id = s.id
+                WHERE o.id = ?
+            """, (order_id,))
+            order = cursor.fetchone()
+
+            # Уведомление продавца фиксируется вместе со сменой статуса
+            enqueue_message(
+                cursor,
+                order['telegram_id'],
+                f"🚚 Статус заявки №{order['order_number']} изменён на «В пути».\n"
+                f"Когда получите товар, не забудьте подтвердить получение."
+            )
+    if not shipped:
+        await query.edit_message_text(
+            "ℹ️ Заявка уже обработана другим администратором.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 К заявкам", callback_data="admin_orders_back_to_menu")
+            ]])
+        )
+        skip_backup()
+        return
+    wake_outbox(context)
 
     await query.edit_message_text(
         "✅ Отгрузка подтверждена! Статус заявки изменён на 'В пути'.",
@@ -202,5 +211,8 @@ admin_orders_conv = ConversationHandler(
         ]
     },
     fallbacks=[CommandHandler('cancel', admin_orders_exit)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='admin_orders_conv',
+    persistent=True
 )
@@ -6,7 +6,10 @@ from telegram.ext import ConversationHandler, CommandHandler, MessageHandler, Ca
 from database import db
 from config import config
 from keyboards import get_admin_menu
-from backup_decorator import send_backup_to_admin
+from backup_decorator import send_backup_to_admin, skip_backup
+from idempotency import idempotent_callback, token_callback_data
+from state_machine import transition
+from outbox import enqueue_message, wake_outbox
 import logging
 
 logger = logging.getLogger(__name__)
@@ -156,7 +159,7 @@ async def payment_view(update: Update, context):
     text += f"• Сумма к переводу уменьшится на {payment['amount']} руб"
     
     keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить выплату", callback_data="payment_confirm")],
+        [InlineKeyboardButton("✅ Подтвердить выплату", callback_data=token_callback_data("payment_confirm", update.effective_user.id))],
         [InlineKeyboardButton("✏️ Редактировать сумму", callback_data="payment_edit")],
         [InlineKeyboardButton("❌ Отклонить", callback_data="payment_reject")],
         [InlineKeyboardButton("🔙 Назад", callback_data="payments_pending")]
@@ -289,49 +292,48 @@ async def payment_edit_confirm(update: Update, context):
         with db.get_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT pr.request_number, s.telegram_id, s.seller_code, s.full_name
-                FROM payment_requests pr
-                JOIN sellers s ON pr.seller_id = s.id
-                WHERE pr.id = ?
-            """, (payment_id,))
-            data = cursor.fetchone()
-            
-            if not data:
-                await query.edit_message_text("❌ Запрос не найден")
-                return MAIN_MENU
-            
-            cursor.execute("""
-                UPDATE payment_requests 
-                SET amount = ?, status = 'approved', approved_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (new_amount, payment_id))
-            
-            cursor.execute("""
-                UPDATE seller_debt 
-                SET total_debt = total_debt - ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE seller_id = ?
-            """, (new_amount, seller_id))
-            
-            cursor.execute("""
-                UPDATE seller_pending 
-                SET pending_amount = pending_amount - ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE seller_id = ?
-            """, (new_amount, seller_id))
-        
-        if data['telegram_id']:
-            try:
-                await context.bot.send_message(
-                    chat_id=data['telegram_id'],
-                    text=f"✅ Выплата подтверждена администратором!\n\n"
-                         f"Номер запроса: {data['request_number']}\n"
-                         f"Сумма: {new_amount} руб\n"
-                         f"Средства переведены."
+            approved = transition(cursor, 'payment', payment_id, 'approved', amount=new_amount)
+            if approved:
+                cursor.execute("""
+                    SELECT pr.request_number, s.telegram_id, s.seller_code, s.full_name
+                    FROM payment_requests pr
+                    JOIN sellers s ON pr.seller_id = s.id
+                    WHERE pr.id = ?
+                """, (payment_id,))
+                data = cursor.fetchone()
+                
+                cursor.execute("""
+                    UPDATE seller_debt 
+                    SET total_debt = total_debt - ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE seller_id = ?
+                """, (new_amount, seller_id))
+                
+                cursor.execute("""
+                    UPDATE seller_pending 
+                    SET pending_amount = pending_amount - ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE seller_id = ?
+                """, (new_amount, seller_id))
+                
+                enqueue_message(
+                    cursor,
+                    data['telegram_id'],
+                    f"✅ Выплата подтверждена администратором!\n\n"
+                    f"Номер запроса: {data['request_number']}\n"
+                    f"Сумма: {new_amount} руб\n"
+                    f"Средства переведены."
                 )
-            except Exception as e:
-                logger.error(f"Failed to notify seller {data['telegram_id']}: {e}")
+        if not approved:
+            await query.edit_message_text(
+                "❌ Запрос не найден или уже обработан",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("🔙 К запросам", callback_data="payments_pending")
+                ]])
+            )
+            skip_backup()
+            return MAIN_MENU
+        wake_outbox(context)
         
         await query.edit_message_text(
             f"✅ Выплата подтверждена!\n\n"
@@ -346,7 +348,10 @@ async def payment_edit_confirm(update: Update, context):
         
     except Exception as e:
         logger.error(f"Error in payment_edit_confirm: {e}")
+        # До ответа: иначе запрос в сеть зафиксирует погашенный токен без выплаты
+        db.rollback_unit_of_work()
         await query.edit_message_text(f"❌ Ошибка: {str(e)}")
+        skip_backup()
     
     context.user_data.clear()
     return MAIN_MENU
@@ -374,6 +379,7 @@ async def payment_edit_cancel(update: Update, context):
     await payment_view(update, context)
     return CONFIRM_PAYMENT
 
+@idempotent_callback("⏳ Выплата уже подтверждена")
 @send_backup_to_admin("подтверждение выплаты")
 async def payment_confirm(update: Update, context):
     """Подтверждение выплаты (без изменения суммы)"""
@@ -396,57 +402,56 @@ async def payment_confirm(update: Update, context):
     try:
         with db.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT pr.*, s.id as seller_id, s.telegram_id, s.seller_code
-                FROM payment_requests pr
-                JOIN sellers s ON pr.seller_id = s.id
-                WHERE pr.id = ?
-            """, (payment_id,))
-            payment = cursor.fetchone()
-            
-            if not payment:
-                await query.edit_message_text("❌ Запрос не найден")
-                return MAIN_MENU
-            
-            cursor.execute("""
-                UPDATE payment_requests 
-                SET status = 'approved', approved_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (payment_id,))
-            
-            cursor.execute("""
-                UPDATE seller_debt 
-                SET total_debt = total_debt - ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE seller_id = ?
-            """, (payment['amount'], payment['seller_id']))
-            
-            cursor.execute("""
-                UPDATE seller_pending 
-                SET pending_amount = pending_amount - ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE seller_id = ?
-            """, (payment['amount'], payment['seller_id']))
-            
-            cursor.execute("""
-                SELECT total_debt, pending_amount 
-                FROM seller_debt sd
-                JOIN seller_pending sp ON sd.seller_id = sp.seller_id
-                WHERE sd.seller_id = ?
-            """, (payment['seller_id'],))
-            new_state = cursor.fetchone()
-        
-        if payment['telegram_id']:
-            try:
-                await context.bot.send_message(
-                    chat_id=payment['telegram_id'],
-                    text=f"✅ Выплата подтверждена администратором!\n\n"
-                         f"Номер запроса: {payment['request_number']}\n"
-                         f"Сумма: {payment['amount']} руб\n"
-                         f"Средства переведены."
+            approved = transition(cursor, 'payment', payment_id, 'approved')
+            if approved:
+                cursor.execute("""
+                    SELECT pr.*, s.id as seller_id, s.telegram_id, s.seller_code
+                    FROM payment_requests pr
+                    JOIN sellers s ON pr.seller_id = s.id
+                    WHERE pr.id = ?
+                """, (payment_id,))
+                payment = cursor.fetchone()
+                
+                cursor.execute("""
+                    UPDATE seller_debt 
+                    SET total_debt = total_debt - ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE seller_id = ?
+                """, (payment['amount'], payment['seller_id']))
+                
+                cursor.execute("""
+                    UPDATE seller_pending 
+                    SET pending_amount = pending_amount - ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE seller_id = ?
+                """, (payment['amount'], payment['seller_id']))
+                
+                cursor.execute("""
+                    SELECT total_debt, pending_amount 
+                    FROM seller_debt sd
+                    JOIN seller_pending sp ON sd.seller_id = sp.seller_id
+                    WHERE sd.seller_id = ?
+                """, (payment['seller_id'],))
+                new_state = cursor.fetchone()
+                
+                enqueue_message(
+                    cursor,
+                    payment['telegram_id'],
+                    f"✅ Выплата подтверждена администратором!\n\n"
+                    f"Номер запроса: {payment['request_number']}\n"
+                    f"Сумма: {payment['amount']} руб\n"
+                    f"Средства переведены."
                 )
-            except Exception as e:
-                logger.error(f"Failed to notify seller {payment['telegram_id']}: {e}")
+        if not approved:
+            await query.edit_message_text(
+                "❌ Запрос не найден или уже обработан",
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("🔙 К запросам", callback_data="payments_pending")
+                ]])
+            )
+            skip_backup()
+            return MAIN_MENU
+        wake_outbox(context)
         
         await query.edit_message_text(
             f"✅ Выплата подтверждена!\n\n"
@@ -463,7 +468,10 @@ async def payment_confirm(update: Update, context):
         
     except Exception as e:
         logger.error(f"Error in payment_confirm: {e}")
+        # До ответа: иначе запрос в сеть зафиксирует погашенный токен без выплаты
+        db.rollback_unit_of_work()
         await query.edit_message_text(f"❌ Ошибка: {str(e)}")
+        skip_backup()
     
     context.user_data.clear()
     return MAIN_MENU
@@ -478,33 +486,32 @@ async def payment_reject(update: Update, context):
     
     with db.get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE payment_requests 
-            SET status = 'rejected'
-            WHERE id = ?
-        """, (payment_id,))
-        
-        cursor.execute("SELECT request_number, seller_id FROM payment_requests WHERE id = ?", (payment_id,))
-        data = cursor.fetchone()
-    
-    if data:
-        seller_tg_id = None
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT telegram_id FROM sellers WHERE id = ?", (data['seller_id'],))
-            res = cursor.fetchone()
-            if res:
-                seller_tg_id = res['telegram_id']
-        
-        if seller_tg_id:
-            try:
-                await context.bot.send_message(
-                    chat_id=seller_tg_id,
-                    text=f"❌ Запрос на выплату отклонён администратором.\n\n"
-                         f"Номер запроса: {data['request_number']}"
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify seller: {e}")
+        rejected = transition(cursor, 'payment', payment_id, 'rejected')
+        if rejected:
+            cursor.execute("""
+                SELECT pr.request_number, s.telegram_id
+                FROM payment_requests pr
+                JOIN sellers s ON pr.seller_id = s.id
+                WHERE pr.id = ?
+            """, (payment_id,))
+            data = cursor.fetchone()
+            
+            enqueue_message(
+                cursor,
+                data['telegram_id'],
+                f"❌ Запрос на выплату отклонён администратором.\n\n"
+                f"Номер запроса: {data['request_number']}"
+            )
+    if not rejected:
+        await query.edit_message_text(
+            "❌ Запрос не найден или уже обработан",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 К запросам", callback_data="payments_pending")
+            ]])
+        )
+        context.user_data.clear()
+        return MAIN_MENU
+    wake_outbox(context)
     
     await query.edit_message_text(
         f"❌ Запрос {data['request_number']} отклонен",
@@ -683,7 +690,7 @@ admin_payments_conv = ConversationHandler(
             CallbackQueryHandler(back_to_menu, pattern='^payments_back_to_menu$')
         ],
         CONFIRM_PAYMENT: [
-            CallbackQueryHandler(payment_confirm, pattern='^payment_confirm$'),
+            CallbackQueryHandler(payment_confirm, pattern='^payment_confirm(:\\w+)?$'),
             CallbackQueryHandler(payment_edit_start, pattern='^payment_edit$'),
             CallbackQueryHandler(payment_reject, pattern='^payment_reject$'),
             CallbackQueryHandler(payments_pending, pattern='^payments_pending$')
@@ -696,5 +703,8 @@ admin_payments_conv = ConversationHandler(
         ]
     },
     fallbacks=[CommandHandler('cancel', exit_payments)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='admin_payments_conv',
+    persistent=True
 )
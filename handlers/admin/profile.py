@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+from telegram import Update
+
+from config import config
+import profiling
+
+USAGE = (
+    "❌ Использование:\n"
+    "/profile – следующие 20 обновлений\n"
+    "/profile 50 – следующие 50 обновлений\n"
+    "/profile 30s – следующие 30 секунд\n"
+    "/profile stop – остановить и получить сводку"
+)
+
+async def profile_command(update: Update, context):
+    """Профилирование следующих N обновлений или T секунд: /profile [N | Ts | stop]"""
+    user_id = update.effective_user.id
+    
+    if user_id not in config.ADMIN_IDS:
+        await update.message.reply_text("⛔ Доступ запрещен")
+        return
+    
+    arg = context.args[0].lower() if context.args else None
+    
+    if arg == 'stop':
+        if not await profiling.stop_profile(context.bot, 'командой /profile stop'):
+            await update.message.reply_text("ℹ️ Профилирование не запущено")
+        return
+    
+    updates = seconds = None
+    if arg:
+        match = re.fullmatch(r'(\d+)(s|с)?', arg)
+        if not match:
+            await update.message.reply_text(USAGE)
+            return
+        if match.group(2):
+            seconds = int(match.group(1))
+        else:
+            updates = int(match.group(1))
+    
+    if not profiling.start_profile(
+        context, update.effective_chat.id, updates=updates, seconds=seconds, skip_update_id=update.update_id
+    ):
+        await update.message.reply_text("⚠️ Профилирование уже идёт. /profile stop – остановить")
+        return
+    
+    if seconds:
+        what = f"{min(seconds, profiling.MAX_SECONDS)} с"
+    else:
+        what = f"{updates or profiling.DEFAULT_UPDATES} обновлений (не дольше {profiling.MAX_SECONDS} с)"
+    await update.message.reply_text(f"📈 Профилирование запущено на {what}. Сводка придёт документом.")
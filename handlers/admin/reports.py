@@ -466,5 +466,8 @@ admin_reports_conv = ConversationHandler(
         ]
     },
     fallbacks=[CommandHandler('cancel', exit_reports)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='admin_reports_conv',
+    persistent=True
 )
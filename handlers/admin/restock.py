@@ -12,13 +12,17 @@ from telegram.ext import ConversationHandler, CommandHandler, MessageHandler, Ca
 from database import db
 from config import config
 from keyboards import get_admin_menu, get_back_keyboard
-from backup_decorator import send_backup_to_admin
+from backup_decorator import send_backup_to_admin, skip_backup
+from state_machine import transition
 import logging
 
 logger = logging.getLogger(__name__)
 
 MAIN_MENU, ENTERING_QUANTITY, CONFIRMING = range(3)
 
+class RestockConflict(Exception):
+    """Заявку на пополнение закрыли параллельно – пополнение откатывается"""
+
 async def restock_admin_start(update: Update, context):
     """Главное меню – показывает срочные заявки и список всех товаров с кнопками."""
     user_id = update.effective_user.id
@@ -176,66 +180,83 @@ async def confirm_restock(update: Update, context):
     price = context.user_data.get('product_price', 0)
     qty = context.user_data['quantity']
 
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        # Получаем ID продавца Р
-        cursor.execute("SELECT id FROM sellers WHERE seller_code = 'Р'")
-        central = cursor.fetchone()
-        if not central:
-            await query.edit_message_text("❌ Ошибка: центральный склад не найден.")
-            return MAIN_MENU
-        central_id = central['id']
-
-        # Добавляем товар на склад Р
-        cursor.execute("SELECT quantity FROM seller_products WHERE seller_id = ? AND product_id = ?", (central_id, product_id))
-        existing = cursor.fetchone()
-        if existing:
-            cursor.execute("UPDATE seller_products SET quantity = quantity + ? WHERE seller_id = ? AND product_id = ?", (qty, central_id, product_id))
-        else:
-            cursor.execute("INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)", (central_id, product_id, qty))
-
-        # Увеличиваем долг продавца Р
-        cursor.execute("SELECT total_debt FROM seller_debt WHERE seller_id = ?", (central_id,))
-        debt = cursor.fetchone()
-        if debt:
-            cursor.execute("UPDATE seller_debt SET total_debt = total_debt + ? WHERE seller_id = ?", (price * qty, central_id))
-        else:
-            cursor.execute("INSERT INTO seller_debt (seller_id, total_debt) VALUES (?, ?)", (central_id, price * qty))
-
-        # Распределяем по pending-заявкам
-        cursor.execute("""
-            SELECT ri.id, ri.quantity_requested, rr.id as request_id
-            FROM restock_items ri
-            JOIN restock_requests rr ON ri.request_id = rr.id
-            WHERE ri.product_id = ? AND rr.status = 'pending'
-            ORDER BY rr.created_at ASC
-        """, (product_id,))
-        items = cursor.fetchall()
-
-        remaining = qty
-        for item in items:
-            if remaining <= 0:
-                break
-            take = min(item['quantity_requested'], remaining)
-            cursor.execute("UPDATE restock_items SET quantity_received = COALESCE(quantity_received, 0) + ? WHERE id = ?", (take, item['id']))
-            remaining -= take
-
-        # Закрываем полностью выполненные заявки
-        cursor.execute("""
-            SELECT request_id
-            FROM restock_items
-            WHERE request_id IN (SELECT DISTINCT request_id FROM restock_items WHERE product_id = ?)
-            GROUP BY request_id
-            HAVING SUM(quantity_received) = SUM(quantity_requested)
-        """, (product_id,))
-        completed_requests = cursor.fetchall()
-        for req in completed_requests:
-            cursor.execute("UPDATE restock_requests SET status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE id = ?", (req['request_id'],))
-
-        # Записываем в историю пополнений
-        cursor.execute("""
-            INSERT INTO restock_history (product_id, quantity) VALUES (?, ?)
-        """, (product_id, qty))
+    try:
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            # Получаем ID продавца Р
+            cursor.execute("SELECT id FROM sellers WHERE seller_code = 'Р'")
+            central = cursor.fetchone()
+            if not central:
+                await query.edit_message_text("❌ Ошибка: центральный склад не найден.")
+                skip_backup()
+                return MAIN_MENU
+            central_id = central['id']
+
+            # Добавляем товар на склад Р
+            cursor.execute("SELECT quantity FROM seller_products WHERE seller_id = ? AND product_id = ?", (central_id, product_id))
+            existing = cursor.fetchone()
+            if existing:
+                cursor.execute("UPDATE seller_products SET quantity = quantity + ? WHERE seller_id = ? AND product_id = ?", (qty, central_id, product_id))
+            else:
+                cursor.execute("INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)", (central_id, product_id, qty))
+
+            # Увеличиваем долг продавца Р
+            cursor.execute("SELECT total_debt FROM seller_debt WHERE seller_id = ?", (central_id,))
+            debt = cursor.fetchone()
+            if debt:
+                cursor.execute("UPDATE seller_debt SET total_debt = total_debt + ? WHERE seller_id = ?", (price * qty, central_id))
+            else:
+                cursor.execute("INSERT INTO seller_debt (seller_id, total_debt) VALUES (?, ?)", (central_id, price * qty))
+
+            # Распределяем по pending-заявкам
+            cursor.execute("""
+                SELECT ri.id, ri.quantity_requested, rr.id as request_id
+                FROM restock_items ri
+                JOIN restock_requests rr ON ri.request_id = rr.id
+                WHERE ri.product_id = ? AND rr.status = 'pending'
+                ORDER BY rr.created_at ASC
+            """, (product_id,))
+            items = cursor.fetchall()
+
+            remaining = qty
+            for item in items:
+                if remaining <= 0:
+                    break
+                take = min(item['quantity_requested'], remaining)
+                cursor.execute("UPDATE restock_items SET quantity_received = COALESCE(quantity_received, 0) + ? WHERE id = ?", (take, item['id']))
+                remaining -= take
+
+            # Закрываем полностью выполненные заявки (только ещё открытые)
+            cursor.execute("""
+                SELECT ri.request_id
+                FROM restock_items ri
+                JOIN restock_requests rr ON ri.request_id = rr.id
+                WHERE rr.status = 'pending'
+                  AND ri.request_id IN (SELECT DISTINCT request_id FROM restock_items WHERE product_id = ?)
+                GROUP BY ri.request_id
+                HAVING SUM(ri.quantity_received) = SUM(ri.quantity_requested)
+            """, (product_id,))
+            completed_requests = cursor.fetchall()
+            for req in completed_requests:
+                # Заявку закрыли или отменили параллельно – откатываем всё пополнение
+                if not transition(cursor, 'restock', req['request_id'], 'completed'):
+                    raise RestockConflict(req['request_id'])
+
+            # Записываем в историю пополнений
+            cursor.execute("""
+                INSERT INTO restock_history (product_id, quantity) VALUES (?, ?)
+            """, (product_id, qty))
+    except RestockConflict as e:
+        logger.warning(f"confirm_restock: заявка {e} изменена параллельно, пополнение отменено")
+        await query.edit_message_text(
+            "ℹ️ Заявки на этот товар только что изменились. Пополнение отменено, попробуйте ещё раз.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 К списку", callback_data="restock_back_to_list")
+            ]])
+        )
+        skip_backup()
+        context.user_data.clear()
+        return MAIN_MENU
 
     await query.edit_message_text(
         f"✅ Пополнение выполнено!\n\n"
@@ -344,5 +365,8 @@ restock_admin_conv = ConversationHandler(
         ]
     },
     fallbacks=[CommandHandler('cancel', back_to_admin)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='restock_admin_conv',
+    persistent=True
 )
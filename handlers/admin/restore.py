@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import json
-import sqlite3
 import io
 from datetime import datetime
 
@@ -71,9 +70,11 @@ async def receive_backup_file(update: Update, context):
     try:
         file = await document.get_file()
         file_content = await file.download_as_bytearray()
-        data = json.loads(file_content.decode('utf-8'))
+        # Проверяем, что это JSON; сам бэкап в user_data не храним – он ушёл бы
+        # в persistence, – при подтверждении файл скачивается заново
+        json.loads(file_content.decode('utf-8'))
         
-        context.user_data['restore_data'] = data
+        context.user_data['restore_file_id'] = document.file_id
         context.user_data['restore_filename'] = document.file_name
         
         keyboard = [
@@ -97,18 +98,24 @@ async def confirm_restore(update: Update, context):
     query = update.callback_query
     await query.answer()
     
+    file_id = context.user_data.pop('restore_file_id', None)
+    context.user_data.pop('restore_filename', None)
+    
     if query.data == "cancel":
         await query.edit_message_text("❌ Восстановление отменено")
         return ConversationHandler.END
     
-    data = context.user_data.get('restore_data')
-    if not data:
+    if not file_id:
         await query.edit_message_text("❌ Ошибка: данные не найдены")
         return ConversationHandler.END
     
     await query.edit_message_text("🔄 Восстановление...")
     
     try:
+        file = await context.bot.get_file(file_id)
+        file_content = await file.download_as_bytearray()
+        data = json.loads(file_content.decode('utf-8'))
+        
         current_backup = backup.create_backup_json()
         current_filename = backup.get_backup_filename("before_restore")
         await query.message.reply_document(
@@ -117,34 +124,7 @@ async def confirm_restore(update: Update, context):
             caption="📦 Бэкап перед восстановлением"
         )
         
-        conn = sqlite3.connect(config.DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = OFF")
-        
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        for table in tables:
-            table_name = table[0]
-            if table_name != 'sqlite_sequence':
-                cursor.execute(f"DELETE FROM {table_name}")
-        
-        restored = 0
-        for table_name, rows in data.items():
-            if table_name != 'sqlite_sequence' and rows:
-                columns = list(rows[0].keys())
-                placeholders = ','.join(['?'] * len(columns))
-                column_names = ','.join(columns)
-                for row in rows:
-                    values = [row[col] for col in columns]
-                    cursor.execute(
-                        f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})",
-                        values
-                    )
-                    restored += 1
-        
-        cursor.execute("PRAGMA foreign_keys = ON")
-        conn.commit()
-        conn.close()
+        restored = backup.restore_json(data)
         
         await query.edit_message_text(f"✅ Восстановлено {restored} записей!")
         
@@ -164,5 +144,8 @@ restore_conv = ConversationHandler(
             CallbackQueryHandler(confirm_restore, pattern='^(confirm_restore|cancel)$')
         ]
     },
-    fallbacks=[CommandHandler("cancel", lambda u,c: ConversationHandler.END)]
+    fallbacks=[CommandHandler("cancel", lambda u,c: ConversationHandler.END)],
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='restore_conv',
+    persistent=True
 )
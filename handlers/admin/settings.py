@@ -7,10 +7,10 @@ from database import db
 from config import config
 from keyboards import get_admin_menu
 from backup_decorator import send_backup_to_admin
+from recorder import personal_data
 import logging
 import io
 import json
-import sqlite3
 from backup import backup
 
 logger = logging.getLogger(__name__)
@@ -168,6 +168,7 @@ async def seller_add_name(update: Update, context):
         return ConversationHandler.END
     
     seller_name = update.message.text.strip()
+    personal_data(seller_name)
     
     if len(seller_name) < 2:
         await update.message.reply_text(
@@ -203,6 +204,7 @@ async def seller_add_tg_id(update: Update, context):
         return ConversationHandler.END
     
     tg_id_text = update.message.text.strip()
+    personal_data(tg_id_text)
     
     try:
         if tg_id_text == '0':
@@ -1353,36 +1355,7 @@ async def backup_file_received(update: Update, context):
         )
         
         # Восстанавливаем данные
-        conn = sqlite3.connect(config.DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = OFF")
-        
-        # Очищаем все таблицы
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        for table in tables:
-            table_name = table[0]
-            if table_name != 'sqlite_sequence':
-                cursor.execute(f"DELETE FROM {table_name}")
-        
-        # Вставляем данные из бэкапа
-        restored = 0
-        for table_name, rows in data.items():
-            if table_name != 'sqlite_sequence' and rows:
-                columns = list(rows[0].keys())
-                placeholders = ','.join(['?'] * len(columns))
-                column_names = ','.join(columns)
-                for row in rows:
-                    values = [row[col] for col in columns]
-                    cursor.execute(
-                        f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})",
-                        values
-                    )
-                    restored += 1
-        
-        cursor.execute("PRAGMA foreign_keys = ON")
-        conn.commit()
-        conn.close()
+        restored = backup.restore_json(data)
         
         await update.message.reply_text(
             f"✅ База данных успешно восстановлена из файла {document.file_name}\n"
@@ -1570,5 +1543,8 @@ admin_settings_conv = ConversationHandler(
         ]
     },
     fallbacks=[CommandHandler('cancel', exit_settings)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='admin_settings_conv',
+    persistent=True
 )
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from telegram import Update
+
+from config import config
+from slow_queries import slow_log
+from sql_budget import budget
+
+# Ограничение длины сообщения Telegram (с запасом)
+MAX_REPORT_LENGTH = 4000
+
+async def slow_queries_command(update: Update, context):
+    """Самые дорогие SQL-запросы по суммарному времени: /slow_queries [N]"""
+    user_id = update.effective_user.id
+    
+    if user_id not in config.ADMIN_IDS:
+        await update.message.reply_text("⛔ Доступ запрещен")
+        return
+    
+    limit = 10
+    if context.args:
+        if context.args[0] == 'reset':
+            slow_log.reset()
+            budget.reset()
+            await update.message.reply_text("✅ Статистика запросов сброшена")
+            return
+        try:
+            limit = max(1, int(context.args[0]))
+        except ValueError:
+            await update.message.reply_text("❌ Использование: /slow_queries [N] или /slow_queries reset")
+            return
+    
+    top = slow_log.top(limit)
+    if not top:
+        await update.message.reply_text("📭 Запросов пока не было")
+        return
+    
+    text = f"🐢 Топ-{len(top)} запросов по суммарному времени (порог медленного {config.SLOW_QUERY_MS} мс)\n"
+    for position, (key, stats) in enumerate(top, 1):
+        block = (
+            f"\n{position}. [{key}] всего {stats.total * 1000:.1f} мс, вызовов {stats.calls}, "
+            f"ср. {stats.total / stats.calls * 1000:.2f} мс, макс. {stats.max * 1000:.1f} мс, "
+            f"медленных {stats.slow}\n"
+            f"{stats.statement[:300]}\n"
+        )
+        if stats.plan:
+            block += "план: " + " | ".join(line.strip() for line in stats.plan) + "\n"
+        if len(text) + len(block) > MAX_REPORT_LENGTH:
+            text += "\n…"
+            break
+        text += block
+    
+    findings = budget.top_findings(5)
+    if findings:
+        text += f"\n🔁 Повторы запроса в одном обновлении (N+1, порог {budget.repeat_limit}):\n"
+        for finding in findings:
+            block = (
+                f"• {finding.kind}: до {finding.max_repeats} раз, обновлений {finding.updates}\n"
+                f"  {finding.statement[:150]}\n"
+            )
+            if len(text) + len(block) > MAX_REPORT_LENGTH:
+                text += "…"
+                break
+            text += block
+    
+    await update.message.reply_text(text)
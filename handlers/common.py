@@ -181,5 +181,8 @@ activation_conv = ConversationHandler(
     entry_points=[MessageHandler(filters.Regex('^Ввести код активации$'), activate_seller_start)],
     states={ENTERING_CODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, activate_seller)]},
     fallbacks=[CommandHandler('cancel', cancel_activation)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='activation_conv',
+    persistent=True
 )
@@ -13,6 +13,9 @@ from database import db
 from config import config
 from keyboards import get_main_menu, get_back_keyboard, get_confirm_keyboard, get_seller_menu
 from backup_decorator import send_backup_to_admin
+from outbox import enqueue_admin_message, wake_outbox
+from idempotency import idempotent_callback, token_callback_data
+from sessions import compact_rows
 import logging
 from datetime import datetime
 
@@ -74,7 +77,8 @@ async def show_product_selection(update: Update, context):
         )
         return ConversationHandler.END
 
-    context.user_data['products'] = products
+    # Храним компактные записи: sqlite3.Row нельзя скопировать для персистентности
+    context.user_data['products'] = compact_rows(products)
 
     cart = context.user_data.get('cart', {})
     text = "📦 **Создание заявки на поставку**\n\n"
@@ -215,7 +219,7 @@ async def show_cart_summary(update: Update, context):
     text += f"**Общий заказ на сумму: {total_sum} руб**"
 
     keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить заявку", callback_data="confirm_order")],
+        [InlineKeyboardButton("✅ Подтвердить заявку", callback_data=token_callback_data("confirm_order", update.effective_user.id))],
         [InlineKeyboardButton("➕ Добавить ещё товар", callback_data="add_more")],
         [InlineKeyboardButton("❌ Отменить всё", callback_data="cancel_all")]
     ]
@@ -226,6 +230,7 @@ async def show_cart_summary(update: Update, context):
     else:
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
 
+@idempotent_callback("⏳ Заявка уже создана")
 @send_backup_to_admin("создание заявки на поставку")
 async def confirm_order(update: Update, context):
     query = update.callback_query
@@ -264,6 +269,21 @@ async def confirm_order(update: Update, context):
             """, (order_id, prod_id, item['qty'], item['price']))
             items_summary.append(f"{item['name']}: {item['qty']} упак")
 
+        # Уведомляем админов (в той же транзакции; в часы пик – сводкой)
+        total_sum = sum(item['qty'] * item['price'] for item in cart.values())
+        items_text = "\n".join(items_summary)
+        enqueue_admin_message(
+            cursor,
+            f"🟡 **Новая заявка на поставку!**\n\n"
+            f"Номер: {order_number}\n"
+            f"Продавец: {seller_code}\n"
+            f"{items_text}\n"
+            f"Общая сумма: {total_sum} руб",
+            kind='new_order',
+            summary=f"{order_number} ({seller_code}): {total_sum} руб"
+        )
+    wake_outbox(context)
+
     await query.edit_message_text(
         f"✅ Заявка № {order_number} успешно создана!",
         reply_markup=None
@@ -274,22 +294,6 @@ async def confirm_order(update: Update, context):
         reply_markup=get_seller_menu(seller_code)
     )
 
-    # Уведомляем админов
-    total_sum = sum(item['qty'] * item['price'] for item in cart.values())
-    items_text = "\n".join(items_summary)
-    for admin_id in config.ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=f"🟡 **Новая заявка на поставку!**\n\n"
-                     f"Номер: {order_number}\n"
-                     f"Продавец: {seller_code}\n"
-                     f"{items_text}\n"
-                     f"Общая сумма: {total_sum} руб"
-            )
-        except Exception as e:
-            logger.error(f"Не удалось уведомить админа {admin_id}: {e}")
-
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -377,11 +381,14 @@ orders_conv = ConversationHandler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, quantity_entered)
         ],
         CONFIRMING_CART: [
-            CallbackQueryHandler(confirm_order, pattern='^confirm_order$'),
+            CallbackQueryHandler(confirm_order, pattern='^confirm_order(:\\w+)?$'),
             CallbackQueryHandler(add_more, pattern='^add_more$'),
             CallbackQueryHandler(cancel_all, pattern='^cancel_all$')
         ]
     },
     fallbacks=[CommandHandler('cancel', cancel_all)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='orders_conv',
+    persistent=True
 )
@@ -12,6 +12,8 @@ from database import db
 from config import config
 from keyboards import get_main_menu, get_back_keyboard
 from backup_decorator import send_backup_to_admin
+from outbox import enqueue_admin_message, wake_outbox
+from idempotency import idempotent_callback, token_callback_data
 import logging
 from datetime import datetime
 
@@ -103,7 +105,7 @@ async def amount_entered(update: Update, context):
     context.user_data['request_amount'] = amount
 
     keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_payment")],
+        [InlineKeyboardButton("✅ Подтвердить", callback_data=token_callback_data("confirm_payment", update.effective_user.id))],
         [InlineKeyboardButton("✏️ Изменить", callback_data="change_amount")],
         [InlineKeyboardButton("❌ Отмена", callback_data="cancel_payment")]
     ]
@@ -117,6 +119,7 @@ async def amount_entered(update: Update, context):
     )
     return CONFIRMING
 
+@idempotent_callback("⏳ Запрос уже отправлен")
 @send_backup_to_admin("запрос выплаты")
 async def confirm_payment(update: Update, context):
     query = update.callback_query
@@ -143,6 +146,17 @@ async def confirm_payment(update: Update, context):
             VALUES (?, ?, ?, 'pending', CURRENT_TIMESTAMP)
         """, (request_number, seller_id, amount))
 
+        # Уведомление админам: запросы на выплату срочные и в сводку не попадают
+        enqueue_admin_message(
+            cursor,
+            f"🟡 **Новый запрос на выплату**\n\n"
+            f"Номер: {request_number}\n"
+            f"Продавец: {seller_code}\n"
+            f"Сумма: {amount} руб\n\n"
+            f"Перейдите в раздел «💰 Управление платежами» для подтверждения."
+        )
+    wake_outbox(context)
+
     await query.edit_message_text(
         f"✅ Запрос на выплату отправлен!\n\n"
         f"Номер запроса: {request_number}\n"
@@ -155,20 +169,6 @@ async def confirm_payment(update: Update, context):
         reply_markup=get_main_menu()
     )
 
-    # Уведомление админам
-    for admin_id in config.ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=f"🟡 **Новый запрос на выплату**\n\n"
-                     f"Номер: {request_number}\n"
-                     f"Продавец: {seller_code}\n"
-                     f"Сумма: {amount} руб\n\n"
-                     f"Перейдите в раздел «💰 Управление платежами» для подтверждения."
-            )
-        except Exception as e:
-            logger.error(f"Не удалось уведомить админа {admin_id}: {e}")
-
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -210,11 +210,14 @@ payment_conv = ConversationHandler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, amount_entered)
         ],
         CONFIRMING: [
-            CallbackQueryHandler(confirm_payment, pattern='^confirm_payment$'),
+            CallbackQueryHandler(confirm_payment, pattern='^confirm_payment(:\\w+)?$'),
             CallbackQueryHandler(change_amount, pattern='^change_amount$'),
             CallbackQueryHandler(cancel_payment, pattern='^cancel_payment$')
         ]
     },
     fallbacks=[CommandHandler('cancel', cancel_payment)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='payment_conv',
+    persistent=True
 )
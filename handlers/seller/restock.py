@@ -13,6 +13,8 @@ from database import db
 from config import config
 from keyboards import get_back_keyboard, get_restock_confirm_keyboard
 from backup_decorator import send_backup_to_admin
+from outbox import enqueue_admin_message, wake_outbox
+from sessions import compact_rows
 import logging
 from datetime import datetime
 
@@ -64,7 +66,7 @@ async def restock_start(update: Update, context):
         return ConversationHandler.END
 
     # Сохраняем список товаров в контекст
-    context.user_data['products'] = products
+    context.user_data['products'] = compact_rows(products)
     context.user_data['cart'] = {}  # товары, добавленные в текущую заявку
 
     await show_product_selection(update, context)
@@ -250,22 +252,21 @@ async def restock_confirm(update: Update, context):
                 VALUES (?, ?, ?)
             """, (request_id, prod_id, item['qty']))
 
-    # Уведомляем админов
-    items_summary = "\n".join([f"{item['name']}: {item['qty']} упак" for item in cart.values()])
-    total_sum = sum(item['qty'] * item['price'] for item in cart.values())
-    for admin_id in config.ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=f"🆘 **Новая заявка на пополнение склада!**\n\n"
-                     f"Номер: {request_number}\n"
-                     f"Продавец: {seller_code}\n"
-                     f"{items_summary}\n"
-                     f"Общая сумма: {total_sum} руб\n\n"
-                     f"Перейдите в раздел «🆘 Пополнение склада» для обработки."
-            )
-        except Exception as e:
-            logger.error(f"Не удалось уведомить админа {admin_id}: {e}")
+        # Уведомляем админов (в той же транзакции; в часы пик – сводкой)
+        items_summary = "\n".join([f"{item['name']}: {item['qty']} упак" for item in cart.values()])
+        total_sum = sum(item['qty'] * item['price'] for item in cart.values())
+        enqueue_admin_message(
+            cursor,
+            f"🆘 **Новая заявка на пополнение склада!**\n\n"
+            f"Номер: {request_number}\n"
+            f"Продавец: {seller_code}\n"
+            f"{items_summary}\n"
+            f"Общая сумма: {total_sum} руб\n\n"
+            f"Перейдите в раздел «🆘 Пополнение склада» для обработки.",
+            kind='restock_request',
+            summary=f"{request_number} ({seller_code}): {total_sum} руб"
+        )
+    wake_outbox(context)
 
     await query.edit_message_text(
         f"✅ Заявка на пополнение №{request_number} создана!\n\n"
@@ -319,5 +320,8 @@ restock_conv = ConversationHandler(
         ]
     },
     fallbacks=[CommandHandler('cancel', restock_cancel)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='restock_conv',
+    persistent=True
 )
@@ -14,6 +14,7 @@ from database import db
 from config import config
 from keyboards import get_seller_menu, get_back_keyboard
 from backup_decorator import send_backup_to_admin
+from idempotency import idempotent_callback, token_callback_data
 import logging
 from datetime import datetime
 
@@ -30,7 +31,7 @@ async def sales_start(update: Update, context):
         cursor.execute("SELECT id, seller_code FROM sellers WHERE telegram_id = ?", (user_id,))
         seller = cursor.fetchone()
         if not seller:
-            await update.message.reply_text(
+            await update.effective_message.reply_text(
                 "❌ Вы не активированы как продавец. Нажмите /start для активации.",
                 reply_markup=get_seller_menu('')
             )
@@ -54,7 +55,7 @@ async def sales_start(update: Update, context):
         logger.info("Found %d products with positive stock", len(products))
 
     if not products:
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             "📭 У вас нет товаров в наличии для продажи.",
             reply_markup=get_seller_menu(seller_code)
         )
@@ -72,7 +73,7 @@ async def sales_start(update: Update, context):
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    await update.message.reply_text(
+    await update.effective_message.reply_text(
         "💰 Выберите товар, который продали:",
         reply_markup=reply_markup
     )
@@ -171,7 +172,7 @@ async def quantity_entered(update: Update, context):
     total = qty * price
 
     keyboard = [
-        [InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_sale")],
+        [InlineKeyboardButton("✅ Подтвердить", callback_data=token_callback_data("confirm_sale", update.effective_user.id))],
         [InlineKeyboardButton("✏️ Изменить", callback_data="change_qty")],
         [InlineKeyboardButton("❌ Отмена", callback_data="cancel_sale")]
     ]
@@ -188,6 +189,7 @@ async def quantity_entered(update: Update, context):
     )
     return CONFIRMING
 
+@idempotent_callback("⏳ Продажа уже оформлена")
 @send_backup_to_admin("продажа товара")
 async def confirm_sale(update: Update, context):
     query = update.callback_query
@@ -308,11 +310,14 @@ sales_conv = ConversationHandler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, quantity_entered)
         ],
         CONFIRMING: [
-            CallbackQueryHandler(confirm_sale, pattern='^confirm_sale$'),
+            CallbackQueryHandler(confirm_sale, pattern='^confirm_sale(:\\w+)?$'),
             CallbackQueryHandler(change_qty, pattern='^change_qty$'),
             CallbackQueryHandler(cancel_sale, pattern='^cancel_sale$')
         ]
     },
     fallbacks=[CommandHandler('cancel', cancel_sale)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='sales_conv',
+    persistent=True
 )
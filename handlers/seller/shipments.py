@@ -14,7 +14,10 @@ from telegram.ext import ConversationHandler, CommandHandler, MessageHandler, Ca
 from database import db
 from config import config
 from keyboards import get_seller_menu, get_back_keyboard
-from backup_decorator import send_backup_to_admin
+from backup_decorator import send_backup_to_admin, skip_backup
+from outbox import enqueue_admin_message, wake_outbox
+from state_machine import transition
+from sessions import compact_rows
 import logging
 
 logger = logging.getLogger(__name__)
@@ -135,7 +138,8 @@ async def shipment_selected(update: Update, context):
         text += f"• {product_name}: {qty} упак × {price} руб = {subtotal} руб\n"
     text += f"\n**Общая сумма: {total} руб**"
 
-    context.user_data['shipment_items'] = items
+    # Храним компактные записи: sqlite3.Row нельзя скопировать для персистентности
+    context.user_data['shipment_items'] = compact_rows(items)
 
     keyboard = [
         [InlineKeyboardButton("✅ Подтвердить получение", callback_data="confirm_receipt")],
@@ -298,12 +302,98 @@ async def final_confirm(update: Update, context):
     underdelivered = []
     items_summary = []
 
+    # Если заявка от самого Р – это пополнение его склада
+    if order_seller_id == central_id:
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Закрываем заявку; если она уже закрыта – ничего не делаем
+            completed = transition(cursor, 'order', shipment_id, 'completed')
+            if completed:
+                # Пополнение: просто добавляем полученное на склад Р и увеличиваем его долг
+                for item in items:
+                    product_id = item['product_id']
+                    product_name = item['product_name']
+                    ordered = item['quantity_ordered']
+                    rec_qty = received.get(item['item_id'], 0)
+                    price = item['price_at_order']
+                    items_summary.append(f"{product_name}: {rec_qty}/{ordered}")
+
+                    # Добавляем на склад Р
+                    cursor.execute("SELECT quantity FROM seller_products WHERE seller_id = ? AND product_id = ?", (central_id, product_id))
+                    existing = cursor.fetchone()
+                    if existing:
+                        cursor.execute("UPDATE seller_products SET quantity = quantity + ? WHERE seller_id = ? AND product_id = ?", (rec_qty, central_id, product_id))
+                    else:
+                        cursor.execute("INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)", (central_id, product_id, rec_qty))
+
+                    # Увеличиваем долг Р
+                    cursor.execute("SELECT total_debt FROM seller_debt WHERE seller_id = ?", (central_id,))
+                    debt = cursor.fetchone()
+                    if debt:
+                        cursor.execute("UPDATE seller_debt SET total_debt = total_debt + ? WHERE seller_id = ?", (price * rec_qty, central_id))
+                    else:
+                        cursor.execute("INSERT INTO seller_debt (seller_id, total_debt) VALUES (?, ?)", (central_id, price * rec_qty))
+
+                    # Обновляем полученное количество в order_items
+                    cursor.execute("UPDATE order_items SET quantity_received = ? WHERE id = ?", (rec_qty, item['item_id']))
+
+                    if rec_qty < ordered:
+                        underdelivered.append(item)
+
+                # Уведомляем админов о пополнении (в той же транзакции)
+                items_text = "\n".join(items_summary)
+                enqueue_admin_message(
+                    cursor,
+                    f"🟢 **Склад Р пополнен!**\n\n"
+                    f"Заявка №{order_number}\n"
+                    f"Получено:\n{items_text}",
+                    kind='replenishment',
+                    summary=f"{order_number}: {', '.join(items_summary)}"
+                )
+        if not completed:
+            await query.edit_message_text("ℹ️ Получение по этой заявке уже подтверждено.", reply_markup=None)
+            skip_backup()
+            context.user_data.clear()
+            return ConversationHandler.END
+        wake_outbox(context)
+
+        await query.edit_message_text(
+            "✅ Получение подтверждено. Товар добавлен на склад Р.",
+            reply_markup=None
+        )
+        await context.bot.send_message(
+            chat_id=update.effective_user.id,
+            text="Выберите следующее действие:",
+            reply_markup=get_seller_menu(seller_code)
+        )
+        context.user_data.clear()
+        return ConversationHandler.END
+
     with db.get_connection() as conn:
         cursor = conn.cursor()
 
-        # Если заявка от самого Р – это пополнение его склада
-        if order_seller_id == central_id:
-            # Пополнение: просто добавляем полученное на склад Р и увеличиваем его долг
+        # Иначе заявка от другого продавца – списываем со склада Р
+        # Сначала проверяем наличие всех товаров на складе Р
+        for item in items:
+            product_id = item['product_id']
+            product_name = item['product_name']
+            rec_qty = received.get(item['item_id'], 0)
+            cursor.execute("SELECT quantity FROM seller_products WHERE seller_id = ? AND product_id = ?", (central_id, product_id))
+            stock_row = cursor.fetchone()
+            if not stock_row or stock_row['quantity'] < rec_qty:
+                await query.edit_message_text(
+                    f"❌ На складе Р недостаточно товара '{product_name}'.\n"
+                    f"Доступно: {stock_row['quantity'] if stock_row else 0}, запрошено: {rec_qty}.\n"
+                    f"Операция отменена. Попробуйте ввести меньшее количество."
+                )
+                skip_backup()
+                return
+
+        # Закрываем заявку; если она уже закрыта – ничего не делаем
+        completed = transition(cursor, 'order', shipment_id, 'completed')
+        if completed:
+            # Если всё в порядке, выполняем операции
             for item in items:
                 product_id = item['product_id']
                 product_name = item['product_name']
@@ -312,21 +402,24 @@ async def final_confirm(update: Update, context):
                 price = item['price_at_order']
                 items_summary.append(f"{product_name}: {rec_qty}/{ordered}")
 
-                # Добавляем на склад Р
-                cursor.execute("SELECT quantity FROM seller_products WHERE seller_id = ? AND product_id = ?", (central_id, product_id))
+                # Списываем со склада Р
+                cursor.execute("UPDATE seller_products SET quantity = quantity - ? WHERE seller_id = ? AND product_id = ?", (rec_qty, central_id, product_id))
+
+                # Добавляем на склад заказчика
+                cursor.execute("SELECT quantity FROM seller_products WHERE seller_id = ? AND product_id = ?", (seller_id, product_id))
                 existing = cursor.fetchone()
                 if existing:
-                    cursor.execute("UPDATE seller_products SET quantity = quantity + ? WHERE seller_id = ? AND product_id = ?", (rec_qty, central_id, product_id))
+                    cursor.execute("UPDATE seller_products SET quantity = quantity + ? WHERE seller_id = ? AND product_id = ?", (rec_qty, seller_id, product_id))
                 else:
-                    cursor.execute("INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)", (central_id, product_id, rec_qty))
+                    cursor.execute("INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)", (seller_id, product_id, rec_qty))
 
-                # Увеличиваем долг Р
-                cursor.execute("SELECT total_debt FROM seller_debt WHERE seller_id = ?", (central_id,))
+                # Увеличиваем долг заказчика
+                cursor.execute("SELECT total_debt FROM seller_debt WHERE seller_id = ?", (seller_id,))
                 debt = cursor.fetchone()
                 if debt:
-                    cursor.execute("UPDATE seller_debt SET total_debt = total_debt + ? WHERE seller_id = ?", (price * rec_qty, central_id))
+                    cursor.execute("UPDATE seller_debt SET total_debt = total_debt + ? WHERE seller_id = ?", (price * rec_qty, seller_id))
                 else:
-                    cursor.execute("INSERT INTO seller_debt (seller_id, total_debt) VALUES (?, ?)", (central_id, price * rec_qty))
+                    cursor.execute("INSERT INTO seller_debt (seller_id, total_debt) VALUES (?, ?)", (seller_id, price * rec_qty))
 
                 # Обновляем полученное количество в order_items
                 cursor.execute("UPDATE order_items SET quantity_received = ? WHERE id = ?", (rec_qty, item['item_id']))
@@ -334,101 +427,24 @@ async def final_confirm(update: Update, context):
                 if rec_qty < ordered:
                     underdelivered.append(item)
 
-            # Обновляем статус заявки
-            cursor.execute("UPDATE orders SET status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE id = ?", (shipment_id,))
-
-            # Уведомляем админов о пополнении
+            # Уведомляем админов о завершении поставки (в той же транзакции)
             items_text = "\n".join(items_summary)
-            for admin_id in config.ADMIN_IDS:
-                try:
-                    await context.bot.send_message(
-                        chat_id=admin_id,
-                        text=f"🟢 **Склад Р пополнен!**\n\n"
-                             f"Заявка №{order_number}\n"
-                             f"Получено:\n{items_text}"
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось уведомить админа {admin_id}: {e}")
-
-            await query.edit_message_text(
-                "✅ Получение подтверждено. Товар добавлен на склад Р.",
-                reply_markup=None
+            enqueue_admin_message(
+                cursor,
+                f"🟢 **Поставка завершена**\n\n"
+                f"Номер заявки: {order_number}\n"
+                f"Продавец: {seller_code}\n"
+                f"Получено:\n{items_text}\n\n"
+                f"Заявка переведена в статус «Завершена».",
+                kind='receipt',
+                summary=f"{order_number} ({seller_code}): {', '.join(items_summary)}"
             )
-            await context.bot.send_message(
-                chat_id=update.effective_user.id,
-                text="Выберите следующее действие:",
-                reply_markup=get_seller_menu(seller_code)
-            )
-            context.user_data.clear()
-            return ConversationHandler.END
-
-        # Иначе заявка от другого продавца – списываем со склада Р
-        # Сначала проверяем наличие всех товаров на складе Р
-        for item in items:
-            product_id = item['product_id']
-            product_name = item['product_name']
-            rec_qty = received.get(item['item_id'], 0)
-            cursor.execute("SELECT quantity FROM seller_products WHERE seller_id = ? AND product_id = ?", (central_id, product_id))
-            stock_row = cursor.fetchone()
-            if not stock_row or stock_row['quantity'] < rec_qty:
-                await query.edit_message_text(
-                    f"❌ На складе Р недостаточно товара '{product_name}'.\n"
-                    f"Доступно: {stock_row['quantity'] if stock_row else 0}, запрошено: {rec_qty}.\n"
-                    f"Операция отменена. Попробуйте ввести меньшее количество."
-                )
-                return
-
-        # Если всё в порядке, выполняем операции
-        for item in items:
-            product_id = item['product_id']
-            product_name = item['product_name']
-            ordered = item['quantity_ordered']
-            rec_qty = received.get(item['item_id'], 0)
-            price = item['price_at_order']
-            items_summary.append(f"{product_name}: {rec_qty}/{ordered}")
-
-            # Списываем со склада Р
-            cursor.execute("UPDATE seller_products SET quantity = quantity - ? WHERE seller_id = ? AND product_id = ?", (rec_qty, central_id, product_id))
-
-            # Добавляем на склад заказчика
-            cursor.execute("SELECT quantity FROM seller_products WHERE seller_id = ? AND product_id = ?", (seller_id, product_id))
-            existing = cursor.fetchone()
-            if existing:
-                cursor.execute("UPDATE seller_products SET quantity = quantity + ? WHERE seller_id = ? AND product_id = ?", (rec_qty, seller_id, product_id))
-            else:
-                cursor.execute("INSERT INTO seller_products (seller_id, product_id, quantity) VALUES (?, ?, ?)", (seller_id, product_id, rec_qty))
-
-            # Увеличиваем долг заказчика
-            cursor.execute("SELECT total_debt FROM seller_debt WHERE seller_id = ?", (seller_id,))
-            debt = cursor.fetchone()
-            if debt:
-                cursor.execute("UPDATE seller_debt SET total_debt = total_debt + ? WHERE seller_id = ?", (price * rec_qty, seller_id))
-            else:
-                cursor.execute("INSERT INTO seller_debt (seller_id, total_debt) VALUES (?, ?)", (seller_id, price * rec_qty))
-
-            # Обновляем полученное количество в order_items
-            cursor.execute("UPDATE order_items SET quantity_received = ? WHERE id = ?", (rec_qty, item['item_id']))
-
-            if rec_qty < ordered:
-                underdelivered.append(item)
-
-        # Обновляем статус заявки
-        cursor.execute("UPDATE orders SET status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE id = ?", (shipment_id,))
-
-    # Уведомляем админов о завершении поставки
-    items_text = "\n".join(items_summary)
-    for admin_id in config.ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=f"🟢 **Поставка завершена**\n\n"
-                     f"Номер заявки: {order_number}\n"
-                     f"Продавец: {seller_code}\n"
-                     f"Получено:\n{items_text}\n\n"
-                     f"Заявка переведена в статус «Завершена»."
-            )
-        except Exception as e:
-            logger.error(f"Не удалось уведомить админа {admin_id}: {e}")
+    if not completed:
+        await query.edit_message_text("ℹ️ Получение по этой заявке уже подтверждено.", reply_markup=None)
+        skip_backup()
+        context.user_data.clear()
+        return ConversationHandler.END
+    wake_outbox(context)
 
     if underdelivered:
         context.user_data['underdelivered'] = underdelivered
@@ -606,5 +622,8 @@ shipments_conv = ConversationHandler(
         ]
     },
     fallbacks=[CommandHandler('cancel', shipments_start)],
-    allow_reentry=True
+    allow_reentry=True,
+    conversation_timeout=config.CONVERSATION_TIMEOUT,
+    name='shipments_conv',
+    persistent=True
 )
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Защита кнопок подтверждения от двойного нажатия.
+
+Клавиатура подтверждения получает одноразовый токен в callback_data
+(например, "confirm_sale:3f2a9c01b7d4"). Первое нажатие гасит токен в SQLite,
+повторные получают мгновенный ответ без записи в БД, бэкапа и уведомлений. Повторная
+отрисовка той же кнопки получает тот же токен, пока он не погашен.
+
+Токен гасится в одной транзакции с записями обработчика (Database.atomic):
+если обработчик упал, откатываются и они, и погашение – повторное нажатие
+выполнит действие один раз. Если записи успели зафиксироваться (перед
+запросом в сеть), токен остаётся погашенным.
+"""
+
+from functools import wraps
+import logging
+
+from database import db
+import replies
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SEPARATOR = ':'
+
+
+def token_callback_data(action, user_id, prefix=None):
+    """
+    Формирует callback_data с одноразовым токеном.
+    prefix – начало callback_data, если оно отличается от action
+    (например, "admin_order_ship_15").
+    """
+    # Токен привязан к кнопке целиком: у каждой заявки свой
+    token = db.issue_callback_token(user_id, prefix or action)
+    return f"{prefix or action}{TOKEN_SEPARATOR}{token}"
+
+
+def split_callback_data(data):
+    """Разделяет callback_data на основную часть и токен (или None)"""
+    if TOKEN_SEPARATOR in data:
+        base, token = data.rsplit(TOKEN_SEPARATOR, 1)
+        return base, token
+    return data, None
+
+
+def idempotent_callback(repeat_answer):
+    """
+    Декоратор для обработчиков подтверждения.
+    Должен стоять над send_backup_to_admin, чтобы повтор не отправлял бэкап.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(update, context, *args, **kwargs):
+            query = update.callback_query
+            _, token = split_callback_data(query.data or '')
+
+            # Кнопки, отправленные до появления токенов, обрабатываем как раньше
+            if token is None:
+                return await func(update, context, *args, **kwargs)
+
+            try:
+                with db.atomic():
+                    if not db.consume_callback_token(token):
+                        logger.info("Повторное нажатие %s проигнорировано", query.data)
+                        await query.answer(repeat_answer)
+                        return None
+                    return await func(update, context, *args, **kwargs)
+            except Exception:
+                # Записи отменены вместе с погашением – отложенный текст ответа на колбэк не отправляем
+                replies.discard_replies()
+                raise
+        return wrapper
+    return decorator
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Ротация журнала действий: старые записи logs уходят в архив.
+
+Периодическая задача переносит записи старше AUDIT_RETENTION_DAYS в
+помесячные файлы AUDIT_ARCHIVE_DIR/logs_ГГГГ-ММ.ndjson.gz (одна JSON-строка
+на запись) и удаляет их из таблицы – она остаётся небольшой, а вместе с
+ней полный JSON-бэкап после каждого действия.
+
+Файл месяца пополняется без распаковки: новые записи дописываются в
+конец отдельным gzip-блоком (gzip допускает склейку блоков). Записи
+удаляются из таблицы только после fsync; если бот упадёт между этими
+шагами, записи попадут в архив повторно – поиск отбрасывает повторы по id,
+а оборванный при падении последний блок пропускается при чтении.
+
+Поиск (/logs) идёт по таблице и архивным месяцам, от новых к старым.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+from config import config
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Записей за один проход (между проходами цикл событий свободен)
+BATCH_SIZE = 2000
+
+COLUMNS = ('id', 'user_id', 'user_role', 'action', 'details', 'created_at')
+
+_MONTH_FILE = re.compile(r'^logs_(\d{4}-\d{2})\.ndjson\.gz$')
+
+
+class LogArchive:
+    """Перенос старых записей журнала в помесячные файлы и поиск по ним"""
+
+    def __init__(self, database, directory=None, retention_days=None):
+        self.database = database
+        self.directory = directory or config.AUDIT_ARCHIVE_DIR
+        self.retention_days = config.AUDIT_RETENTION_DAYS if retention_days is None else retention_days
+        # Статистика
+        self.runs = 0
+        self.archived = 0
+        self.last_run_at = None
+        self.last_archived = 0
+        self.last_run_ms = 0.0
+
+    # ---- Файлы ----
+    def path(self, month):
+        return os.path.join(self.directory, f"logs_{month}.ndjson.gz")
+
+    def months(self):
+        """Архивные месяцы, от новых к старым"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = (_MONTH_FILE.match(name) for name in os.listdir(self.directory))
+        return sorted((match.group(1) for match in found if match), reverse=True)
+
+    def _append(self, month, rows):
+        """Дописывает записи в конец файла месяца новым gzip-блоком"""
+        os.makedirs(self.directory, exist_ok=True)
+        lines = ''.join(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows)
+        with open(self.path(month), 'ab') as f:
+            size = f.tell()
+            try:
+                with gzip.GzipFile(fileobj=f, mode='wb') as member:
+                    member.write(lines.encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception:
+                # Недописанный блок не оставляем: за ним следующие не прочитались бы
+                f.truncate(size)
+                raise
+
+    def read_month(self, month):
+        """Записи архивного месяца (оборванный хвост файла пропускается)"""
+        path = self.path(month)
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    yield json.loads(line)
+            except (EOFError, OSError, json.JSONDecodeError) as e:
+                logger.error(f"Архив журнала {path} повреждён: {e}")
+
+    # ---- Ротация ----
+    def cutoff(self):
+        # UTC, как CURRENT_TIMESTAMP в created_at
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - self.retention_days * 86400))
+
+    def archive_batch(self, cutoff, limit=BATCH_SIZE):
+        """Переносит до limit записей старше cutoff; возвращает их число"""
+        with self.database.get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM logs WHERE created_at < ? ORDER BY created_at LIMIT ?",
+                (cutoff, limit)
+            ).fetchall()
+        if not rows:
+            return 0
+
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(str(row['created_at'])[:7], []).append(tuple(row))
+        for month, month_rows in by_month.items():
+            self._append(month, month_rows)
+
+        # Только после того, как записи на диске
+        with self.database.get_connection() as conn:
+            conn.executemany("DELETE FROM logs WHERE id = ?", [(row['id'],) for row in rows])
+        return len(rows)
+
+    async def rotate(self):
+        """Переносит все записи старше срока хранения; возвращает их число"""
+        if not self.retention_days:
+            return 0
+        started = time.perf_counter()
+        cutoff = self.cutoff()
+        moved = 0
+        while True:
+            count = self.archive_batch(cutoff)
+            moved += count
+            if count < BATCH_SIZE:
+                break
+            await asyncio.sleep(0)
+
+        self.runs += 1
+        self.archived += moved
+        self.last_run_at = datetime.now().isoformat(timespec='seconds')
+        self.last_archived = moved
+        self.last_run_ms = (time.perf_counter() - started) * 1000
+        if moved:
+            logger.info(f"В архив журнала перенесено записей: {moved} (старше {cutoff}), "
+                        f"{self.last_run_ms:.0f} мс")
+        return moved
+
+    # ---- Поиск ----
+    def search(self, text=None, user_id=None, month=None, limit=20):
+        """
+        Записи журнала, от новых к старым: сначала таблица, затем архивные
+        месяцы, пока не наберётся limit. month – 'ГГГГ-ММ' или None (все).
+        """
+        conditions, parameters = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            parameters.append(user_id)
+        if text:
+            conditions.append("(action LIKE ? OR details LIKE ? OR user_role LIKE ?)")
+            parameters.extend([f"%{text}%"] * 3)
+        if month:
+            conditions.append("created_at LIKE ?")
+            parameters.append(f"{month}%")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.database.get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM logs {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*parameters, limit)
+            ).fetchall()
+        result = [dict(row) for row in rows]
+        seen = {record['id'] for record in result}
+
+        needle = text.casefold() if text else None
+        for archived_month in self.months():
+            if len(result) >= limit:
+                break
+            if month and archived_month != month:
+                continue
+            found = []
+            for record in self.read_month(archived_month):
+                if record['id'] in seen:
+                    continue
+                if user_id is not None and record['user_id'] != user_id:
+                    continue
+                if needle and not any(needle in str(record[key] or '').casefold()
+                                      for key in ('action', 'details', 'user_role')):
+                    continue
+                seen.add(record['id'])
+                found.append(record)
+            found.sort(key=lambda record: (record['created_at'], record['id']), reverse=True)
+            result.extend(found[:limit - len(result)])
+        return result
+
+    def stats(self):
+        months = self.months()
+        return {
+            'retention_days': self.retention_days,
+            'directory': self.directory,
+            'months': len(months),
+            'archive_bytes': sum(os.path.getsize(self.path(month)) for month in months),
+            'runs': self.runs,
+            'archived': self.archived,
+            'last_run_at': self.last_run_at,
+            'last_archived': self.last_archived,
+            'last_run_ms': round(self.last_run_ms, 2),
+        }
+
+
+archive = LogArchive(db)
+
+
+async def rotate_logs(context):
+    try:
+        await archive.rotate()
+    except Exception as e:
+        logger.error(f"Ошибка ротации журнала действий: {e}")
+
+
+def setup_log_archive(application):
+    """Периодический перенос старых записей журнала в архив"""
+    if not config.AUDIT_RETENTION_DAYS:
+        return
+    application.job_queue.run_repeating(
+        rotate_logs,
+        interval=config.AUDIT_ARCHIVE_INTERVAL,
+        first=60,
+        name='rotate_logs'
+    )
+
+
+def stats():
+    return archive.stats()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сторож цикла событий.
+
+Обработчики выполняют SQLite-запросы и собирают бэкап синхронно, прямо
+в корутинах, и на это время цикл событий останавливается. Сторож
+измеряет задержку цикла постоянно: задача в цикле засыпает на
+LOOP_WATCHDOG_INTERVAL и смотрит, насколько позже проснулась.
+
+Пока цикл стоит, задача проснуться не может, поэтому остановку ловит
+отдельный поток: если отметка задачи не обновлялась дольше LOOP_STALL_MS,
+он снимает стек потока цикла и определяет обработчик (по обёртке
+из metrics) и обновление (по активной трассе). Когда цикл оживает,
+остановка с полной длительностью попадает в лог и в метрики.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from config import config
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Сколько кадров стека сохранять для остановки
+STACK_DEPTH = 12
+
+# Границы корзин задержки цикла (сек)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _handler_name(frame):
+    """Имя обработчика: ближайшая к вершине стека обёртка metrics._timed"""
+    while frame is not None:
+        if frame.f_code.co_name == 'wrapper' and frame.f_globals.get('__name__') == 'metrics':
+            return frame.f_locals.get('name')
+        frame = frame.f_back
+    return None
+
+
+class LoopWatchdog:
+    """Измерение задержки цикла событий и поиск виновника остановок"""
+
+    def __init__(self, interval=None, threshold_ms=None):
+        self.interval = interval or config.LOOP_WATCHDOG_INTERVAL
+        self.threshold = (config.LOOP_STALL_MS if threshold_ms is None else threshold_ms) / 1000
+        self.samples = deque(maxlen=2000)
+        self.stalls = deque(maxlen=50)
+        self._heartbeat = time.monotonic()
+        self._pending = None        # остановка, замеченная потоком и ещё не закрытая
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Запускает сторож (вызывать внутри работающего цикла); LOOP_STALL_MS=0 – не запускать"""
+        if self._task is not None or not self.threshold:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._monitor())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._thread.join(timeout=1)
+        self._thread = None
+
+    async def _monitor(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.samples.append(lag)
+            loop_lag.observe(value=lag)
+            if lag >= self.threshold:
+                self._close_stall(lag)
+
+    def _watch(self):
+        """Поток: замечает остановку, пока она идёт, и снимает стек цикла"""
+        while not self._stop.wait(self.interval):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled < self.threshold or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._pending = {
+                'handler': _handler_name(frame),
+                'update': tracing.active_update(),
+                'stack': [
+                    f"{entry.filename}:{entry.lineno} in {entry.name}"
+                    for entry in traceback.extract_stack(frame)[-STACK_DEPTH:]
+                ],
+            }
+
+    def _close_stall(self, lag):
+        pending, self._pending = self._pending, None
+        stall = {'at': time.time(), 'lag_ms': round(lag * 1000, 1)}
+        if pending:
+            stall.update(pending)
+        handler = stall.get('handler') or 'unknown'
+        self.stalls.append(stall)
+        loop_stalls.inc(handler)
+        update = stall.get('update') or {}
+        stack = '\n    '.join(stall.get('stack', [])) or '—'
+        logger.warning(
+            f"Цикл событий стоял {stall['lag_ms']} мс: обработчик {handler}, "
+            f"update {update.get('update_id')}, trace {update.get('trace_id')}\n    {stack}"
+        )
+
+    def percentiles(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: samples[min(len(samples) - 1, int(len(samples) * q))] for q in QUANTILES}
+
+    def stats(self):
+        return {
+            'lag_ms': {f"p{int(q * 100)}": round(value * 1000, 2) for q, value in self.percentiles().items()},
+            'stalls': len(self.stalls),
+            'recent_stalls': [
+                {key: stall.get(key) for key in ('at', 'lag_ms', 'handler', 'update')}
+                for stall in list(self.stalls)[-10:]
+            ],
+        }
+
+
+watchdog = LoopWatchdog()
+
+loop_lag = metrics.registry.register(metrics.Histogram(
+    'bot_event_loop_lag_seconds', 'Задержка цикла событий', buckets=LAG_BUCKETS))
+loop_stalls = metrics.registry.register(metrics.Counter(
+    'bot_event_loop_stalls_total', 'Остановки цикла событий дольше LOOP_STALL_MS', ['handler']))
+metrics.registry.register(metrics.Gauge(
+    'bot_event_loop_lag_quantile_seconds', 'Процентили задержки цикла по последним замерам', ['quantile'],
+    collect=lambda: [((str(q),), value) for q, value in watchdog.percentiles().items()]))
@@ -7,7 +7,6 @@
 
 import logging
 import json
-import sqlite3
 import io
 import os
 import asyncio
@@ -19,7 +18,7 @@ from telegram.ext import ConversationHandler
 
 # Добавляем импорты для веб-сервера
 from starlette.applications import Starlette
-from starlette.responses import Response, PlainTextResponse
+from starlette.responses import Response, PlainTextResponse, JSONResponse
 from starlette.routing import Route
 import uvicorn
 
@@ -28,6 +27,20 @@ from database import db
 from backup import backup
 from backup_decorator import send_backup_to_admin
 from keyboards import get_main_menu, get_admin_menu
+from update_queue import create_update_queue
+from persistence import SQLitePersistence
+import sessions
+from outbound import OutboundRateLimiter
+import outbox
+import replies
+import metrics
+import tracing
+import slow_queries
+import sql_budget
+import log_archive
+from loop_watchdog import watchdog
+import recorder
+from middleware import BotApplication
 
 # Общие обработчики
 from handlers.common import start, menu_handler, handle_message, activation_conv
@@ -48,6 +61,10 @@ from handlers.admin.settings import admin_settings_conv
 from handlers.admin.backup import manual_backup
 from handlers.admin.restore import restore_conv
 from handlers.admin.add_test_seller import add_seller_handler
+from handlers.admin.slow_queries import slow_queries_command
+from handlers.admin.profile import profile_command
+from handlers.admin.memsnap import memsnap_command
+from handlers.admin.logs import logs_command
 from handlers.admin.restock import restock_admin_conv    # новый импорт
 
 # Настройка логирования
@@ -90,33 +107,7 @@ async def emergency_restore(update: Update, context):
             caption="📦 Бэкап перед экстренным восстановлением"
         )
         
-        conn = sqlite3.connect(config.DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = OFF")
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        for table in tables:
-            table_name = table[0]
-            if table_name != 'sqlite_sequence':
-                cursor.execute(f"DELETE FROM {table_name}")
-        
-        restored = 0
-        for table_name, rows in data.items():
-            if table_name != 'sqlite_sequence' and rows:
-                columns = list(rows[0].keys())
-                placeholders = ','.join(['?'] * len(columns))
-                column_names = ','.join(columns)
-                for row in rows:
-                    values = [row[col] for col in columns]
-                    cursor.execute(
-                        f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})",
-                        values
-                    )
-                    restored += 1
-        
-        cursor.execute("PRAGMA foreign_keys = ON")
-        conn.commit()
-        conn.close()
+        restored = backup.restore_json(data)
         
         await update.message.reply_text(f"✅ Восстановлено {restored} записей из {document.file_name}")
         db.log_action(
@@ -132,31 +123,47 @@ async def emergency_restore(update: Update, context):
 
 # === ОТЛАДОЧНЫЙ ОБРАБОТЧИК ВСЕХ КОЛБЭКОВ ===
 async def debug_callback(update: Update, context):
+    # На колбэк не отвечаем: ответ ровно один раз отправляет replies.finish_update (middleware)
     if update.callback_query:
         logger.info(f"🔥 GLOBAL CALLBACK: {update.callback_query.data}")
-        await update.callback_query.answer()
     return
 
-# === ФУНКЦИЯ ДЛЯ ЗАПУСКА С ВЕБХУКАМИ ===
-async def run_webhook():
-    logger.info("Запуск бота с вебхуками...")
-    TOKEN = config.BOT_TOKEN
-    URL = os.environ.get("RENDER_EXTERNAL_URL")
-    PORT = int(os.environ.get("PORT", 10000))
-    if not URL:
-        logger.error("RENDER_EXTERNAL_URL не установлен!")
-        return
+# === РЕГИСТРАЦИЯ ОБРАБОТЧИКОВ ===
+def register_handlers(application):
+    """Регистрирует все обработчики (общие для вебхуков и polling)"""
+    # Что делается до и после обработчиков каждого обновления (единица работы,
+    # пакет ответов, трасса, счётчики) – в middleware.BotApplication
+    
+    # Запись обновлений для воспроизведения (RECORD_DIR)
+    recorder.setup_recorder(application)
     
-    application = Application.builder().token(TOKEN).updater(None).build()
+    # Трасса обновления: обработчики, SQL, Telegram API, бэкапы
+    tracing.setup_tracing(application)
     
     # Добавляем отладочный обработчик с самым высоким приоритетом
     application.add_handler(CallbackQueryHandler(debug_callback), group=-1)
     
+    # Очистка заброшенных сессий
+    sessions.setup_sessions(application)
+    
+    # Статистика SQL-запросов и планы медленных
+    slow_queries.setup_slow_queries()
+    
+    # Фоновая доставка уведомлений из outbox
+    outbox.setup_outbox(application)
+    
+    # Перенос старых записей журнала действий в архив
+    log_archive.setup_log_archive(application)
+    
     # Команды
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("menu", menu_handler))
     application.add_handler(CommandHandler("backup", manual_backup))
-    application.add_handler(CommandHandler("add_seller", add_seller_handler))
+    application.add_handler(add_seller_handler)
+    application.add_handler(CommandHandler("slow_queries", slow_queries_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("memsnap", memsnap_command))
+    application.add_handler(CommandHandler("logs", logs_command))
     application.add_handler(restore_conv)
     application.add_handler(activation_conv)
     application.add_handler(MessageHandler(filters.Document.ALL, emergency_restore))
@@ -181,6 +188,30 @@ async def run_webhook():
     application.add_handler(back_to_main_handler)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
+    # Замер времени всех обработчиков, запросов к БД и очереди – после регистрации
+    metrics.setup_metrics(application)
+
+# === ФУНКЦИЯ ДЛЯ ЗАПУСКА С ВЕБХУКАМИ ===
+async def run_webhook():
+    logger.info("Запуск бота с вебхуками...")
+    URL = os.environ.get("RENDER_EXTERNAL_URL")
+    PORT = int(os.environ.get("PORT", 10000))
+    if not URL:
+        logger.error("RENDER_EXTERNAL_URL не установлен!")
+        return
+    
+    application = (
+        Application.builder()
+        .application_class(BotApplication)
+        .bot(replies.create_bot(rate_limiter=OutboundRateLimiter()))
+        .update_queue(create_update_queue())
+        .persistence(SQLitePersistence())
+        .updater(None)
+        .build()
+    )
+    
+    register_handlers(application)
+    
     webhook_url = f"{URL}/telegram"
     await application.bot.set_webhook(webhook_url, allowed_updates=Update.ALL_TYPES)
     logger.info(f"✅ Вебхук установлен на {webhook_url}")
@@ -190,7 +221,10 @@ async def run_webhook():
             body = await request.json()
             logger.info(f"🔥 Webhook received: {body}")
             update = Update.de_json(body, application.bot)
-            await application.update_queue.put(update)
+            if not application.update_queue.offer(update):
+                # Очередь переполнена – Telegram повторит доставку позже
+                logger.warning("Очередь обновлений переполнена, update %s отклонён", update.update_id)
+                return Response(status_code=429, headers={"Retry-After": "1"})
             return Response()
         except Exception as e:
             logger.error(f"Error in webhook: {e}")
@@ -199,9 +233,53 @@ async def run_webhook():
     async def healthcheck(request):
         return PlainTextResponse("OK")
     
+    async def queue_stats(request):
+        return JSONResponse(application.update_queue.stats())
+    
+    async def session_stats(request):
+        return JSONResponse(sessions.stats())
+    
+    async def outbound_stats(request):
+        return JSONResponse(application.bot.rate_limiter.stats())
+    
+    async def outbox_stats(request):
+        return JSONResponse(outbox.dispatcher.stats())
+    
+    async def reply_stats(request):
+        return JSONResponse(application.bot.stats())
+    
+    async def trace_stats(request):
+        return JSONResponse(tracing.stats())
+    
+    async def loop_stats(request):
+        return JSONResponse(watchdog.stats())
+    
+    async def sql_budget_stats(request):
+        return JSONResponse(sql_budget.stats())
+    
+    async def recording_stats(request):
+        return JSONResponse(recorder.stats())
+    
+    async def audit_stats(request):
+        return JSONResponse({**db.audit.stats(), 'archive': log_archive.stats()})
+    
+    async def metrics_endpoint(request):
+        return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+    
     starlette_app = Starlette(routes=[
         Route("/telegram", telegram, methods=["POST"]),
         Route("/healthcheck", healthcheck, methods=["GET"]),
+        Route("/queue", queue_stats, methods=["GET"]),
+        Route("/sessions", session_stats, methods=["GET"]),
+        Route("/outbound", outbound_stats, methods=["GET"]),
+        Route("/outbox", outbox_stats, methods=["GET"]),
+        Route("/replies", reply_stats, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        Route("/traces", trace_stats, methods=["GET"]),
+        Route("/loop", loop_stats, methods=["GET"]),
+        Route("/recording", recording_stats, methods=["GET"]),
+        Route("/sql_budget", sql_budget_stats, methods=["GET"]),
+        Route("/audit", audit_stats, methods=["GET"]),
     ])
     
     logger.info(f"Запуск веб-сервера на порту {PORT}")
@@ -216,8 +294,23 @@ async def run_webhook():
     
     async with application:
         await application.start()
+        watchdog.start()
         await server.serve()
+        await watchdog.stop()
         await application.stop()
+        recorder.close_recorder()
+        db.audit.flush()
+
+async def post_init(application):
+    """Запуск фоновых служб при polling"""
+    await metrics.start_metrics_server(application)
+    watchdog.start()
+
+async def post_shutdown(application):
+    await watchdog.stop()
+    recorder.close_recorder()
+    db.audit.flush()
+    await metrics.stop_metrics_server(application)
 
 def main():
     if os.environ.get("RENDER"):
@@ -225,31 +318,18 @@ def main():
         asyncio.run(run_webhook())
     else:
         logger.info("Запуск бота локально (polling)...")
-        application = Application.builder().token(config.BOT_TOKEN).build()
-        
-        application.add_handler(CallbackQueryHandler(debug_callback), group=-1)
+        application = (
+            Application.builder()
+            .application_class(BotApplication)
+            .bot(replies.create_bot(rate_limiter=OutboundRateLimiter()))
+            .update_queue(create_update_queue())
+            .persistence(SQLitePersistence())
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("menu", menu_handler))
-        application.add_handler(CommandHandler("backup", manual_backup))
-        application.add_handler(CommandHandler("add_seller", add_seller_handler))
-        application.add_handler(restore_conv)
-        application.add_handler(activation_conv)
-        application.add_handler(MessageHandler(filters.Document.ALL, emergency_restore))
-        application.add_handler(orders_conv)
-        application.add_handler(shipments_conv)
-        application.add_handler(sales_conv)
-        application.add_handler(payment_conv)
-        application.add_handler(restock_conv)
-        application.add_handler(admin_orders_conv)
-        application.add_handler(admin_payments_conv)
-        application.add_handler(admin_reports_conv)
-        application.add_handler(admin_settings_conv)
-        application.add_handler(restock_admin_conv)
-        application.add_handler(my_orders_handler)
-        application.add_handler(stock_handler)
-        application.add_handler(back_to_main_handler)
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        register_handlers(application)
         
         logger.info("✅ Бот запущен и готов к работе (polling)")
         application.run_polling()
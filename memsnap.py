@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Снимки памяти по запросу админа.
+
+Первый /memsnap включает tracemalloc и запоминает исходный снимок.
+Каждый следующий сравнивается с предыдущим: места выделения памяти
+(файл:строка), которые выросли сильнее всего, и количество объектов
+по типам по данным gc. Рост одних и тех же строк от снимка к снимку –
+признак утечки (состояние диалогов, строки бэкапов, буферы BytesIO).
+"""
+
+import gc
+import linecache
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+# Сколько кадров стека хранить на каждое выделение
+TRACE_FRAMES = 5
+
+TOP_SITES = 25
+TOP_TRACEBACKS = 5
+TOP_TYPES = 30
+
+# Внутренности tracemalloc, импорта и самого отчёта не нужны
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _size(value):
+    for unit in ('Б', 'КБ', 'МБ'):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}" if unit == 'Б' else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} ГБ"
+
+
+def _type_counts():
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+class MemorySnapshots:
+    """Предыдущий снимок tracemalloc и счётчики объектов для сравнения"""
+
+    def __init__(self):
+        self.previous = None
+        self.previous_types = None
+        self.previous_at = None
+        self.count = 0
+
+    def is_tracing(self):
+        return tracemalloc.is_tracing()
+
+    def take(self):
+        """Снимок и отчёт о разнице с предыдущим; (краткий итог, полный текст)"""
+        started_now = not tracemalloc.is_tracing()
+        if started_now:
+            tracemalloc.start(TRACE_FRAMES)
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        types = _type_counts()
+        now = datetime.now()
+        current, peak = tracemalloc.get_traced_memory()
+
+        lines = [
+            f"Снимок памяти #{self.count + 1} от {now.strftime('%d.%m.%Y %H:%M:%S')}",
+            f"tracemalloc: сейчас {_size(current)}, пик {_size(peak)}, "
+            f"накладные расходы {_size(tracemalloc.get_tracemalloc_memory())}",
+            f"Объектов gc: {sum(types.values())}, по поколениям: {gc.get_count()}",
+            "",
+        ]
+        if started_now or self.previous is None:
+            summary = "tracemalloc включён, исходный снимок сохранён. Повторите /memsnap позже для сравнения."
+            lines.append(summary)
+            lines.append("")
+            lines.append(f"=== Места выделения (топ-{TOP_SITES}) ===")
+            for stat in snapshot.statistics('lineno')[:TOP_SITES]:
+                lines.append(f"{_size(stat.size):>10}  {stat.count:>7} бл.  {stat.traceback[0]}")
+        else:
+            diff = snapshot.compare_to(self.previous, 'lineno')
+            growth = sum(stat.size_diff for stat in diff)
+            summary = f"С прошлого снимка ({self.previous_at.strftime('%H:%M:%S')}): {_size(growth)}"
+            lines.append(summary)
+            lines.append("")
+            lines.append(f"=== Рост по местам выделения (топ-{TOP_SITES}) ===")
+            for stat in diff[:TOP_SITES]:
+                lines.append(
+                    f"{_size(stat.size_diff):>10} ({stat.count_diff:+} бл.)  "
+                    f"всего {_size(stat.size)}  {stat.traceback[0]}"
+                )
+            lines.append("")
+            lines.append(f"=== Стек самых выросших мест (топ-{TOP_TRACEBACKS}) ===")
+            by_traceback = snapshot.compare_to(self.previous, 'traceback')
+            for stat in by_traceback[:TOP_TRACEBACKS]:
+                lines.append(f"{_size(stat.size_diff)} ({stat.count_diff:+} бл.):")
+                lines.extend(f"    {line}" for line in stat.traceback.format())
+
+        lines.append("")
+        lines.append(f"=== Объекты по типам (топ-{TOP_TYPES}) ===")
+        for name, count in types.most_common(TOP_TYPES):
+            delta = ''
+            if self.previous_types is not None:
+                delta = f" ({count - self.previous_types.get(name, 0):+})"
+            lines.append(f"{count:>9}{delta}  {name}")
+
+        self.previous = snapshot
+        self.previous_types = types
+        self.previous_at = now
+        self.count += 1
+        return summary, '\n'.join(lines) + '\n'
+
+    def stop(self):
+        """Выключает tracemalloc и забывает снимки"""
+        tracemalloc.stop()
+        self.previous = None
+        self.previous_types = None
+        self.previous_at = None
+
+
+snapshots = MemorySnapshots()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Метрики бота в текстовом формате Prometheus.
+
+Всё собирается в памяти процесса, без внешних библиотек:
+- время и ошибки обработчиков (по имени функции-обработчика);
+- время SQL-запросов по нормализованному тексту запроса и статистика соединений;
+- глубина и отказы очереди входящих обновлений;
+- время и ошибки вызовов Telegram API по методу;
+- длительность и размер бэкапов.
+
+В режиме вебхуков метрики отдаёт маршрут /metrics, при polling –
+маленький HTTP-сервер на METRICS_HOST:METRICS_PORT.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import time
+
+from telegram.ext import ConversationHandler
+
+from config import config
+from database import db, normalize_sql
+import tracing
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм (сек)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+BACKUP_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Не больше стольких разных SQL-запросов в метриках (остальные – в 'other')
+MAX_STATEMENT_LABELS = 200
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        return tuple(labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик"""
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Текущее значение; если задан collect, значения берутся из него при каждом опросе"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, *labels, value):
+        self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.collect is not None:
+            try:
+                self._values = {self._key(labels): value for labels, value in self.collect()}
+            except Exception as e:
+                logger.warning(f"Метрика {self.name} не собрана: {e}")
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    """Гистограмма с накопительными корзинами, суммой и количеством"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [счётчики корзин..., сумма]
+            state = self._values[key] = [0] * len(self.buckets) + [0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[index] += 1
+                break
+        state[-1] += value
+
+    def _samples(self):
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, [('le', _format_value(float(bound)))])
+                yield f"{self.name}_bucket{le} {cumulative}"
+            plain = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{plain} {_format_value(state[-1])}"
+            yield f"{self.name}_count{plain} {cumulative}"
+
+
+class Registry:
+    """Набор метрик, который отдаётся одним текстом"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name):
+        self._metrics.pop(name, None)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# === МЕТРИКИ ===
+handler_duration = registry.register(Histogram(
+    'bot_handler_duration_seconds', 'Время выполнения обработчика', ['handler']))
+handler_errors = registry.register(Counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках', ['handler', 'error']))
+
+db_statement_seconds = registry.register(Counter(
+    'bot_db_statement_seconds_total', 'Суммарное время SQL-запросов', ['statement']))
+db_statements = registry.register(Counter(
+    'bot_db_statements_total', 'Количество SQL-запросов', ['statement']))
+db_duration = registry.register(Histogram(
+    'bot_db_statement_duration_seconds', 'Время одного SQL-запроса', buckets=DB_BUCKETS))
+db_connection_duration = registry.register(Histogram(
+    'bot_db_connection_hold_seconds', 'Время от открытия до закрытия соединения с БД', ['outcome'],
+    buckets=DB_BUCKETS))
+
+api_duration = registry.register(Histogram(
+    'bot_telegram_api_duration_seconds', 'Время вызова Telegram API (включая ожидание лимита)', ['endpoint']))
+api_errors = registry.register(Counter(
+    'bot_telegram_api_errors_total', 'Ошибки вызовов Telegram API', ['endpoint', 'error']))
+
+backup_duration = registry.register(Histogram(
+    'bot_backup_duration_seconds', 'Время создания бэкапа', buckets=BACKUP_BUCKETS))
+backup_size = registry.register(Gauge(
+    'bot_backup_size_bytes', 'Размер последнего бэкапа'))
+
+
+# === ЗАПИСЬ ИЗМЕРЕНИЙ ===
+def record_statement(sql, parameters, seconds):
+    """Слушатель Database.statement_listeners"""
+    statement = normalize_sql(sql)
+    if (statement,) not in db_statements._values and len(db_statements._values) >= MAX_STATEMENT_LABELS:
+        statement = 'other'
+    db_statements.inc(statement)
+    db_statement_seconds.inc(statement, amount=seconds)
+    db_duration.observe(value=seconds)
+
+
+def record_connection(seconds, commits, failed):
+    """Слушатель Database.connection_listeners"""
+    outcome = 'rollback' if failed else 'commit' if commits else 'read'
+    db_connection_duration.observe(outcome, value=seconds)
+
+
+def record_api_call(endpoint, seconds, error=None):
+    api_duration.observe(endpoint, value=seconds)
+    if error is not None:
+        api_errors.inc(endpoint, type(error).__name__)
+
+
+def record_backup(seconds, size):
+    backup_duration.observe(value=seconds)
+    backup_size.set(value=size)
+
+
+# === ОБРАБОТЧИКИ ===
+def _timed(callback, name):
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with tracing.span('handler', name):
+                result = callback(*args, **kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+            return result
+        except Exception as e:
+            handler_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            handler_duration.observe(name, value=time.perf_counter() - started)
+    wrapper._metrics_name = name
+    return wrapper
+
+
+def _iter_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _iter_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _iter_handlers(state_handlers)
+            yield from _iter_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def _handler_name(callback):
+    """Метка обработчика с модулем: одноимённые функции разных модулей не сливаются"""
+    if not hasattr(callback, '__qualname__'):
+        # functools.partial, объект с __call__
+        callback = getattr(callback, 'func', None) or type(callback)
+    return f"{callback.__module__}.{callback.__qualname__}"
+
+
+def instrument_handlers(application):
+    """Оборачивает колбэки всех зарегистрированных обработчиков замером времени (и отрезком трассы)"""
+    wrapped = 0
+    for group in application.handlers.values():
+        for handler in _iter_handlers(group):
+            callback = getattr(handler, 'callback', None)
+            if callback is None or hasattr(callback, '_metrics_name'):
+                continue
+            name = _handler_name(callback)
+            handler.callback = _timed(callback, name)
+            wrapped += 1
+    return wrapped
+
+
+def _queue_depth(application):
+    queue = application.update_queue
+    if not hasattr(queue, 'lane_stats'):
+        return [(('all',), queue.qsize())]
+    return [((lane,), queue.lane_depth(lane)) for lane in queue.lane_stats]
+
+
+def setup_metrics(application, database=db):
+    """
+    Подключает сбор метрик. Вызывается после регистрации всех обработчиков,
+    чтобы обернуть их колбэки.
+    """
+    if record_statement not in database.statement_listeners:
+        database.statement_listeners.append(record_statement)
+        database.connection_listeners.append(record_connection)
+
+    for name in ('bot_db_connections', 'bot_audit_records', 'bot_update_queue_depth', 'bot_update_queue_rejected'):
+        registry.unregister(name)
+    registry.register(Gauge(
+        'bot_db_connections', 'Соединения с БД: открыто всего, открыто сейчас, коммиты, откаты', ['state'],
+        collect=lambda: [((state,), value) for state, value in database.pool_stats.items()]))
+    registry.register(Gauge(
+        'bot_audit_records', 'Журнал действий: в буфере, записано, отброшено', ['state'],
+        collect=lambda: [((state,), value) for state, value in database.audit.stats().items()
+                         if state in ('pending', 'flushed', 'dropped')]))
+    registry.register(Gauge(
+        'bot_update_queue_depth', 'Обновлений в очереди', ['lane'],
+        collect=lambda: _queue_depth(application)))
+    registry.register(Gauge(
+        'bot_update_queue_rejected', 'Отклонено обновлений из-за переполнения очереди', ['lane'],
+        collect=lambda: [((lane,), stats.rejected)
+                         for lane, stats in getattr(application.update_queue, 'lane_stats', {}).items()]))
+
+    wrapped = instrument_handlers(application)
+    logger.info(f"Метрики подключены, обработчиков под замером: {wrapped}")
+
+
+def render():
+    return registry.render()
+
+
+# === HTTP-СЕРВЕР ДЛЯ POLLING ===
+_server = None
+
+
+async def _serve_client(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Заголовки запроса не нужны, но их надо дочитать
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, content_type, body = '200 OK', CONTENT_TYPE, render().encode('utf-8')
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain', b'Not Found\n'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(application):
+    """post_init: запускает сервер метрик (METRICS_PORT=0 – не запускать)"""
+    global _server
+    if not config.METRICS_PORT:
+        return
+    _server = await asyncio.start_server(_serve_client, config.METRICS_HOST, config.METRICS_PORT)
+    logger.info(f"Метрики доступны на http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+
+
+async def stop_metrics_server(application):
+    """post_shutdown: останавливает сервер метрик"""
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
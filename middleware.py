@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сквозная обработка обновления – до и после всех обработчиков, в одном месте.
+
+BotApplication.process_update оборачивает Application.process_update:
+before() выполняется до первой группы обработчиков, after() – в finally,
+т.е. и после исключения, и после ApplicationHandlerStop. Порядок шагов
+виден прямо в коде, номера групп обработчиков для этого не нужны.
+
+Единица работы: все обращения к db в обработчиках обновления идут через
+одно соединение и одну транзакцию (Database.begin_unit_of_work), after()
+фиксирует её одним коммитом, вместе с записью в журнал действий, и только
+потом отвечает на колбэк (replies). Если коммит не удался, отложенный
+текст ответа отбрасывается – пользователь не видит того, чего нет в БД.
+
+Блокировку БД нельзя держать, пока обработчик ждёт сеть: задачи outbox
+и запись сессий ждали бы её, останавливая цикл событий. Поэтому
+накопленное фиксируется раньше – перед любым запросом ReplyBot к Telegram
+(сообщение, бэкап админам, скачивание файла) и перед служебным соединением
+Database.connect() (бэкап, восстановление). Так и сообщение "✅ готово"
+уходит только после коммита того, о чём оно сообщает.
+
+UNIT_OF_WORK=0 – как раньше: каждый get_connection() – своё соединение
+и свой коммит.
+"""
+
+import logging
+
+from telegram import Update
+from telegram.ext import Application
+
+from config import config
+from database import db
+import profiling
+import recorder
+import replies
+import sessions
+import sql_budget
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+def before(application, update):
+    """До обработчиков, по порядку"""
+    if config.UNIT_OF_WORK:
+        db.begin_unit_of_work()
+    sql_budget.begin_count()
+    recorder.record_update(update)
+    tracing.begin_trace(update)
+    if isinstance(application.bot, replies.ReplyBot):
+        replies.begin_update()
+    sessions.touch_session(update)
+
+
+async def after(application, update):
+    """После обработчиков, в обратном порядке; сбой шага не мешает остальным"""
+    try:
+        db.finish_unit_of_work()
+    except Exception as e:
+        logger.error(f"Не удалось зафиксировать обновление {update.update_id}: {e}")
+        replies.discard_replies()
+    if isinstance(application.bot, replies.ReplyBot):
+        try:
+            await replies.finish_update(application.bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка отправки ответов обновления {update.update_id}: {e}")
+    tracing.finish_trace()
+    recorder.write_update()
+    try:
+        await profiling.count_update(application.bot, update)
+    except Exception as e:
+        logger.error(f"Ошибка профилирования: {e}")
+    sql_budget.finish_count(update)
+
+
+class BotApplication(Application):
+    """Application со сквозной обработкой каждого обновления (before/after)"""
+
+    async def process_update(self, update):
+        if not isinstance(update, Update):
+            return await super().process_update(update)
+        before(self, update)
+        try:
+            await super().process_update(update)
+        finally:
+            await after(self, update)
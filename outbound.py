@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Ограничение частоты исходящих запросов к Telegram API.
+
+Подключается к Application через builder.rate_limiter(...). Каждый запрос
+с chat_id проходит два ведра токенов: своего чата и общее для бота.
+Ожидающие общего ведра выстраиваются по классу приоритета:
+ответы пользователю идут раньше уведомлений админам и бэкапов.
+При RetryAfter отправка приостанавливается на указанное время
+и запрос повторяется.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета (меньше – раньше)
+REPLY = 0           # ответы пользователю
+NOTIFICATION = 1    # уведомления админам и продавцам
+BULK = 2            # бэкапы и прочие массовые рассылки
+
+PRIORITY_NAMES = {REPLY: 'reply', NOTIFICATION: 'notification', BULK: 'bulk'}
+
+# Готовые rate_limit_args для вызовов bot.send_*
+NOTIFICATION_ARGS = {'priority': NOTIFICATION}
+BULK_ARGS = {'priority': BULK}
+
+# Лимиты Telegram: ~1 сообщение в секунду в личный чат, 20 в минуту в группу
+CHAT_BURST = 3
+GROUP_RATE = 20 / 60
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием: reserve() сразу занимает токен и говорит, сколько ждать"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self):
+        """Возвращает токен, который так и не был использован"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def is_idle(self):
+        now = time.monotonic()
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Ведра токенов на чат и на бота, очередь по приоритетам, повтор при RetryAfter"""
+
+    def __init__(self, global_rate=None, chat_rate=None, max_retries=None):
+        self.global_rate = global_rate or config.OUTBOUND_GLOBAL_RATE
+        self.chat_rate = chat_rate or config.OUTBOUND_CHAT_RATE
+        self.max_retries = config.OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+        self._chats = {}
+        self._waiting = []      # куча (приоритет, порядковый номер, future)
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self._paused_until = 0.0
+        # Статистика
+        self._latencies = deque(maxlen=1000)
+        self._sent = {name: 0 for name in PRIORITY_NAMES.values()}
+        self._retries = 0
+        self._failed = 0
+
+    async def initialize(self):
+        # ExtBot.initialize вызывает нас при каждом bot.initialize(), в том числе из Updater
+        if self._dispatcher is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                # Забываем чаты, ведра которых уже полностью восстановились
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle()}
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(GROUP_RATE, CHAT_BURST)
+            else:
+                bucket = TokenBucket(self.chat_rate, CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _drop_cancelled(self):
+        while self._waiting and self._waiting[0][2].done():
+            heapq.heappop(self._waiting)
+
+    async def _dispatch(self):
+        """Выдаёт токены общего ведра ожидающим в порядке приоритета"""
+        while True:
+            self._drop_cancelled()
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            delay = self._global.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            # Пока ждали токен, ожидающий мог быть отменён – токен достаётся следующему
+            self._drop_cancelled()
+            if not self._waiting:
+                self._global.refund()
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            future.set_result(None)
+
+    async def _acquire(self, chat_id, priority):
+        bucket = self._chat_bucket(chat_id)
+        delay = bucket.reserve()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                bucket.refund()
+                raise
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._counter), future))
+        self._wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Отменили уже после выдачи токена – запрос не уйдёт, токены возвращаем
+            if future.done() and not future.cancelled():
+                self._global.refund()
+            bucket.refund()
+            raise
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None or self._dispatcher is None:
+            # answerCallbackQuery, getUpdates и т.п. не ограничиваем
+            return await callback(*args, **kwargs)
+
+        priority = REPLY
+        if isinstance(rate_limit_args, dict):
+            priority = rate_limit_args.get('priority', REPLY)
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            await self._acquire(chat_id, priority)
+            self._latencies.append((time.perf_counter() - started) * 1000)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                if attempt >= self.max_retries:
+                    self._failed += 1
+                    raise
+                attempt += 1
+                self._retries += 1
+                logger.warning(f"Flood limit ({endpoint}, чат {chat_id}): пауза {retry_after} с, попытка {attempt}")
+                continue
+            self._sent[PRIORITY_NAMES.get(priority, 'reply')] += 1
+            return result
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2)
+
+        return {
+            'waiting': len(self._waiting),
+            'sent': dict(self._sent),
+            'retries': self._retries,
+            'failed': self._failed,
+            'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 2),
+            'queue_latency_ms': {
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': round(latencies[-1], 2) if latencies else 0.0,
+            },
+        }
+
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Transactional outbox для уведомлений продавцам и админам.
+
+Обработчик кладёт сообщение в таблицу outbox тем же курсором, что и
+бизнес-изменение, поэтому уведомление фиксируется вместе с ним одним
+COMMIT. Отправкой занимается фоновая задача: она забирает готовые
+записи пачками, при ошибке сети откладывает запись с экспоненциальной
+задержкой, а после OUTBOX_MAX_ATTEMPTS попыток помечает её как failed.
+
+Уведомления админам видов из DIGEST_KINDS: первое уходит сразу, а
+следующие, пришедшие в течение ADMIN_DIGEST_WINDOW секунд после него,
+копятся до конца окна и уходят одной сводкой на вид. Остальные
+уведомления (в т.ч. срочные запросы на выплату) отправляются сразу.
+
+Доставка "хотя бы один раз": если бот упадёт между отправкой и отметкой
+sent_at, сообщение уйдёт повторно.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from config import config
+from database import db
+from outbound import NOTIFICATION_ARGS
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 600
+
+# Виды уведомлений, которые объединяются в сводку: вид -> (заголовок, подсказка)
+DIGEST_KINDS = {
+    'new_order': ("🟡 Новые заявки на поставку", "Перейдите в раздел «📦 Управление поставками»."),
+    'restock_request': ("🆘 Новые заявки на пополнение склада", "Перейдите в раздел «🆘 Пополнение склада» для обработки."),
+    'receipt': ("🟢 Завершённые поставки", None),
+    'replenishment': ("🟢 Пополнения склада Р", None),
+}
+
+# Максимум строк в одной сводке (ограничение длины сообщения Telegram)
+DIGEST_MAX_LINES = 40
+
+
+def enqueue_message(cursor, chat_id, text):
+    """Добавляет сообщение в outbox в текущей транзакции"""
+    if not chat_id:
+        return
+    cursor.execute("INSERT INTO outbox (chat_id, text) VALUES (?, ?)", (chat_id, text))
+
+
+def enqueue_admin_message(cursor, text, kind='message', summary=None):
+    """
+    Добавляет сообщение каждому админу в текущей транзакции.
+    Для видов из DIGEST_KINDS summary – его строка в сводке: сообщение
+    уходит сразу, если в последние ADMIN_DIGEST_WINDOW секунд такого
+    не было, иначе – сводкой в конце окна.
+    """
+    window = config.ADMIN_DIGEST_WINDOW
+    if kind not in DIGEST_KINDS or not summary or window <= 0:
+        cursor.executemany(
+            "INSERT INTO outbox (chat_id, kind, text, summary) VALUES (?, ?, ?, ?)",
+            [(admin_id, kind, text, summary) for admin_id in config.ADMIN_IDS]
+        )
+        return
+    cursor.executemany(
+        """
+        INSERT INTO outbox (chat_id, kind, text, summary, next_attempt_at)
+        VALUES (?, ?, ?, ?, COALESCE(
+            -- Сводка уже ждёт отправки – уходим вместе с ней
+            (SELECT MIN(next_attempt_at) FROM outbox
+             WHERE chat_id = ? AND kind = ? AND summary IS NOT NULL
+               AND sent_at IS NULL AND failed_at IS NULL),
+            -- Такое уже отправляли в пределах окна – ждём его конца
+            (SELECT datetime(MAX(sent_at), ?) FROM outbox
+             WHERE chat_id = ? AND kind = ? AND sent_at > datetime('now', ?)),
+            CURRENT_TIMESTAMP
+        ))
+        """,
+        [
+            (admin_id, kind, text, summary,
+             admin_id, kind,
+             f"+{window} seconds", admin_id, kind, f"-{window} seconds")
+            for admin_id in config.ADMIN_IDS
+        ]
+    )
+
+
+def render_digest(kind, rows):
+    """Одна сводка вместо нескольких уведомлений одного вида"""
+    if len(rows) == 1:
+        return rows[0]['text']
+    title, hint = DIGEST_KINDS[kind]
+    lines = [f"• {row['summary']}" for row in rows[:DIGEST_MAX_LINES]]
+    if len(rows) > DIGEST_MAX_LINES:
+        lines.append(f"… и ещё {len(rows) - DIGEST_MAX_LINES}")
+    text = f"{title}: {len(rows)}\n\n" + "\n".join(lines)
+    if hint:
+        text += f"\n\n{hint}"
+    return text
+
+
+class OutboxDispatcher:
+    """Фоновая доставка сообщений из таблицы outbox"""
+
+    def __init__(self, database):
+        self.database = database
+        self._running = False
+        self._again = False
+        self._last_prune = 0.0
+        # Статистика
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.coalesced = 0
+
+    def wake(self, context):
+        """Запускает доставку сразу после коммита, не дожидаясь очередного опроса"""
+        context.job_queue.run_once(self.run, 0, name='outbox_wake')
+
+    async def run(self, context):
+        """Задача JobQueue: доставляет все готовые записи пачками"""
+        if self._running:
+            # Доставка уже идёт – пусть сделает ещё один проход
+            self._again = True
+            return
+        self._running = True
+        try:
+            while True:
+                self._again = False
+                delivered = await self.deliver_batch(context.bot)
+                if delivered < config.OUTBOX_BATCH_SIZE and not self._again:
+                    break
+            if time.monotonic() - self._last_prune > 3600:
+                self._prune()
+        finally:
+            self._running = False
+
+    async def deliver_batch(self, bot):
+        """Отправляет одну пачку; возвращает число обработанных записей"""
+        with self.database.get_connection() as conn:
+            rows = conn.execute("""
+                SELECT id, chat_id, kind, text, summary, attempts FROM outbox
+                WHERE sent_at IS NULL AND failed_at IS NULL
+                  AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY id
+                LIMIT ?
+            """, (config.OUTBOX_BATCH_SIZE,)).fetchall()
+            if not rows:
+                return 0
+
+            # Разные чаты – параллельно, сообщения одного чата – по порядку.
+            # Каждое сообщение – (текст, записи outbox, которые оно доставляет)
+            by_chat = defaultdict(list)
+            digests = set()
+            for row in rows:
+                if row['kind'] in DIGEST_KINDS and row['summary']:
+                    group = (row['chat_id'], row['kind'])
+                    if group in digests:
+                        continue
+                    digests.add(group)
+                    # Окно сводки истекло – забираем и всё, что пришло после
+                    group_rows = conn.execute("""
+                        SELECT id, text, summary, attempts FROM outbox
+                        WHERE chat_id = ? AND kind = ? AND sent_at IS NULL AND failed_at IS NULL
+                        ORDER BY id
+                    """, group).fetchall()
+                    by_chat[row['chat_id']].append((render_digest(row['kind'], group_rows), group_rows))
+                else:
+                    by_chat[row['chat_id']].append((row['text'], [row]))
+
+        sent_ids = []
+        retries = []
+        failures = []
+        messages = 0
+
+        async def send_chat(chat_id, deliveries):
+            nonlocal messages
+            for text, delivery_rows in deliveries:
+                ids = [row['id'] for row in delivery_rows]
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text, rate_limit_args=NOTIFICATION_ARGS)
+                    sent_ids.extend((row_id,) for row_id in ids)
+                    messages += 1
+                except (Forbidden, BadRequest) as e:
+                    # Бот заблокирован или чат не существует – повтор не поможет
+                    failures.extend((str(e), row_id) for row_id in ids)
+                except Exception as e:
+                    attempts = max(row['attempts'] for row in delivery_rows)
+                    if attempts + 1 >= config.OUTBOX_MAX_ATTEMPTS:
+                        failures.extend((str(e), row_id) for row_id in ids)
+                        continue
+                    if isinstance(e, RetryAfter):
+                        delay = e.retry_after
+                    else:
+                        delay = min(MAX_BACKOFF, config.OUTBOX_BACKOFF_BASE * 2 ** attempts)
+                    retries.extend((f"+{int(delay)} seconds", str(e), row_id) for row_id in ids)
+
+        await asyncio.gather(*(send_chat(chat_id, deliveries) for chat_id, deliveries in by_chat.items()))
+
+        with self.database.get_connection() as conn:
+            if sent_ids:
+                conn.executemany("UPDATE outbox SET sent_at = CURRENT_TIMESTAMP WHERE id = ?", sent_ids)
+            if retries:
+                conn.executemany("""
+                    UPDATE outbox
+                    SET attempts = attempts + 1,
+                        next_attempt_at = datetime('now', ?),
+                        last_error = ?
+                    WHERE id = ?
+                """, retries)
+            if failures:
+                conn.executemany("""
+                    UPDATE outbox
+                    SET attempts = attempts + 1, failed_at = CURRENT_TIMESTAMP, last_error = ?
+                    WHERE id = ?
+                """, failures)
+
+        self.sent += len(sent_ids)
+        self.coalesced += len(sent_ids) - messages
+        self.retried += len(retries)
+        self.failed += len(failures)
+        for error, row_id in failures:
+            logger.error(f"Сообщение outbox #{row_id} не доставлено: {error}")
+        return len(rows)
+
+    def _prune(self):
+        """Удаляет давно доставленные сообщения"""
+        self._last_prune = time.monotonic()
+        with self.database.get_connection() as conn:
+            conn.execute("DELETE FROM outbox WHERE sent_at < datetime('now', '-7 days')")
+
+    def stats(self):
+        with self.database.get_connection() as conn:
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE sent_at IS NULL AND failed_at IS NULL"
+            ).fetchone()[0]
+        return {
+            'pending': pending,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            # Сколько вызовов API сэкономили сводки
+            'coalesced': self.coalesced,
+        }
+
+
+dispatcher = OutboxDispatcher(db)
+
+
+def wake_outbox(context):
+    dispatcher.wake(context)
+
+
+def setup_outbox(application):
+    """Регистрирует периодическую доставку (подбирает отложенные и оставшиеся после рестарта записи)"""
+    application.job_queue.run_repeating(
+        dispatcher.run,
+        interval=config.OUTBOX_POLL_INTERVAL,
+        first=1,
+        name='outbox'
+    )
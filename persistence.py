@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Хранение состояний ConversationHandler и context.user_data в SQLite бота.
+
+Application раз в update_interval передаёт изменённые записи в update_*;
+они копятся в буфере и записываются одной транзакцией (executemany),
+а при остановке бота буфер сбрасывается в flush().
+"""
+
+import asyncio
+import json
+import logging
+import pickle
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CONVERSATION = 'conversation:'
+
+
+class SQLitePersistence(BasePersistence):
+    """Персистентность с отложенной пакетной записью в таблицу persistence"""
+
+    def __init__(self, database=None, update_interval=None, write_delay=0.5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval or config.PERSISTENCE_INTERVAL
+        )
+        if database is None:
+            from database import db as database
+        self.database = database
+        self.write_delay = write_delay
+        # (kind, key) -> сериализованные данные или None для удаления
+        self._dirty = {}
+        self._write_handle = None
+        # Статистика
+        self.flushes = 0
+        self.rows_written = 0
+        self.last_flush_ms = 0.0
+
+    # === ЧТЕНИЕ ПРИ ЗАПУСКЕ ===
+    def _load(self, kind):
+        with self.database.get_connection() as conn:
+            rows = conn.execute("SELECT key, data FROM persistence WHERE kind = ?", (kind,)).fetchall()
+        return [(row['key'], pickle.loads(row['data'])) for row in rows]
+
+    async def get_user_data(self):
+        return {int(key): data for key, data in self._load(USER_DATA)}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {tuple(json.loads(key)): state for key, state in self._load(CONVERSATION + name)}
+
+    # === ЗАПИСЬ (ОТЛОЖЕННАЯ) ===
+    def _mark(self, kind, key, data):
+        self._dirty[(kind, key)] = None if data is None else pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        if self._write_handle is None:
+            # Все записи одного прохода update_persistence попадут в одну транзакцию
+            self._write_handle = asyncio.get_running_loop().call_later(self.write_delay, self._write_dirty)
+
+    async def update_user_data(self, user_id, data):
+        self._mark(USER_DATA, str(user_id), data)
+
+    async def update_conversation(self, name, key, new_state):
+        self._mark(CONVERSATION + name, json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id):
+        self._mark(USER_DATA, str(user_id), None)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    def _write_dirty(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        self._write_handle = None
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        upserts = [(kind, key, data) for (kind, key), data in dirty.items() if data is not None]
+        deletes = [(kind, key) for (kind, key), data in dirty.items() if data is None]
+
+        started = time.perf_counter()
+        try:
+            with self.database.get_connection() as conn:
+                if upserts:
+                    conn.executemany("""
+                        INSERT INTO persistence (kind, key, data, updated_at)
+                        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(kind, key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                    """, upserts)
+                if deletes:
+                    conn.executemany("DELETE FROM persistence WHERE kind = ? AND key = ?", deletes)
+        except Exception as e:
+            # Возвращаем несохранённое в буфер (не затирая более свежие изменения)
+            logger.error(f"Ошибка записи персистентности: {e}")
+            for item_key, data in dirty.items():
+                self._dirty.setdefault(item_key, data)
+            return
+
+        self.flushes += 1
+        self.rows_written += len(dirty)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    async def flush(self):
+        """Вызывается при остановке Application – пишем всё немедленно"""
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+        self._write_dirty()
+
+    def stats(self):
+        return {
+            'pending': len(self._dirty),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+        }
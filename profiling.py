@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Профилирование по запросу админа.
+
+/profile включает cProfile на следующие N обновлений или T секунд.
+Профилируется весь поток цикла событий: обработчики, SQL, сборка
+бэкапов и фоновые задачи. По окончании сводка, отсортированная по
+накопленному и собственному времени, приходит админу документом.
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import time
+from datetime import datetime
+
+from outbound import BULK_ARGS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPDATES = 20
+MAX_UPDATES = 1000
+# Профилирование замедляет бота, поэтому оно всегда ограничено по времени
+MAX_SECONDS = 300
+
+# Сколько функций выводить в каждом разделе сводки
+TOP_CUMULATIVE = 80
+TOP_TOTAL = 40
+
+
+class ProfileSession:
+    """Один запуск профилировщика"""
+
+    def __init__(self, chat_id, updates=None, seconds=None, skip_update_id=None):
+        self.chat_id = chat_id
+        # Само обновление с командой /profile не считается
+        self.skip_update_id = skip_update_id
+        self.updates_limit = updates
+        self.seconds = min(seconds or MAX_SECONDS, MAX_SECONDS)
+        self.updates = 0
+        self.started = None
+        self.started_at = None
+        self.profile = cProfile.Profile()
+        self.job = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.now()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        return time.perf_counter() - self.started
+
+    def report(self, duration, reason):
+        """Текст сводки"""
+        out = io.StringIO()
+        out.write(
+            f"Профиль от {self.started_at.strftime('%d.%m.%Y %H:%M:%S')}\n"
+            f"Длительность: {duration:.1f} с, обновлений: {self.updates}, остановлен: {reason}\n\n"
+        )
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.strip_dirs()
+        out.write("=== По накопленному времени (cumulative) ===\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_CUMULATIVE)
+        out.write("\n=== По собственному времени (tottime) ===\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_TOTAL)
+        return out.getvalue()
+
+
+_session = None
+
+
+def start_profile(context, chat_id, updates=None, seconds=None, skip_update_id=None):
+    """Запускает профилирование; False, если оно уже идёт"""
+    global _session
+    if _session is not None:
+        return False
+    if updates is None and seconds is None:
+        updates = DEFAULT_UPDATES
+    if updates is not None:
+        updates = max(1, min(updates, MAX_UPDATES))
+    session = ProfileSession(chat_id, updates=updates, seconds=seconds, skip_update_id=skip_update_id)
+    session.job = context.job_queue.run_once(_on_timeout, session.seconds, name='profile_timeout')
+    _session = session
+    session.start()
+    logger.info(f"Профилирование запущено: обновлений {updates}, не дольше {session.seconds} с")
+    return True
+
+
+async def stop_profile(bot, reason):
+    """Останавливает профилирование и отправляет сводку"""
+    global _session
+    session, _session = _session, None
+    if session is None:
+        return False
+    duration = session.stop()
+    if session.job is not None:
+        session.job.schedule_removal()
+    report = session.report(duration, reason)
+    try:
+        await bot.send_document(
+            chat_id=session.chat_id,
+            document=io.BytesIO(report.encode('utf-8')),
+            filename=f"profile_{session.started_at.strftime('%Y%m%d_%H%M%S')}.txt",
+            caption=f"📈 Профиль: {duration:.1f} с, обновлений {session.updates}",
+            rate_limit_args=BULK_ARGS
+        )
+    except Exception as e:
+        logger.error(f"Не удалось отправить профиль: {e}")
+    return True
+
+
+async def _on_timeout(context):
+    await stop_profile(context.bot, 'по времени')
+
+
+async def count_update(bot, update):
+    """После обработчиков (middleware): считаем обработанные обновления"""
+    session = _session
+    if session is None or update.update_id == session.skip_update_id:
+        return
+    session.updates += 1
+    if session.updates_limit is not None and session.updates >= session.updates_limit:
+        await stop_profile(bot, f'обработано {session.updates} обновлений')
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Запись входящих обновлений для воспроизведения (bench/replay.py).
+
+При включённой записи (RECORD_DIR) на старте бота делается снимок БД,
+а каждое обновление дописывается в updates_<время>.ndjson.gz одной
+JSON-строкой со смещением от начала записи. Первая строка – заголовок
+со ссылкой на снимок: воспроизведение начинается ровно с того
+состояния, в котором бот получил первое записанное обновление.
+
+Обезличивание: id пользователей и чатов заменяются HMAC со случайным
+ключом записи (ключ нигде не сохраняется), админы получают id 1, 2, …
+по порядку ADMIN_IDS. Имена, username и телефоны удаляются. В тексте
+заменяются отдельно стоящие числа из 7 и более цифр (id в /add_seller,
+в текстах бота) и имена продавцов – остальной текст нужен для
+воспроизведения как есть. Обработчик, которому пользователь ввёл личные
+данные (имя, telegram id продавца), отмечает их вызовом personal_data():
+обновление пишется после обработчиков, и отмеченное в нём заменяется
+псевдонимом. В снимке так же заменяются telegram_id, ключи и содержимое
+сессий, имена продавцов; детали логов и доставленные уведомления удаляются.
+"""
+
+import contextvars
+import gzip
+import hmac
+import json
+import logging
+import os
+import pickle
+import re
+import secrets
+import sqlite3
+import time
+from datetime import datetime
+
+from config import config
+from database import db
+from sessions import RowRecord
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Обезличенные id пользователей: FIRST_ID … FIRST_ID + ID_SPACE
+FIRST_ID = 1_000_000_000
+ID_SPACE = 1_000_000_000
+
+# Как часто сбрасывать сжатый поток на диск (сек)
+FLUSH_INTERVAL = 5
+
+# Объекты, поле id которых – id пользователя или чата
+USER_OBJECTS = {'from', 'chat', 'user', 'sender_chat', 'forward_from', 'forward_from_chat',
+                'new_chat_member', 'old_chat_member', 'left_chat_member'}
+ID_FIELDS = {'user_id', 'chat_id'}
+DROP_FIELDS = {'last_name', 'username', 'phone_number', 'bio', 'vcard'}
+TEXT_FIELDS = {'text', 'caption', 'data', 'query'}
+
+# Отдельно стоящее число такой длины в тексте считается id (номера заказов
+# вида A1-20260101-001 не затрагиваются)
+_ID_IN_TEXT = re.compile(r'(?<![\w-])-?\d{7,}(?![\w-])')
+
+# Обновление, которое сейчас обрабатывается: [смещение, update, личные данные]
+_current_entry = contextvars.ContextVar('recorded_update', default=None)
+
+
+def _names_pattern(names):
+    # Сначала длинные: "Иван Петров" раньше "Иван"
+    ordered = sorted(names, key=len, reverse=True)
+    return re.compile(r'(?<!\w)(?:' + '|'.join(map(re.escape, ordered)) + r')(?!\w)')
+
+
+class UpdateRecorder:
+    """Обезличенная запись обновлений в сжатый NDJSON со снимком БД"""
+
+    def __init__(self, directory, database=db, admin_ids=None):
+        self.directory = directory
+        self.database = database
+        self.admin_ids = list(config.ADMIN_IDS if admin_ids is None else admin_ids)
+        self._key = secrets.token_bytes(32)
+        self._ids = {admin_id: number for number, admin_id in enumerate(self.admin_ids, 1)}
+        self._names = {}
+        self._names_re = None
+        self.path = None
+        self._file = None
+        self._started = None
+        self.updates = 0
+        self.errors = 0
+
+    # ---- Обезличивание ----
+    def remap(self, value):
+        """Постоянная на всю запись замена id пользователя или чата"""
+        mapped = self._ids.get(value)
+        if mapped is None:
+            digest = hmac.new(self._key, str(abs(value)).encode(), 'sha256').digest()
+            mapped = FIRST_ID + int.from_bytes(digest[:8], 'big') % ID_SPACE
+            if value < 0:
+                mapped = -mapped
+            self._ids[value] = mapped
+        return mapped
+
+    def _remap_text(self, text, personal=None):
+        text = _ID_IN_TEXT.sub(lambda m: str(self.remap(int(m.group()))), text)
+        if personal:
+            names = {**self._names, **personal}
+            pattern = _names_pattern(names)
+        else:
+            names = self._names
+            if self._names_re is None and names:
+                self._names_re = _names_pattern(names)
+            pattern = self._names_re
+        if pattern is None:
+            return text
+        return pattern.sub(lambda m: names[m.group()], text)
+
+    def _add_name(self, name, replacement):
+        # Одна-две буквы заменяли бы и обычные слова
+        if len(name) >= 2:
+            self._names[name] = replacement
+            self._names_re = None
+
+    def _personal_replacements(self, values):
+        """Замены для личных данных обновления: id – как id, остальное – псевдонимом"""
+        replacements = {}
+        for value in values:
+            text = str(value).strip()
+            if text.lstrip('-').isdigit():
+                # 0 – "id добавлю позже", не id
+                if int(text):
+                    replacements[text] = str(self.remap(int(text)))
+            elif text:
+                replacement = self._names.get(text) or f"Продавец {self._pseudonym(text)[:6]}"
+                self._add_name(text, replacement)
+                replacements[text] = replacement
+        return replacements
+
+    def _pseudonym(self, value):
+        return hmac.new(self._key, str(value).encode(), 'sha256').hexdigest()[:16]
+
+    def anonymize(self, data, parent=None, personal=None):
+        if isinstance(data, list):
+            return [self.anonymize(item, parent, personal) for item in data]
+        if not isinstance(data, dict):
+            return data
+        result = {}
+        for key, value in data.items():
+            if key in DROP_FIELDS:
+                continue
+            if isinstance(value, int) and not isinstance(value, bool) and (
+                    key in ID_FIELDS or (key == 'id' and parent in USER_OBJECTS)):
+                value = self.remap(value)
+            elif key == 'first_name':
+                value = 'Пользователь'
+            elif key == 'title' and parent in USER_OBJECTS:
+                value = 'Чат'
+            elif key == 'chat_instance':
+                value = self._pseudonym(value)
+            elif key in TEXT_FIELDS and isinstance(value, str):
+                value = self._remap_text(value, personal)
+            else:
+                value = self.anonymize(value, key, personal)
+            result[key] = value
+        return result
+
+    def _scrub(self, value):
+        """Содержимое сессии: id и имена заменяются так же, как в обновлениях"""
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int):
+            return self._ids.get(value, value)
+        if isinstance(value, str):
+            return self._names.get(value, value)
+        if isinstance(value, dict):
+            return {self._scrub(key): self._scrub(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return type(value)(self._scrub(item) for item in value)
+        if isinstance(value, RowRecord):
+            return RowRecord(value._columns, self._scrub(value._values))
+        return value
+
+    # ---- Снимок ----
+    def _snapshot(self, path):
+        """Копия БД (backup API – согласованная даже при записи) и её обезличивание"""
+        source = self.database.connect()
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+        try:
+            for (telegram_id,) in target.execute(
+                    "SELECT telegram_id FROM sellers WHERE telegram_id IS NOT NULL").fetchall():
+                self.remap(telegram_id)
+            for (user_id,) in target.execute(
+                    "SELECT DISTINCT user_id FROM logs WHERE user_id IS NOT NULL").fetchall():
+                self.remap(user_id)
+            for _, code, name in target.execute("SELECT id, seller_code, full_name FROM sellers"):
+                if name:
+                    self._add_name(name, f"Продавец {code}")
+
+            id_map = list(self._ids.items())
+            target.execute("CREATE TEMP TABLE id_map (old INTEGER PRIMARY KEY, new INTEGER)")
+            target.executemany("INSERT INTO id_map VALUES (?, ?)", id_map)
+            for table, column in (('sellers', 'telegram_id'), ('logs', 'user_id'),
+                                  ('callback_tokens', 'user_id'), ('outbox', 'chat_id')):
+                target.execute(f"""
+                    UPDATE {table} SET {column} = (SELECT new FROM id_map WHERE old = {column})
+                    WHERE {column} IN (SELECT old FROM id_map)
+                """)
+            target.execute("UPDATE sellers SET full_name = 'Продавец ' || seller_code")
+            target.execute("UPDATE logs SET details = NULL")
+            target.execute("DELETE FROM outbox WHERE sent_at IS NOT NULL OR failed_at IS NOT NULL")
+
+            # Сначала ключи: в них все, у кого есть сессия, – затем содержимое
+            rows = [(kind, self._scrub_key(key), data)
+                    for kind, key, data in target.execute("SELECT kind, key, data FROM persistence")]
+            target.execute("DELETE FROM persistence")
+            target.executemany(
+                "INSERT OR REPLACE INTO persistence (kind, key, data) VALUES (?, ?, ?)",
+                [(kind, key, pickle.dumps(self._scrub(pickle.loads(data)), pickle.HIGHEST_PROTOCOL))
+                 for kind, key, data in rows]
+            )
+            target.commit()
+            target.execute("VACUUM")
+        finally:
+            target.close()
+
+    def _scrub_key(self, key):
+        # user_data: "123"; состояния диалогов: "[123, 123]"
+        if key.startswith('['):
+            return json.dumps([self.remap(part) if isinstance(part, int) else part for part in json.loads(key)])
+        return str(self.remap(int(key))) if key.lstrip('-').isdigit() else key
+
+    # ---- Запись ----
+    def start(self):
+        """Снимок БД и заголовок записи; вызывается до обработки первого обновления"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"updates_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        snapshot = f"{name}_snapshot.db"
+        started = time.perf_counter()
+        self._snapshot(os.path.join(self.directory, snapshot))
+        self.path = os.path.join(self.directory, f"{name}.ndjson.gz")
+        self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        self._write({
+            'type': 'header',
+            'version': FORMAT_VERSION,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'snapshot': snapshot,
+            'admin_ids': list(range(1, len(self.admin_ids) + 1)),
+        })
+        self._file.flush()
+        self._started = time.monotonic()
+        logger.info(f"Запись обновлений в {self.path}, снимок БД {snapshot} "
+                    f"({(time.perf_counter() - started) * 1000:.0f} мс)")
+
+    def _write(self, data):
+        self._file.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def record(self, update, personal=()):
+        self.write(round(time.monotonic() - self._started, 3), update, personal)
+
+    def write(self, offset, update, personal=()):
+        if self._file is None:
+            return
+        try:
+            self._write({
+                't': offset,
+                'update': self.anonymize(update.to_dict(), personal=self._personal_replacements(personal)),
+            })
+            self.updates += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Не удалось записать обновление {update.update_id}: {e}")
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info(f"Запись обновлений закрыта: {self.updates} обновлений в {self.path}")
+
+    def stats(self):
+        return {'path': self.path, 'updates': self.updates, 'errors': self.errors}
+
+
+recorder = None
+
+
+def record_update(update):
+    """До обработчиков (middleware): запоминаем обновление и время его прихода"""
+    if recorder is not None and recorder._file is not None:
+        _current_entry.set([round(time.monotonic() - recorder._started, 3), update, []])
+
+
+def personal_data(*values):
+    """
+    Отмечает введённые пользователем в этом обновлении личные данные (имя,
+    telegram id): в записи они заменяются псевдонимом или обезличенным id
+    """
+    entry = _current_entry.get()
+    if entry is not None:
+        entry[2].extend(value for value in values if value is not None)
+
+
+def write_update():
+    """После обработчиков (middleware): пишем обновление, зная его личные данные"""
+    entry = _current_entry.get()
+    if entry is None:
+        return
+    _current_entry.set(None)
+    if recorder is not None:
+        recorder.write(*entry)
+
+
+async def flush_recording(context):
+    recorder.flush()
+
+
+def setup_recorder(application):
+    """Включает запись, если задан RECORD_DIR"""
+    global recorder
+    if not config.RECORD_DIR:
+        return
+    recorder = UpdateRecorder(config.RECORD_DIR)
+    recorder.start()
+    application.job_queue.run_repeating(flush_recording, interval=FLUSH_INTERVAL, name='flush_recording')
+
+
+def close_recorder():
+    if recorder is not None:
+        recorder.close()
+
+
+def stats():
+    return recorder.stats() if recorder is not None else {'path': None}
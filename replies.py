@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Сведение ответов обработчика к минимальному числу запросов к Telegram.
+
+ReplyBot отправляет сообщения и правки сразу и возвращает то же, что
+вернул бы ExtBot, – обработчик может пользоваться результатом. Сокращается
+только то, что Telegram всё равно отбросил бы:
+- на колбэк отвечаем ровно один раз: ответ откладывается до первого
+  другого запроса или до конца обновления (middleware); если ответов
+  было несколько, побеждает последний с текстом; колбэк, на который
+  никто не ответил, получает пустой ответ;
+- правка, которая не меняет ни текст, ни клавиатуру сообщения, не
+  отправляется (Telegram ответил бы "message is not modified") –
+  возвращается результат предыдущей отправки этого сообщения. Любой
+  другой запрос, меняющий сообщение (клавиатура, подпись, удаление,
+  правка с особыми параметрами), забывает его содержимое: следующая
+  правка уйдёт в Telegram.
+"""
+
+import contextvars
+import inspect
+import logging
+import time
+from collections import OrderedDict, deque
+
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+
+from config import config
+from database import db
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Параметры, от которых зависит содержимое сообщения; остальные должны быть по умолчанию
+_STATE_KWARGS = {'chat_id', 'message_id', 'text', 'parse_mode', 'reply_markup'}
+
+
+def _defaults(method):
+    return {
+        name: parameter.default
+        for name, parameter in inspect.signature(method).parameters.items()
+        if parameter.default is not inspect.Parameter.empty
+    }
+
+
+# Значения по умолчанию (в т.ч. DEFAULT_NONE) берём из сигнатур ExtBot
+_ANSWER_DEFAULTS = _defaults(ExtBot.answer_callback_query)
+_EDIT_DEFAULTS = _defaults(ExtBot.edit_message_text)
+_SEND_DEFAULTS = _defaults(ExtBot.send_message)
+
+# Запросы, после которых содержимое сообщения известно только Telegram
+_MESSAGE_ENDPOINTS = ('edit', 'delete', 'stopPoll')
+
+
+class _Batch:
+    """Отложенный ответ на колбэк и счётчики одного обновления"""
+    __slots__ = ('answer', 'avoided', 'made')
+
+    def __init__(self):
+        self.answer = None      # kwargs для answer_callback_query
+        self.avoided = 0
+        self.made = 0
+
+
+_current_batch = contextvars.ContextVar('reply_batch', default=None)
+
+
+def _is_plain(kwargs, defaults, allowed=()):
+    """Все параметры, кроме allowed, – по умолчанию"""
+    return all(
+        value is None or value is defaults.get(key)
+        for key, value in kwargs.items() if key not in allowed
+    )
+
+
+def _state(text, kwargs):
+    markup = kwargs.get('reply_markup')
+    markup = markup.to_json() if markup is not None and markup is not _EDIT_DEFAULTS.get('reply_markup') else None
+    parse_mode = kwargs.get('parse_mode')
+    return (text, markup, parse_mode if parse_mode is not _EDIT_DEFAULTS.get('parse_mode') else None)
+
+
+class ReplyBot(ExtBot):
+    """ExtBot с однократным ответом на колбэк и без правок, которые ничего не меняют"""
+    __slots__ = ('_message_state', '_answered', '_per_update', '_counters')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Объекты бота "заморожены" после создания, поэтому всё изменяемое – в контейнерах
+        with self._unfrozen():
+            # (chat_id, message_id) -> (содержимое, результат) последней отправки сообщения
+            self._message_state = OrderedDict()
+            # id колбэков, на которые ответ уже отправлен (ключи; проверка за O(1))
+            self._answered = OrderedDict()
+            self._per_update = deque(maxlen=1000)
+            self._counters = {'updates': 0, 'calls_made': 0, 'calls_avoided': 0}
+
+    def _avoided(self):
+        batch = _current_batch.get()
+        if batch is not None:
+            batch.avoided += 1
+        else:
+            self._counters['calls_avoided'] += 1
+
+    def _remember(self, chat_id, message_id, state, result):
+        key = (chat_id, message_id)
+        self._message_state[key] = (state, result)
+        self._message_state.move_to_end(key)
+        if len(self._message_state) > 500:
+            self._message_state.popitem(last=False)
+
+    def _forget(self, data):
+        """Сообщение изменено в обход перехвата – его содержимое больше не известно"""
+        if data.get('message_id') is not None:
+            self._message_state.pop((data.get('chat_id'), data['message_id']), None)
+
+    def _mark_answered(self, callback_query_id):
+        self._answered[callback_query_id] = None
+        if len(self._answered) > 1000:
+            self._answered.popitem(last=False)
+
+    # === ПЕРЕХВАТ МЕТОДОВ ===
+    async def answer_callback_query(self, callback_query_id, text=None, *args, **kwargs):
+        if callback_query_id in self._answered:
+            self._avoided()
+            return True
+        batch = _current_batch.get()
+        if batch is None or args or not _is_plain(kwargs, _ANSWER_DEFAULTS):
+            self._mark_answered(callback_query_id)
+            return await super().answer_callback_query(callback_query_id, text, *args, **kwargs)
+        if batch.answer is not None:
+            batch.avoided += 1
+            if not text:
+                return True
+        batch.answer = {'callback_query_id': callback_query_id, 'text': text}
+        return True
+
+    async def edit_message_text(self, text, *args, **kwargs):
+        plain = not args and not kwargs.get('inline_message_id') and _is_plain(kwargs, _EDIT_DEFAULTS, _STATE_KWARGS)
+        if not plain:
+            return await super().edit_message_text(text, *args, **kwargs)
+        key = (kwargs.get('chat_id'), kwargs.get('message_id'))
+        state = _state(text, kwargs)
+        known = self._message_state.get(key)
+        if known is not None and known[0] == state:
+            self._avoided()
+            return known[1]
+        result = await super().edit_message_text(text, **kwargs)
+        self._remember(*key, state, result)
+        return result
+
+    async def send_message(self, chat_id, text, *args, **kwargs):
+        result = await super().send_message(chat_id, text, *args, **kwargs)
+        if not args and _is_plain(kwargs, _SEND_DEFAULTS, _STATE_KWARGS) and getattr(result, 'message_id', None):
+            # Правка только что отправленного сообщения тем же текстом не нужна
+            self._remember(chat_id, result.message_id, _state(text, kwargs), result)
+        return result
+
+    async def _do_post(self, endpoint, data, *args, **kwargs):
+        if endpoint.startswith(_MESSAGE_ENDPOINTS):
+            # Перехваченная правка запомнит новое содержимое после ответа Telegram
+            self._forget(data)
+        # Любой другой запрос внутри обработчика – сначала отвечаем на колбэк
+        batch = _current_batch.get()
+        if batch is not None and batch.answer is not None:
+            await self.flush_replies()
+        # Пока ждём Telegram, транзакция обновления не должна держать блокировку БД
+        db.commit_unit_of_work()
+        if batch is not None:
+            batch.made += 1
+        started = time.perf_counter()
+        try:
+            result = await super()._do_post(endpoint, data, *args, **kwargs)
+        except Exception as e:
+            metrics.record_api_call(endpoint, time.perf_counter() - started, e)
+            tracing.record_span('api', endpoint, started, time.perf_counter() - started, e)
+            raise
+        metrics.record_api_call(endpoint, time.perf_counter() - started)
+        tracing.record_span('api', endpoint, started, time.perf_counter() - started)
+        return result
+
+    # === ОТПРАВКА ОТЛОЖЕННОГО ===
+    async def flush_replies(self):
+        """Отправляет отложенный ответ на колбэк"""
+        batch = _current_batch.get()
+        if batch is None or batch.answer is None:
+            return
+        answer, batch.answer = batch.answer, None
+        callback_query_id = answer.pop('callback_query_id')
+        self._mark_answered(callback_query_id)
+        try:
+            await super().answer_callback_query(callback_query_id, **answer)
+        except Exception as e:
+            logger.warning(f"Не удалось ответить на колбэк: {e}")
+
+    def stats(self):
+        per_update = list(self._per_update)
+        return {
+            **self._counters,
+            'avoided_per_update': round(sum(per_update) / len(per_update), 3) if per_update else 0.0,
+        }
+
+
+def begin_update():
+    """До обработчиков (middleware): ответ на колбэк откладывается до конца обновления"""
+    _current_batch.set(_Batch())
+
+
+async def finish_update(bot, update):
+    """После коммита (middleware): отвечаем на колбэк, если ответ ещё не отправлен"""
+    batch = _current_batch.get()
+    if batch is None:
+        return
+    if update.callback_query and batch.answer is None and update.callback_query.id not in bot._answered:
+        batch.answer = {'callback_query_id': update.callback_query.id, 'text': None}
+    await bot.flush_replies()
+    _current_batch.set(None)
+
+    bot._counters['updates'] += 1
+    bot._counters['calls_made'] += batch.made
+    bot._counters['calls_avoided'] += batch.avoided
+    bot._per_update.append(batch.avoided)
+    if batch.avoided:
+        logger.debug(f"Update {update.update_id}: запросов {batch.made}, сэкономлено {batch.avoided}")
+
+
+def discard_replies():
+    """Отбрасывает отложенный текст ответа на колбэк – он мог сообщать об успехе; ответ будет пустым"""
+    batch = _current_batch.get()
+    if batch is not None:
+        batch.answer = None
+
+
+def create_bot(rate_limiter=None):
+    """ReplyBot с теми же настройками соединений, что строит ApplicationBuilder"""
+    return ReplyBot(
+        token=config.BOT_TOKEN,
+        base_url=config.TELEGRAM_API_URL,
+        base_file_url=config.TELEGRAM_FILE_URL,
+        request=HTTPXRequest(connection_pool_size=256),
+        get_updates_request=HTTPXRequest(),
+        rate_limiter=rate_limiter,
+    )
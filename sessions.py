@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Ограничение памяти, занимаемой context.user_data.
+
+Продавец может бросить диалог на середине, и корзина, список товаров
+или позиции поставки останутся в user_data навсегда. Поэтому:
+- каждое обновление отмечает время последней активности пользователя –
+  в памяти процесса, а не в user_data, чтобы не менять сессию (и не
+  перезаписывать её в persistence) на каждое обновление;
+- периодическая задача удаляет user_data тех, кто не появлялся дольше SESSION_TTL,
+  и завершает их диалоги: PTB не восстанавливает таймауты диалогов,
+  загруженных из persistence, а обработчики состояний ждут данных в user_data;
+- выборки из БД кладутся в user_data в компактном виде (RowRecord).
+"""
+
+import itertools
+import logging
+import pickle
+import time
+
+from telegram.ext import ConversationHandler
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# user_id -> время последнего обновления от пользователя
+_last_seen = {}
+
+
+class RowRecord:
+    """
+    Компактная замена sqlite3.Row для хранения в user_data.
+    Кортеж имён колонок общий для всех записей одной выборки,
+    доступ по ключу такой же, как у Row: record['product_name'].
+    """
+    __slots__ = ('_columns', '_values')
+
+    def __init__(self, columns, values):
+        self._columns = columns
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._values[key]
+        return self._values[self._columns.index(key)]
+
+    def keys(self):
+        return list(self._columns)
+
+    def __reduce__(self):
+        return RowRecord, (self._columns, self._values)
+
+    def __repr__(self):
+        return f"RowRecord({dict(zip(self._columns, self._values))})"
+
+
+def compact_rows(rows):
+    """Преобразует результат fetchall() в список RowRecord"""
+    if not rows:
+        return []
+    columns = tuple(rows[0].keys())
+    return [RowRecord(columns, tuple(row)) for row in rows]
+
+
+# Показатели последнего прохода очистки
+_gauge = {'sessions': 0, 'bytes': 0, 'evicted_total': 0, 'conversations_ended_total': 0, 'last_sweep_at': None}
+
+
+def touch_session(update):
+    """Отмечает активность пользователя (middleware, до всех обработчиков)"""
+    if update.effective_user is not None:
+        _last_seen[update.effective_user.id] = time.time()
+
+
+def session_size(data):
+    """Примерный объём сессии в байтах (размер сериализованных данных)"""
+    try:
+        return len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def _end_stale_conversations(application, deadline, now):
+    """Завершает диалоги пользователей, не появлявшихся дольше SESSION_TTL"""
+    ended = 0
+    for handler in itertools.chain.from_iterable(application.handlers.values()):
+        if not isinstance(handler, ConversationHandler) or not handler.per_user:
+            continue
+        user_index = 1 if handler.per_chat else 0
+        for key in list(handler._conversations):
+            if _last_seen.setdefault(key[user_index], now) >= deadline:
+                continue
+            # Удаление из TrackingDict попадёт в persistence при следующей записи
+            del handler._conversations[key]
+            job = handler.timeout_jobs.pop(key, None)
+            if job is not None:
+                job.schedule_removal()
+            ended += 1
+    return ended
+
+
+async def sweep_sessions(context):
+    """Периодическая задача: удаляет заброшенные сессии и обновляет показатели памяти"""
+    application = context.application
+    now = time.time()
+    deadline = now - config.SESSION_TTL
+    evicted = 0
+    sessions = 0
+    total_bytes = 0
+    for user_id, data in list(application.user_data.items()):
+        # Сессии из persistence после перезапуска получают полный срок с первой очистки
+        if _last_seen.setdefault(user_id, now) < deadline:
+            application.drop_user_data(user_id)
+            evicted += 1
+            continue
+        sessions += 1
+        total_bytes += session_size(data)
+    # Без user_data диалог продолжать нельзя – завершаем и его
+    ended = _end_stale_conversations(application, deadline, now)
+    # Отметки тех, у кого сессии нет, тоже не копим
+    for user_id in [user_id for user_id, seen in _last_seen.items() if seen < deadline]:
+        del _last_seen[user_id]
+
+    _gauge['sessions'] = sessions
+    _gauge['bytes'] = total_bytes
+    _gauge['evicted_total'] += evicted
+    _gauge['conversations_ended_total'] += ended
+    _gauge['last_sweep_at'] = time.time()
+    if evicted or ended:
+        logger.info(
+            f"Удалено заброшенных сессий: {evicted}, завершено диалогов: {ended}, "
+            f"осталось {sessions} ({total_bytes} байт)"
+        )
+
+
+def setup_sessions(application):
+    """Регистрирует периодическую очистку (отметку активности ставит middleware)"""
+    application.job_queue.run_repeating(
+        sweep_sessions,
+        interval=config.SESSION_SWEEP_INTERVAL,
+        first=config.SESSION_SWEEP_INTERVAL,
+        name='sweep_sessions'
+    )
+
+
+def stats():
+    return dict(_gauge)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Журнал медленных SQL-запросов.
+
+Database сообщает время каждого запроса (statement_listeners). Здесь
+запросы группируются по отпечатку нормализованного текста: для каждого
+копятся число выполнений, суммарное и максимальное время. Запрос дольше
+SLOW_QUERY_MS попадает в лог один раз на отпечаток – вместе с формой
+параметров и планом EXPLAIN QUERY PLAN; дальше только считается.
+Админ видит самые дорогие запросы командой /slow_queries [N].
+"""
+
+import hashlib
+import logging
+import sqlite3
+import time
+
+from config import config
+from database import db, normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# Не больше стольких разных отпечатков (самые дешёвые вытесняются)
+MAX_FINGERPRINTS = 500
+
+# Запросы, для которых EXPLAIN QUERY PLAN имеет смысл
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def fingerprint(statement):
+    return hashlib.sha1(statement.encode('utf-8')).hexdigest()[:12]
+
+
+def parameters_shape(parameters):
+    """Типы параметров без значений: '(int, str)'; None – executemany"""
+    if parameters is None:
+        return 'executemany'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+
+
+def format_plan(rows):
+    """Строки EXPLAIN QUERY PLAN (id, parent, notused, detail) в виде дерева"""
+    depth = {0: -1}
+    lines = []
+    for row_id, parent, _, detail in rows:
+        depth[row_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[row_id] + detail)
+    return lines
+
+
+class QueryStats:
+    __slots__ = ('statement', 'calls', 'total', 'max', 'slow', 'shape', 'plan', 'last_slow_at')
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.shape = None
+        self.plan = None
+        self.last_slow_at = None
+
+
+class SlowQueryLog:
+    """Статистика запросов по отпечаткам и план для медленных"""
+
+    def __init__(self, database, threshold_ms=None):
+        self.database = database
+        self.threshold = (config.SLOW_QUERY_MS if threshold_ms is None else threshold_ms) / 1000
+        self.queries = {}
+
+    def record(self, sql, parameters, seconds):
+        """Слушатель Database.statement_listeners"""
+        statement = normalize_sql(sql)
+        key = fingerprint(statement)
+        stats = self.queries.get(key)
+        if stats is None:
+            if len(self.queries) >= MAX_FINGERPRINTS:
+                self._evict()
+            stats = self.queries[key] = QueryStats(statement)
+        stats.calls += 1
+        stats.total += seconds
+        stats.max = max(stats.max, seconds)
+        if not self.threshold or seconds < self.threshold:
+            return
+
+        stats.slow += 1
+        stats.last_slow_at = time.time()
+        if stats.slow > 1:
+            return
+        stats.shape = parameters_shape(parameters)
+        stats.plan = self.explain(sql, parameters)
+        plan = '\n    '.join(stats.plan) if stats.plan else '—'
+        logger.warning(
+            f"Медленный запрос [{key}] {seconds * 1000:.1f} мс: {statement}\n"
+            f"  параметры: {stats.shape}\n  план:\n    {plan}"
+        )
+
+    def explain(self, sql, parameters):
+        """
+        План запроса. Отдельное соединение без трассировки: не трогает
+        транзакцию обработчика и не попадает в статистику само.
+        """
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        if parameters is None:
+            # executemany: план не зависит от значений
+            parameters = (None,) * sql.count('?')
+        try:
+            conn = self.database.connect()
+            try:
+                return format_plan(conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return [f"EXPLAIN не выполнен: {e}"]
+
+    def _evict(self):
+        """Вытесняет десятую часть самых дешёвых запросов, никогда не бывших медленными"""
+        cheap = sorted(
+            (key for key, stats in self.queries.items() if not stats.slow),
+            key=lambda key: self.queries[key].total
+        )
+        for key in cheap[:max(1, MAX_FINGERPRINTS // 10)] or list(self.queries)[:1]:
+            del self.queries[key]
+
+    def top(self, limit=10):
+        """Самые дорогие запросы по суммарному времени"""
+        return sorted(self.queries.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+
+    def reset(self):
+        self.queries.clear()
+
+
+slow_log = SlowQueryLog(db)
+
+
+def setup_slow_queries():
+    """Подключает журнал к Database"""
+    if slow_log.record not in db.statement_listeners:
+        db.statement_listeners.append(slow_log.record)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Бюджет SQL-запросов на обновление и поиск N+1.
+
+Database считает запросы обрабатываемого обновления (start/stop_statement_count)
+– всего и по нормализованному тексту. Обновление, выполнившее больше
+SQL_BUDGET запросов, логируется; вид запроса, повторённый в одном
+обновлении SQL_REPEAT_LIMIT раз и больше, – признак N+1 (запрос в цикле
+по товарам корзины, позициям заявки и т.п.): в лог попадает один раз
+на пару «вид обновления + запрос», дальше только считается.
+
+Подписчики update_listeners получают (описание обновления, счётчик) –
+так бюджеты проверяет bench.load_harness.
+"""
+
+import logging
+import re
+import time
+
+from config import config
+from database import db
+from idempotency import split_callback_data
+from slow_queries import fingerprint
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Не больше стольких видов обновлений и находок N+1 в статистике
+MAX_KINDS = 300
+MAX_FINDINGS = 300
+
+# Подписчики: listener(update_info, counter)
+update_listeners = []
+
+
+def update_kind(info):
+    """Вид обновления для статистики: команда, кнопка без номеров и токена, тип"""
+    if info.get('command'):
+        return info['command']
+    if info.get('type') == 'callback':
+        base, _ = split_callback_data(info.get('data') or '')
+        return 'cb ' + re.sub(r'\d+', '#', base)
+    return info.get('type', 'other')
+
+
+class KindStats:
+    __slots__ = ('updates', 'statements', 'max_statements', 'over_budget')
+
+    def __init__(self):
+        self.updates = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.over_budget = 0
+
+
+class Finding:
+    """Запрос, повторявшийся в обновлениях одного вида"""
+    __slots__ = ('kind', 'statement', 'updates', 'max_repeats', 'last_at')
+
+    def __init__(self, kind, statement):
+        self.kind = kind
+        self.statement = statement
+        self.updates = 0
+        self.max_repeats = 0
+        self.last_at = None
+
+
+class StatementBudget:
+    """Проверка счётчиков обновлений против бюджета и порога повторов"""
+
+    def __init__(self, budget=None, repeat_limit=None):
+        self.budget = config.SQL_BUDGET if budget is None else budget
+        self.repeat_limit = config.SQL_REPEAT_LIMIT if repeat_limit is None else repeat_limit
+        self.kinds = {}
+        self.findings = {}
+
+    def check(self, info, counter):
+        kind = update_kind(info)
+        stats = self.kinds.get(kind)
+        if stats is None and len(self.kinds) < MAX_KINDS:
+            stats = self.kinds[kind] = KindStats()
+        # Сверх MAX_KINDS видов статистику не копим, но бюджет и повторы проверяем
+        if stats is not None:
+            stats.updates += 1
+            stats.statements += counter.statements
+            stats.max_statements = max(stats.max_statements, counter.statements)
+
+        if self.budget and counter.statements > self.budget:
+            if stats is not None:
+                stats.over_budget += 1
+            top = ', '.join(f"{count}× {shape[:80]}" for shape, count in counter.shapes.most_common(3))
+            logger.warning(f"Обновление {info.get('update_id')} ({kind}): {counter.statements} SQL-запросов "
+                           f"при бюджете {self.budget}, соединений {counter.connections}; чаще всего: {top}")
+
+        if not self.repeat_limit:
+            return
+        for shape, count in counter.repeated(self.repeat_limit):
+            key = f"{kind} {fingerprint(shape)}"
+            finding = self.findings.get(key)
+            if finding is None:
+                if len(self.findings) >= MAX_FINDINGS:
+                    continue
+                finding = self.findings[key] = Finding(kind, shape)
+                logger.warning(f"N+1 в {kind} (обновление {info.get('update_id')}): "
+                               f"{count} раз за обновление: {shape}")
+            finding.updates += 1
+            finding.max_repeats = max(finding.max_repeats, count)
+            finding.last_at = time.time()
+
+    def top_findings(self, limit=10):
+        return sorted(self.findings.values(), key=lambda f: f.max_repeats * f.updates, reverse=True)[:limit]
+
+    def reset(self):
+        self.kinds.clear()
+        self.findings.clear()
+
+    def stats(self):
+        return {
+            'budget': self.budget,
+            'repeat_limit': self.repeat_limit,
+            'kinds': {
+                kind: {
+                    'updates': stats.updates,
+                    'avg_statements': round(stats.statements / stats.updates, 2),
+                    'max_statements': stats.max_statements,
+                    'over_budget': stats.over_budget,
+                }
+                for kind, stats in sorted(self.kinds.items(), key=lambda item: -item[1].max_statements)
+            },
+            'n_plus_one': [
+                {'kind': f.kind, 'statement': f.statement, 'updates': f.updates, 'max_repeats': f.max_repeats}
+                for f in self.top_findings(MAX_FINDINGS)
+            ],
+        }
+
+
+budget = StatementBudget()
+
+
+def begin_count():
+    db.start_statement_count()
+
+
+def finish_count(update):
+    counter = db.stop_statement_count()
+    if counter is None:
+        return
+    info = tracing.describe_update(update)
+    budget.check(info, counter)
+    for listener in update_listeners:
+        listener(info, counter)
+
+
+def stats():
+    return budget.stats()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Допустимые переходы статусов заявок, выплат и заявок на пополнение.
+
+Каждый переход выполняется одним UPDATE ... WHERE status = ?, поэтому
+из двух админов, одновременно нажавших кнопку, выигрывает только один,
+а проверка статуса не требует отдельного SELECT.
+"""
+
+# Сущность -> (таблица, {новый статус: (исходные статусы, колонка времени)})
+MACHINES = {
+    'order': ('orders', {
+        'shipped': (('new',), 'shipped_at'),
+        'completed': (('shipped',), 'completed_at'),
+        'cancelled': (('new',), None),
+    }),
+    'payment': ('payment_requests', {
+        'approved': (('pending',), 'approved_at'),
+        'rejected': (('pending',), None),
+    }),
+    'restock': ('restock_requests', {
+        'completed': (('pending',), 'completed_at'),
+        'cancelled': (('pending',), None),
+    }),
+}
+
+
+def transition(cursor, entity, row_id, to_status, **extra):
+    """
+    Переводит запись в статус to_status, если текущий статус это допускает.
+    extra – дополнительные колонки, которые меняются тем же UPDATE
+    (например, amount при изменении суммы выплаты).
+    Возвращает True, если переход выполнен этим вызовом.
+    """
+    if entity not in MACHINES:
+        raise ValueError(f"Неизвестная сущность: {entity}")
+    table, edges = MACHINES[entity]
+    if to_status not in edges:
+        raise ValueError(f"Недопустимый статус '{to_status}' для {entity}")
+    from_statuses, timestamp_column = edges[to_status]
+
+    assignments = ["status = ?"]
+    params = [to_status]
+    if timestamp_column:
+        assignments.append(f"{timestamp_column} = CURRENT_TIMESTAMP")
+    for column, value in extra.items():
+        assignments.append(f"{column} = ?")
+        params.append(value)
+
+    if len(from_statuses) == 1:
+        condition = "status = ?"
+    else:
+        condition = f"status IN ({','.join('?' * len(from_statuses))})"
+    params.append(row_id)
+    params.extend(from_statuses)
+
+    cursor.execute(
+        f"UPDATE {table} SET {', '.join(assignments)} WHERE id = ? AND {condition}",
+        params
+    )
+    return cursor.rowcount == 1
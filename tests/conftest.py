@@ -0,0 +1,10 @@
+import os
+import sys
+
+# config читает окружение при импорте
+os.environ.setdefault('BOT_TOKEN', '0:test')
+os.environ.setdefault('ADMIN_IDS', '1')
+# Глобальный db тоже в памяти: тесты не оставляют файлов
+os.environ.setdefault('DATABASE_PATH', ':memory:')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
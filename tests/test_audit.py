@@ -0,0 +1,32 @@
+import asyncio
+
+import audit
+from database import MEMORY, Database
+
+
+def test_failed_flush_is_retried(monkeypatch):
+    monkeypatch.setattr(audit, 'RETRY_BASE_DELAY', 0.01)
+    database = Database(MEMORY)
+    get_connection = database.get_connection
+    failures = [2]
+
+    def flaky():
+        if failures[0]:
+            failures[0] -= 1
+            raise RuntimeError('database is locked')
+        return get_connection()
+
+    async def run():
+        database.get_connection = flaky
+        database.audit.enqueue(1, 'admin', 'payment_confirm')
+        database.audit.flush()
+        await asyncio.sleep(0.2)
+        del database.get_connection
+        return database.audit.stats()
+
+    stats = asyncio.run(run())
+    assert stats['errors'] == 2
+    assert stats['flushed'] == 1 and stats['pending'] == 0
+    with database.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0] == 1
+    database.close()
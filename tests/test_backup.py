@@ -0,0 +1,41 @@
+import json
+
+from backup import SKIP_TABLES, SimpleBackup
+from database import MEMORY, Database
+from outbox import enqueue_message
+
+
+def test_restore_keeps_service_tables():
+    database = Database(MEMORY)
+    backup = SimpleBackup(database)
+    with database.get_connection() as conn:
+        conn.execute("INSERT INTO persistence (kind, key, data) VALUES ('user_data', '1', x'00')")
+    token = database.issue_callback_token(1, 'confirm_sale')
+    data = json.loads(backup.create_backup_json())
+    assert not SKIP_TABLES & set(data)
+
+    data['products'] = data['products'][:1]
+    assert backup.restore_json(data) == sum(len(rows) for rows in data.values())
+
+    with database.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM persistence").fetchone()[0] == 1
+    assert database.consume_callback_token(token)
+    database.close()
+
+
+def test_restore_keeps_pending_notifications():
+    database = Database(MEMORY)
+    backup = SimpleBackup(database)
+    data = json.loads(backup.create_backup_json())
+    # Бэкап старого формата ещё содержит outbox
+    data['outbox'] = [{'id': 1, 'chat_id': 7, 'text': 'old'}]
+    with database.get_connection() as conn:
+        enqueue_message(conn.cursor(), 42, 'pending')
+
+    backup.restore_json(data)
+
+    with database.get_connection() as conn:
+        rows = conn.execute("SELECT chat_id, text FROM outbox WHERE sent_at IS NULL").fetchall()
+    assert [tuple(row) for row in rows] == [(42, 'pending')]
+    database.close()
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import replies
+from database import MEMORY, Database, use_database
+from idempotency import idempotent_callback, token_callback_data
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+
+def press(handler, data):
+    query = FakeQuery(data)
+    update = SimpleNamespace(callback_query=query)
+    return asyncio.run(handler(update, SimpleNamespace())), query
+
+
+@pytest.fixture
+def database():
+    database = Database(MEMORY)
+    with use_database(database):
+        yield database
+    database.close()
+
+
+def count_logs(database):
+    with database.get_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+
+def test_repeated_press_is_rejected(database):
+    calls = []
+
+    @idempotent_callback("⏳ Уже подтверждено")
+    async def confirm(update, context):
+        calls.append(update.callback_query.data)
+        with database.get_connection() as conn:
+            conn.execute("INSERT INTO logs (action) VALUES ('confirm')")
+        return 'done'
+
+    data = token_callback_data('confirm_sale', 1)
+    assert press(confirm, data)[0] == 'done'
+    result, query = press(confirm, data)
+    assert result is None
+    assert query.answers == ["⏳ Уже подтверждено"]
+    assert len(calls) == 1 and count_logs(database) == 1
+
+
+def test_failed_handler_leaves_token_unconsumed(database, monkeypatch):
+    discarded = []
+    monkeypatch.setattr(replies, 'discard_replies', lambda: discarded.append(True))
+    fail = [True]
+
+    @idempotent_callback("⏳ Уже подтверждено")
+    async def confirm(update, context):
+        with database.get_connection() as conn:
+            conn.execute("INSERT INTO logs (action) VALUES ('confirm')")
+        if fail[0]:
+            raise ValueError('boom')
+        return 'done'
+
+    data = token_callback_data('confirm_sale', 1)
+    with pytest.raises(ValueError):
+        press(confirm, data)
+    assert discarded == [True]
+    assert count_logs(database) == 0
+
+    fail[0] = False
+    assert press(confirm, data)[0] == 'done'
+    assert count_logs(database) == 1
+
+
+def test_handler_rollback_keeps_token_unconsumed(database):
+    @idempotent_callback("⏳ Уже подтверждено")
+    async def confirm(update, context):
+        # Как payment_confirm: ошибку ловит сам обработчик и отвечает пользователю
+        try:
+            with database.get_connection() as conn:
+                conn.execute("INSERT INTO logs (action) VALUES ('payment')")
+                raise ValueError('boom')
+        except ValueError:
+            database.rollback_unit_of_work()
+            return 'error'
+
+    data = token_callback_data('payment_confirm', 1)
+    assert press(confirm, data)[0] == 'error'
+    assert database.consume_callback_token(data.rsplit(':', 1)[1])
+
+
+def test_rerender_reuses_live_token(database):
+    first = token_callback_data('admin_order_ship', 1, prefix='admin_order_ship_15')
+    assert token_callback_data('admin_order_ship', 1, prefix='admin_order_ship_15') == first
+    assert token_callback_data('admin_order_ship', 1, prefix='admin_order_ship_16') != first
+    assert token_callback_data('admin_order_ship', 2, prefix='admin_order_ship_15') != first
+
+    assert database.consume_callback_token(first.rsplit(':', 1)[1])
+    assert token_callback_data('admin_order_ship', 1, prefix='admin_order_ship_15') != first
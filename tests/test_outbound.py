@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+from outbound import OutboundRateLimiter
+
+
+def test_cancelled_waiter_passes_its_token_on():
+    async def scenario():
+        limiter = OutboundRateLimiter(global_rate=5, chat_rate=100)
+        await limiter.initialize()
+        limiter._global.tokens = 0
+        sent = []
+
+        async def send(chat_id):
+            sent.append((chat_id, time.monotonic()))
+
+        started = time.monotonic()
+        first = asyncio.create_task(limiter.process_request(send, (1,), {}, 'sendMessage', {'chat_id': 1}, None))
+        await asyncio.sleep(0.05)
+        # Отмена, пока диспетчер ждёт токен для первого запроса
+        first.cancel()
+        await limiter.process_request(send, (2,), {}, 'sendMessage', {'chat_id': 2}, None)
+        await limiter.shutdown()
+        return sent, started
+
+    sent, started = asyncio.run(scenario())
+    assert [chat_id for chat_id, _ in sent] == [2]
+    # Второй запрос получил токен отменённого, а не ждал следующего (0.4 с)
+    assert sent[0][1] - started < 0.3
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ExtBot
+
+import replies
+
+
+@pytest.fixture
+def posted():
+    return []
+
+
+@pytest.fixture
+def bot(monkeypatch, posted):
+    async def fake_post(self, endpoint, data, *args, **kwargs):
+        posted.append(endpoint)
+        if endpoint.startswith('edit') or endpoint == 'sendMessage':
+            return {'message_id': data.get('message_id', 10), 'date': 0,
+                    'chat': {'id': data['chat_id'], 'type': 'private'}, 'text': data.get('text')}
+        return True
+
+    monkeypatch.setattr(ExtBot, '_do_post', fake_post)
+    return replies.ReplyBot(token='0:test')
+
+
+def keyboard(text):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=text)]])
+
+
+def test_unchanged_edit_is_skipped(bot, posted):
+    async def scenario():
+        await bot.edit_message_text('a', chat_id=1, message_id=5, reply_markup=keyboard('x'))
+        await bot.edit_message_text('a', chat_id=1, message_id=5, reply_markup=keyboard('x'))
+
+    asyncio.run(scenario())
+    assert posted == ['editMessageText']
+
+
+def test_edit_after_bypassing_call_is_sent(bot, posted):
+    async def scenario():
+        await bot.edit_message_text('a', chat_id=1, message_id=5, reply_markup=keyboard('x'))
+        # Клавиатуру сменили в обход перехвата – кэш устарел
+        await bot.edit_message_reply_markup(chat_id=1, message_id=5, reply_markup=keyboard('y'))
+        await bot.edit_message_text('a', chat_id=1, message_id=5, reply_markup=keyboard('x'))
+        # Правка с особыми параметрами тоже не попадает в кэш
+        await bot.edit_message_text('b', chat_id=1, message_id=5, disable_web_page_preview=True)
+        await bot.edit_message_text('a', chat_id=1, message_id=5, reply_markup=keyboard('x'))
+
+    asyncio.run(scenario())
+    assert posted == ['editMessageText', 'editMessageReplyMarkup', 'editMessageText',
+                      'editMessageText', 'editMessageText']
+
+
+def test_answered_callbacks_are_bounded(bot, posted):
+    async def scenario():
+        for i in range(1100):
+            await bot.answer_callback_query(str(i))
+        await bot.answer_callback_query('1099')
+
+    asyncio.run(scenario())
+    assert posted.count('answerCallbackQuery') == 1100
+    assert len(bot._answered) == 1000
+    assert '0' not in bot._answered and '1099' in bot._answered
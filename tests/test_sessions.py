@@ -0,0 +1,36 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from telegram.ext import Application, CommandHandler, ConversationHandler
+
+import sessions
+from config import config
+
+
+async def noop(update, context):
+    return ConversationHandler.END
+
+
+def test_sweep_ends_conversations_of_evicted_users():
+    application = Application.builder().token('0:test').build()
+    handler = ConversationHandler(
+        entry_points=[CommandHandler('start', noop)],
+        states={1: [CommandHandler('next', noop)]},
+        fallbacks=[],
+    )
+    application.add_handler(handler)
+
+    stale, active, no_data = 101, 102, 103
+    application._user_data[stale]['product_name'] = 'x'
+    application._user_data[active]['product_name'] = 'y'
+    handler._conversations.update({(stale, stale): 1, (active, active): 1, (no_data, no_data): 1})
+    old = time.time() - config.SESSION_TTL - 1
+    sessions._last_seen.update({stale: old, active: time.time(), no_data: old})
+
+    asyncio.run(sessions.sweep_sessions(SimpleNamespace(application=application)))
+
+    assert stale not in application.user_data
+    assert active in application.user_data
+    assert list(handler._conversations) == [(active, active)]
+    assert stale not in sessions._last_seen and no_data not in sessions._last_seen
@@ -0,0 +1,24 @@
+from collections import Counter
+
+import sql_budget
+from database import StatementCounter
+
+
+def counter_for(shapes):
+    counter = StatementCounter()
+    counter.shapes = Counter(shapes)
+    counter.statements = sum(counter.shapes.values())
+    return counter
+
+
+def test_repeats_are_found_after_kinds_are_full(monkeypatch):
+    monkeypatch.setattr(sql_budget, 'MAX_KINDS', 2)
+    budget = sql_budget.StatementBudget(budget=40, repeat_limit=5)
+    for command in ('/a', '/b'):
+        budget.check({'command': command}, counter_for({'SELECT 1': 1}))
+
+    budget.check({'command': '/c', 'update_id': 3}, counter_for({'SELECT * FROM products WHERE id = ?': 7}))
+
+    assert set(budget.kinds) == {'/a', '/b'}
+    [finding] = budget.findings.values()
+    assert (finding.kind, finding.max_repeats) == ('/c', 7)
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+
+from database import Database
+
+
+async def network(database):
+    # Как ReplyBot._do_post: фиксирует единицу работы и ждёт Telegram
+    database.commit_unit_of_work()
+    await asyncio.sleep(0.3)
+
+
+async def write_log(database):
+    started = time.perf_counter()
+    with database.get_connection() as conn:
+        conn.execute("INSERT INTO logs (action) VALUES ('outbox')")
+    return time.perf_counter() - started
+
+
+@pytest.mark.parametrize('write_first', [False, True])
+def test_writer_is_not_blocked_while_handler_awaits_in_block(tmp_path, write_first):
+    database = Database(str(tmp_path / 'bot.db'))
+
+    async def handler():
+        database.begin_unit_of_work()
+        try:
+            with database.get_connection() as conn:
+                if write_first:
+                    conn.execute("UPDATE products SET price = price + 1")
+                conn.execute("SELECT COUNT(*) FROM products").fetchone()
+                await network(database)
+                conn.execute("UPDATE products SET price = price + 1")
+        finally:
+            database.finish_unit_of_work()
+
+    async def run():
+        task = asyncio.create_task(handler())
+        await asyncio.sleep(0.05)
+        waited = await write_log(database)
+        await task
+        return waited
+
+    assert asyncio.run(run()) < 1
+    with database.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0] == 1
+    database.close()
+
+
+def test_failure_after_commit_rolls_back_only_later_writes(tmp_path):
+    database = Database(str(tmp_path / 'bot.db'))
+
+    async def handler():
+        database.begin_unit_of_work()
+        try:
+            with database.get_connection() as conn:
+                conn.execute("INSERT INTO logs (action) VALUES ('before')")
+                await network(database)
+                conn.execute("INSERT INTO logs (action) VALUES ('after')")
+                raise ValueError('boom')
+        finally:
+            database.finish_unit_of_work()
+
+    with pytest.raises(ValueError):
+        asyncio.run(handler())
+    with database.get_connection() as conn:
+        assert [row[0] for row in conn.execute("SELECT action FROM logs")] == ['before']
+    database.close()
+
+
+def test_connection_listeners_get_commits_and_failure(tmp_path):
+    database = Database(str(tmp_path / 'bot.db'))
+    closed = []
+    database.connection_listeners.append(lambda seconds, commits, failed: closed.append((commits, failed)))
+
+    with database.get_connection() as conn:
+        conn.execute("SELECT COUNT(*) FROM products").fetchone()
+
+    async def update(write):
+        database.begin_unit_of_work()
+        with database.get_connection() as conn:
+            conn.execute("SELECT COUNT(*) FROM products").fetchone()
+            if write:
+                conn.execute("INSERT INTO logs (action) VALUES ('x')")
+        database.finish_unit_of_work()
+
+    asyncio.run(update(False))
+    asyncio.run(update(True))
+    with pytest.raises(ValueError):
+        with database.get_connection() as conn:
+            raise ValueError('boom')
+
+    assert closed == [(0, False), (0, False), (1, False), (0, True)]
+    database.close()
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+
+from update_queue import HIGH, LOW, NORMAL, PriorityUpdateQueue, classify_update
+
+BOT_USER = {'id': 10, 'is_bot': True, 'first_name': 'Test', 'username': 'test_bot'}
+
+
+class FakeRequest(BaseRequest):
+    """Bot API, который знает только getMe"""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        result = BOT_USER if url.endswith('/getMe') else True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+def make_update(update_id, user_id, text=None, callback=None):
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'U'}
+    message = {
+        'message_id': update_id,
+        'date': 0,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': user,
+        'text': text or 'x',
+    }
+    if callback:
+        data = {'callback_query': {'id': str(update_id), 'from': user, 'chat_instance': '1',
+                                   'data': callback, 'message': message}}
+    else:
+        data = {'message': message}
+    return Update.de_json(dict(data, update_id=update_id), None)
+
+
+def test_lanes():
+    assert classify_update(make_update(1, 1)) == HIGH
+    assert classify_update(make_update(2, 2, callback='confirm_sale')) == HIGH
+    assert classify_update(make_update(3, 2)) == NORMAL
+    assert classify_update(make_update(4, 2, text='📊 Остатки')) == LOW
+    assert classify_update(make_update(5, 2, callback='page_2')) == LOW
+
+
+def test_chat_order_is_kept_across_lanes():
+    queue = PriorityUpdateQueue()
+    updates = [
+        make_update(1, 2),                          # NORMAL: ввод количества
+        make_update(2, 2, callback='confirm_sale'),  # HIGH: подтверждение того же чата
+        make_update(3, 3, callback='confirm_sale'),  # HIGH: другой чат
+        make_update(4, 3, text='📊 Остатки'),
+    ]
+    for update in updates:
+        queue.put_nowait(update)
+    assert queue.stats()['lanes'][HIGH]['depth'] == 2
+    assert [queue.get_nowait().update_id for _ in updates] == [3, 1, 2, 4]
+    assert queue.empty()
+
+
+def test_stop_processes_queued_updates():
+    updates = [
+        make_update(1, 2, text='📊 Остатки'),
+        make_update(2, 2),
+        make_update(3, 2, callback='page_2'),
+        make_update(4, 1),
+        make_update(5, 3),
+    ]
+
+    async def run():
+        handled = []
+
+        async def remember(update, context):
+            handled.append(update.update_id)
+
+        queue = PriorityUpdateQueue(maxsize=100, low_lane_limit=50)
+        application = (
+            Application.builder()
+            .token('0:test')
+            .request(FakeRequest())
+            .get_updates_request(FakeRequest())
+            .update_queue(queue)
+            .build()
+        )
+        application.add_handler(TypeHandler(Update, remember))
+        await application.initialize()
+        for update in updates:
+            queue.put_nowait(update)
+        await application.start()
+        await application.stop()
+        await application.shutdown()
+        return handled, queue
+
+    handled, queue = asyncio.run(run())
+    assert sorted(handled) == [1, 2, 3, 4, 5]
+    # Админ – первым, обновления чата 2 – в порядке поступления
+    assert handled[0] == 4
+    assert [update_id for update_id in handled if update_id in (1, 2, 3)] == [1, 2, 3]
+    assert queue.empty()
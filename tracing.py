@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Трассировка обработки обновлений.
+
+Каждое обновление получает trace id, а всё, что происходит при его
+обработке, – отрезки (spans): обработчики, SQL-запросы, вызовы
+Telegram API и отправка бэкапов. Медленные трассы (дольше TRACE_SLOW_MS)
+и случайная доля TRACE_SAMPLE_RATE остальных дописываются в TRACE_FILE
+по одной JSON-строке на трассу.
+
+Трасса хранится в contextvar: её открывает и закрывает
+middleware.BotApplication вокруг всех обработчиков обновления, в том же
+контексте.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import secrets
+import time
+from contextlib import contextmanager
+
+from config import config
+from database import db, normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# Не больше стольких отрезков в одной трассе (остальные только считаются)
+MAX_SPANS = 500
+
+# При превышении размера файл переименовывается в <TRACE_FILE>.1
+MAX_FILE_BYTES = 10 * 1024 * 1024
+
+
+class Trace:
+    """Трасса одного обновления"""
+    __slots__ = ('trace_id', 'update', 'started', 'started_at', 'spans', 'stack', 'dropped')
+
+    def __init__(self, update_info):
+        self.trace_id = secrets.token_hex(8)
+        self.update = update_info
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self.stack = []         # индексы открытых отрезков
+        self.dropped = 0
+
+    def add(self, kind, name, started, duration, error=None):
+        """Добавляет завершённый отрезок; возвращает его индекс или None"""
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return None
+        span = {
+            'kind': kind,
+            'name': name,
+            'start_ms': round((started - self.started) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3),
+        }
+        if self.stack:
+            span['parent'] = self.stack[-1]
+        if error is not None:
+            span['error'] = type(error).__name__
+        self.spans.append(span)
+        return len(self.spans) - 1
+
+    def to_dict(self, duration):
+        return {
+            'trace_id': self.trace_id,
+            'ts': round(self.started_at, 3),
+            'duration_ms': round(duration * 1000, 3),
+            'update': self.update,
+            'spans': self.spans,
+            'dropped_spans': self.dropped,
+        }
+
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+
+# Трасса обрабатываемого сейчас обновления – для чтения из других потоков
+# (contextvar там не виден); обновления обрабатываются по одному
+_active_trace = None
+
+_stats = {'traces': 0, 'written': 0, 'slow': 0}
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def active_update():
+    """Описание обрабатываемого сейчас обновления (можно вызывать из любого потока)"""
+    trace = _active_trace
+    if trace is None:
+        return None
+    return dict(trace.update, trace_id=trace.trace_id)
+
+
+@contextmanager
+def span(kind, name):
+    """Отрезок вокруг блока кода; вне трассы ничего не делает"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    # Индекс занимаем заранее, чтобы вложенные отрезки ссылались на родителя
+    index = trace.add(kind, name, started, 0.0)
+    if index is not None:
+        trace.stack.append(index)
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if index is not None:
+            trace.stack.pop()
+            trace.spans[index]['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            if error is not None:
+                trace.spans[index]['error'] = type(error).__name__
+
+
+def record_span(kind, name, started, duration, error=None):
+    """Добавляет уже измеренный отрезок (started – значение time.perf_counter())"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(kind, name, started, duration, error)
+
+
+def record_statement(sql, parameters, seconds):
+    """Слушатель Database.statement_listeners"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add('db', normalize_sql(sql), time.perf_counter() - seconds, seconds)
+
+
+def describe_update(update):
+    """Что за обновление – без текста сообщений"""
+    info = {'update_id': update.update_id}
+    if update.effective_user:
+        info['user_id'] = update.effective_user.id
+    if update.callback_query:
+        info['type'] = 'callback'
+        info['data'] = update.callback_query.data
+    elif update.message:
+        info['type'] = 'message'
+        text = update.message.text or ''
+        if text.startswith('/'):
+            info['command'] = text.split()[0]
+        elif update.message.document:
+            info['type'] = 'document'
+    else:
+        info['type'] = 'other'
+    return info
+
+
+def begin_trace(update):
+    """До обработчиков: открываем трассу"""
+    global _active_trace
+    _active_trace = Trace(describe_update(update))
+    _current_trace.set(_active_trace)
+
+
+def finish_trace():
+    """После обработчиков и отправки ответов: закрываем и при необходимости пишем трассу"""
+    global _active_trace
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    _current_trace.set(None)
+    _active_trace = None
+    duration = time.perf_counter() - trace.started
+    _stats['traces'] += 1
+    slow = config.TRACE_SLOW_MS > 0 and duration * 1000 >= config.TRACE_SLOW_MS
+    if slow:
+        _stats['slow'] += 1
+    if slow or (config.TRACE_SAMPLE_RATE > 0 and random.random() < config.TRACE_SAMPLE_RATE):
+        write_trace(trace.to_dict(duration))
+        if slow:
+            logger.warning(f"Медленное обновление {trace.update.get('update_id')}: "
+                           f"{duration * 1000:.0f} мс, trace {trace.trace_id}")
+
+
+def write_trace(data, path=None):
+    path = path or config.TRACE_FILE
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > MAX_FILE_BYTES:
+            os.replace(path, f"{path}.1")
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False, default=str) + '\n')
+        _stats['written'] += 1
+    except OSError as e:
+        logger.error(f"Не удалось записать трассу: {e}")
+
+
+def setup_tracing(application, database=db):
+    """Подписывает трассы на SQL-запросы (начало и конец трассы – в middleware)"""
+    if record_statement not in database.statement_listeners:
+        database.statement_listeners.append(record_statement)
+
+
+def stats():
+    return dict(_stats)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Ограниченная очередь входящих обновлений с приоритетными полосами.
+
+Подтверждения (продажа, выплата, отгрузка) и действия админов обрабатываются
+первыми, просмотр каталога и остатков – последним. Приоритет действует только
+между чатами: обновления одного чата идут строго по порядку (от него зависит
+состояние ConversationHandler), а чат встаёт в полосу своего первого
+обновления. При переполнении очереди вебхук отвечает 429, и Telegram
+повторит доставку позже.
+"""
+
+import asyncio
+import collections
+import re
+import time
+
+from telegram import Update
+
+from config import config
+
+# Полосы в порядке убывания приоритета
+HIGH, NORMAL, LOW = 'high', 'normal', 'low'
+LANES = (HIGH, NORMAL, LOW)
+
+# Служебные объекты (например, сигнал остановки PTB) идут после всех полос
+SERVICE = None
+
+# Колбэки, которые меняют данные и которых ждёт пользователь
+HIGH_PRIORITY_CALLBACKS = re.compile(
+    r'^(confirm_sale|confirm_order|confirm_payment|final_confirm|restock_confirm'
+    r'|payment_confirm|payment_edit_confirm|payment_reject|confirm_restock'
+    r'|admin_order_ship_\d+|confirm_restore|seller_confirm|product_confirm)(:\w+)?$'
+)
+
+# Кнопки меню, которые только показывают данные
+BROWSING_TEXTS = {'📊 Остатки', '📋 Мои заявки', '📤 Отгруженные поставки'}
+
+
+def chat_key(update):
+    """Ключ, внутри которого сохраняется порядок обновлений"""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ('user', update.effective_user.id)
+    # Без чата порядок ни с чем не связан
+    return ('item', id(update))
+
+
+def classify_update(update):
+    """Определяет полосу для обновления"""
+    if not isinstance(update, Update):
+        # Сигнал остановки должен встать за уже принятыми обновлениями,
+        # иначе Application.stop() потеряет их
+        return SERVICE
+
+    user = update.effective_user
+    if user and user.id in config.ADMIN_IDS:
+        return HIGH
+
+    query = update.callback_query
+    if query:
+        if query.data and HIGH_PRIORITY_CALLBACKS.match(query.data):
+            return HIGH
+        # Остальные инлайн-кнопки продавца – листание каталога и списков
+        return LOW
+
+    message = update.message
+    if message and message.text in BROWSING_TEXTS:
+        return LOW
+    return NORMAL
+
+
+class LaneStats:
+    """Счётчики одной полосы"""
+
+    __slots__ = ('enqueued', 'dequeued', 'rejected', 'wait_total', 'wait_max')
+
+    def __init__(self):
+        self.enqueued = 0
+        self.dequeued = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class PriorityUpdateQueue(asyncio.Queue):
+    """
+    asyncio.Queue с очередью на каждый чат и полосами приоритета.
+    Полосы – FIFO чатов по полосе их первого обновления; get() отдаёт
+    первое обновление чата из самой приоритетной непустой полосы, и чат
+    встаёт в конец полосы своего следующего обновления.
+    """
+
+    def __init__(self, maxsize=0, low_lane_limit=None, classify=classify_update, key=chat_key):
+        self._classify = classify
+        self._key = key
+        self.low_lane_limit = low_lane_limit
+        self.lane_stats = {lane: LaneStats() for lane in LANES}
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._chats = {}                                            # ключ -> deque (время, полоса, элемент)
+        self._lanes = {lane: collections.deque() for lane in LANES}  # полоса -> deque ключей чатов
+        self._depth = dict.fromkeys(LANES, 0)
+        self._service = collections.deque()
+
+    def _put(self, item):
+        lane = self._classify(item)
+        if lane is SERVICE:
+            self._service.append(item)
+            return
+        key = self._key(item)
+        pending = self._chats.get(key)
+        if pending is None:
+            pending = self._chats[key] = collections.deque()
+            self._lanes[lane].append(key)
+        pending.append((time.monotonic(), lane, item))
+        self._depth[lane] += 1
+        self.lane_stats[lane].enqueued += 1
+
+    def _get(self):
+        for lane in LANES:
+            if self._lanes[lane]:
+                key = self._lanes[lane].popleft()
+                pending = self._chats[key]
+                enqueued_at, lane, item = pending.popleft()
+                if pending:
+                    self._lanes[pending[0][1]].append(key)
+                else:
+                    del self._chats[key]
+                self._depth[lane] -= 1
+                waited = time.monotonic() - enqueued_at
+                stats = self.lane_stats[lane]
+                stats.dequeued += 1
+                stats.wait_total += waited
+                stats.wait_max = max(stats.wait_max, waited)
+                return item
+        if self._service:
+            return self._service.popleft()
+        raise IndexError('pop from an empty PriorityUpdateQueue')
+
+    def qsize(self):
+        return sum(self._depth.values()) + len(self._service)
+
+    def empty(self):
+        return not self._service and not self._chats
+
+    def lane_depth(self, lane):
+        """Обновлений полосы в очереди"""
+        return self._depth[lane]
+
+    def offer(self, item):
+        """
+        Неблокирующая постановка в очередь для вебхука.
+        Возвращает False, если очередь (или полоса просмотра) переполнена.
+        """
+        lane = self._classify(item)
+        if lane == LOW and self.low_lane_limit and self._depth[LOW] >= self.low_lane_limit:
+            self.lane_stats[LOW].rejected += 1
+            return False
+        try:
+            self.put_nowait(item)
+        except asyncio.QueueFull:
+            if lane is not SERVICE:
+                self.lane_stats[lane].rejected += 1
+            return False
+        return True
+
+    def stats(self):
+        """Глубина и время ожидания по полосам"""
+        result = {'maxsize': self.maxsize, 'depth': self.qsize(), 'lanes': {}}
+        for lane in LANES:
+            stats = self.lane_stats[lane]
+            result['lanes'][lane] = {
+                'depth': self._depth[lane],
+                'enqueued': stats.enqueued,
+                'dequeued': stats.dequeued,
+                'rejected': stats.rejected,
+                'wait_avg_ms': round(stats.wait_total / stats.dequeued * 1000, 2) if stats.dequeued else 0.0,
+                'wait_max_ms': round(stats.wait_max * 1000, 2),
+            }
+        return result
+
+
+def create_update_queue():
+    """Создаёт очередь по настройкам из config"""
+    maxsize = config.UPDATE_QUEUE_MAXSIZE
+    return PriorityUpdateQueue(
+        maxsize=maxsize,
+        low_lane_limit=maxsize // 2 if maxsize > 0 else None
+    )